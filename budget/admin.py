@@ -1,6 +1,15 @@
-from django.contrib import admin
+import json
 
-from .models import Bank, Account, BankStatement, Transaction
+from django.contrib import admin, messages
+from django.db.models import Min
+from django.utils.html import format_html
+
+from .models import ArchivedTransaction, Bank, Account, BankStatement, Envelope, EnvelopeMonth, FxRate, RecurringSeries, Tag, Transaction, TransferLink, UserPreferences
+from .envelopes import refresh_all_envelopes
+from .fx import bump_fx_rates_version
+from .reparse import reparse_in_batches, stale_statements
+from .tags import free_bit
+from .versioning import bump_all_data_versions
 
 
 @admin.register(Bank)
@@ -22,11 +31,41 @@ class AccountAdmin(admin.ModelAdmin):
 
 @admin.register(BankStatement)
 class BankStatementAdmin(admin.ModelAdmin):
-    list_display = ("id", "user", "account", "source_type", "uploaded_at", "row_count", "parsed_ok")
+    list_display = ("id", "user", "account", "source_type", "uploaded_at", "row_count", "parsed_ok", "import_ms")
     list_filter = ("source_type", "parsed_ok", "account__bank")
     search_fields = ("account__name", "user__username", "user__email", "file_hash")
-    readonly_fields = ("uploaded_at",)
+    readonly_fields = ("uploaded_at", "import_metrics_display")
+    exclude = ("import_metrics",)
     autocomplete_fields = ("account", "user")
+    actions = ["reparse_stale"]
+
+    @admin.action(description="Re-import selected statements parsed with an old bank mapping")
+    def reparse_stale(self, request, queryset):
+        ids = list(stale_statements(queryset).values_list("id", flat=True))
+        if not ids:
+            self.message_user(request, "None of the selected statements are stale.", messages.INFO)
+            return
+        result = reparse_in_batches(ids)
+        self.message_user(
+            request,
+            f"Re-imported {result.statements} statement(s): {result.deleted} transaction(s) replaced by {result.created}.",
+            messages.SUCCESS,
+        )
+        if result.failed:
+            self.message_user(request, f"{len(result.failed)} statement(s) failed to parse.", messages.WARNING)
+
+    def import_ms(self, obj):
+        metrics = obj.import_metrics or {}
+        return (metrics.get("timings_ms") or {}).get("total")
+
+    import_ms.short_description = "Import (ms)"
+
+    def import_metrics_display(self, obj):
+        if not obj.import_metrics:
+            return "-"
+        return format_html("<pre>{}</pre>", json.dumps(obj.import_metrics, indent=2, sort_keys=True))
+
+    import_metrics_display.short_description = "Import metrics"
 
 
 @admin.register(Transaction)
@@ -41,3 +80,98 @@ class TransactionAdmin(admin.ModelAdmin):
         return (obj.description[:60] + "…") if len(obj.description) > 60 else obj.description
 
     short_description.short_description = "Description"
+
+
+@admin.register(ArchivedTransaction)
+class ArchivedTransactionAdmin(admin.ModelAdmin):
+    list_display = ("transaction_date", "account", "amount", "description", "statement", "is_transfer")
+    list_filter = ("is_transfer", "account__bank")
+    search_fields = ("description", "account__name", "user__email", "user__username")
+    raw_id_fields = ("account", "statement", "user")
+    date_hierarchy = "transaction_date"
+
+    def has_add_permission(self, request):
+        return False  # rows only arrive through manage.py archive_transactions
+
+
+@admin.register(FxRate)
+class FxRateAdmin(admin.ModelAdmin):
+    list_display = ("currency", "rate_date", "rate")
+    list_filter = ("currency",)
+    date_hierarchy = "rate_date"
+
+    def rates_changed(self, since):
+        # Every process rebuilds its cached rate table; converted reports and budgets changed for everyone
+        bump_fx_rates_version()
+        bump_all_data_versions()
+        refresh_all_envelopes(since)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.rates_changed(min(filter(None, (obj.rate_date, form.initial.get("rate_date")))))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.rates_changed(obj.rate_date)
+
+    def delete_queryset(self, request, queryset):
+        since = queryset.aggregate(since=Min("rate_date"))["since"]
+        super().delete_queryset(request, queryset)
+        self.rates_changed(since)
+
+
+@admin.register(UserPreferences)
+class UserPreferencesAdmin(admin.ModelAdmin):
+    list_display = ("user", "base_currency")
+    search_fields = ("user__username", "user__email")
+    autocomplete_fields = ("user",)
+
+
+@admin.register(RecurringSeries)
+class RecurringSeriesAdmin(admin.ModelAdmin):
+    list_display = ("sample_description", "user", "cadence", "typical_amount", "occurrences", "last_date", "next_expected_date", "confidence")
+    list_filter = ("cadence",)
+    search_fields = ("merchant_key", "sample_description", "user__username", "user__email")
+    autocomplete_fields = ("user", "account")
+
+
+@admin.register(TransferLink)
+class TransferLinkAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "outflow", "inflow", "amount", "day_gap", "created_at")
+    search_fields = ("user__username", "user__email", "outflow__description", "inflow__description")
+    raw_id_fields = ("outflow", "inflow")
+    autocomplete_fields = ("user",)
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ("name", "user", "bit", "created_at")
+    search_fields = ("name", "user__username", "user__email")
+    readonly_fields = ("bit", "created_at")
+    autocomplete_fields = ("user",)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.bit = free_bit(obj.user_id)
+        super().save_model(request, obj, form, change)
+
+
+class EnvelopeMonthInline(admin.TabularInline):
+    model = EnvelopeMonth
+    extra = 0
+    fields = ("month", "actual", "overspent_at", "updated_at")
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Envelope)
+class EnvelopeAdmin(admin.ModelAdmin):
+    list_display = ("name", "user", "tag", "account_type", "monthly_limit", "currency", "updated_at")
+    list_filter = ("account_type",)
+    search_fields = ("name", "user__username", "user__email")
+    readonly_fields = ("created_at", "updated_at")
+    autocomplete_fields = ("user", "tag")
+    inlines = [EnvelopeMonthInline]
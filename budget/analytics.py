@@ -0,0 +1,110 @@
+"""
+Vectorized aggregates over a user's columnar snapshot (budget.snapshot).
+
+Everything here works on whole NumPy columns: masks for filtering, np.unique/np.bincount
+for grouping. FX conversion looks up one factor per distinct (currency, day), not per row.
+"""
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .fx import FxTable
+from .snapshot import Snapshot
+
+
+_EPOCH = date(1970, 1, 1).toordinal()
+PERIODS = {"month": "datetime64[M]", "year": "datetime64[Y]"}
+
+
+def row_mask(
+    snapshot: Snapshot,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    account: Optional[int] = None,
+    include_transfers: bool = False,
+) -> np.ndarray:
+    cols = snapshot.columns
+    mask = np.ones(len(snapshot), dtype=bool)
+    if start:
+        mask &= cols["date"] >= start.toordinal()
+    if end:
+        mask &= cols["date"] <= end.toordinal()
+    if account is not None:
+        mask &= cols["account"] == account
+    if not include_transfers:
+        mask &= ~cols["transfer"]
+    return mask
+
+
+def converted_amounts(
+    snapshot: Snapshot, mask: np.ndarray, base: str, account_currency: Dict[int, str], table: FxTable
+) -> np.ndarray:
+    """
+    Amounts of the selected rows in `base` (float64, major units), at each row's as-of rate.
+    Raises FxRateMissing like FxTable.factor.
+    """
+    dates = snapshot.columns["date"][mask]
+    accounts = snapshot.columns["account"][mask]
+    amounts = snapshot.columns["cents"][mask] / 100.0
+
+    by_currency: Dict[str, List[int]] = {}
+    for account_id, currency in account_currency.items():
+        if currency.upper() != base:
+            by_currency.setdefault(currency.upper(), []).append(account_id)
+
+    for currency, account_ids in by_currency.items():
+        selected = np.isin(accounts, account_ids)
+        if not selected.any():
+            continue
+        days, inverse = np.unique(dates[selected], return_inverse=True)
+        factors = np.array([float(table.factor(currency, base, int(day))) for day in days])
+        amounts[selected] *= factors[inverse]
+    return amounts
+
+
+def totals(amounts: np.ndarray) -> dict:
+    return {
+        "income": float(amounts[amounts > 0].sum()),
+        "expense": float(amounts[amounts < 0].sum()),
+        "count": int(amounts.size),
+    }
+
+
+def by_period(amounts: np.ndarray, dates: np.ndarray, period: str = "month") -> List[dict]:
+    """
+    Income / expense / count per calendar month or year, oldest first.
+    """
+    days = (dates.astype(np.int64) - _EPOCH).astype("datetime64[D]")
+    keys, inverse = np.unique(days.astype(PERIODS[period]), return_inverse=True)
+    income = np.bincount(inverse, weights=np.where(amounts > 0, amounts, 0.0), minlength=len(keys))
+    expense = np.bincount(inverse, weights=np.where(amounts < 0, amounts, 0.0), minlength=len(keys))
+    counts = np.bincount(inverse, minlength=len(keys))
+    labels = np.datetime_as_string(keys)
+    return [
+        {"period": str(labels[i]), "income": float(income[i]), "expense": float(expense[i]), "count": int(counts[i])}
+        for i in range(len(keys))
+    ]
+
+
+def spend_percentiles(amounts: np.ndarray, percentiles: Sequence[int] = (50, 90, 99)) -> Dict[str, float]:
+    spend = -amounts[amounts < 0]
+    if not spend.size:
+        return {}
+    values = np.percentile(spend, percentiles)
+    return {f"p{p}": float(v) for p, v in zip(percentiles, values)}
+
+
+def top_merchants(amounts: np.ndarray, merchant_ids: np.ndarray, names: List[str], limit: int = 10) -> List[dict]:
+    """
+    Merchants by total spend (outflows only), largest first.
+    """
+    outflow = amounts < 0
+    spend = np.bincount(merchant_ids[outflow], weights=-amounts[outflow], minlength=len(names))
+    counts = np.bincount(merchant_ids[outflow], minlength=len(names))
+    order = np.argsort(spend, kind="stable")[::-1][:limit]
+    return [
+        {"merchant": names[i] or "(unknown)", "spend": float(spend[i]), "count": int(counts[i])}
+        for i in order
+        if spend[i] > 0
+    ]
@@ -0,0 +1,325 @@
+import base64
+import hashlib
+import heapq
+from datetime import date
+from decimal import Decimal
+from functools import wraps
+from itertools import islice
+
+from django.contrib.auth.decorators import login_required
+from django.db.models import Count, Q, Sum
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition, require_GET
+
+from .archive import transaction_sources
+from .fx import FxRateMissing, base_currency_for, get_fx_table
+from .models import Account
+from .tags import TagError, filter_by_tags, mask_for, tag_bits, tag_names
+from .transfers import exclude_transfers
+from .versioning import get_data_version
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _data_version(request):
+    """
+    One lookup per request, shared by the ETag and Last-Modified callbacks.
+    """
+    if not hasattr(request, "_data_version"):
+        request._data_version = get_data_version(request.user.pk)
+    return request._data_version
+
+
+def _etag(request, *args, **kwargs):
+    version, _ = _data_version(request)
+    # Same data version but different filters must not share a validator
+    query = hashlib.sha1(request.get_full_path().encode()).hexdigest()[:12]
+    return f"{version}-{query}"
+
+
+def _last_modified(request, *args, **kwargs):
+    return _data_version(request)[1]
+
+
+def versioned_json(view):
+    """
+    login_required + conditional GET keyed on the user's DataVersion: an unchanged poll
+    gets a 304 after that single lookup, without running the view's queries.
+    Errors carry no validators, so a client never revalidates (and keeps) a 400.
+    """
+    @condition(etag_func=_etag, last_modified_func=_last_modified)
+    def conditional(request, *args, **kwargs):
+        try:
+            response = view(request, *args, **kwargs)
+        except BadRequest as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ["Cookie"])
+        return response
+
+    @wraps(view)
+    @login_required
+    @require_GET
+    def wrapper(request, *args, **kwargs):
+        response = conditional(request, *args, **kwargs)
+        if response.status_code >= 400:
+            del response["ETag"]
+            del response["Last-Modified"]
+        return response
+
+    return wrapper
+
+
+def _parse_date(value, name):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be YYYY-MM-DD.")
+
+
+def _filtered(request):
+    """
+    Querysets with the requested transactions: the hot table, plus the archive when the
+    date range reaches it (budget.archive). Both take the same filters and field names.
+    """
+    start = _parse_date(request.GET.get("start"), "start")
+    end = _parse_date(request.GET.get("end"), "end")
+    filters = {"user_id": request.user.pk}
+    account = _account_param(request)
+    if account is not None:
+        filters["account_id"] = account
+    sources = transaction_sources(start, end, **filters)
+
+    # ?tags=a,b&not_tags=c&any_tags=d,e -> one bitwise comparison on tags_mask
+    params = {key: _list_param(request, key) for key in ("tags", "not_tags", "any_tags")}
+    if any(params.values()):
+        bits = _tag_bits(request)
+        try:
+            masks = {
+                "all_of": mask_for(bits, params["tags"]),
+                "none_of": mask_for(bits, (name for name in params["not_tags"] if name in bits)),
+                "any_of": mask_for(bits, params["any_tags"]),
+            }
+        except TagError as e:
+            raise BadRequest(str(e))
+        sources = [filter_by_tags(qs, **masks) for qs in sources]
+    return sources
+
+
+def _list_param(request, name):
+    return [part.strip() for part in request.GET.get(name, "").split(",") if part.strip()]
+
+
+def _tag_bits(request):
+    if not hasattr(request, "_tag_bits"):
+        request._tag_bits = tag_bits(request.user.pk)
+    return request._tag_bits
+
+
+def _account_param(request):
+    account = request.GET.get("account")
+    if not account:
+        return None
+    if not account.isdigit():
+        raise BadRequest("account must be an id.")
+    return int(account)
+
+
+def _base_currency(request) -> str:
+    base = (request.GET.get("currency") or base_currency_for(request.user)).upper()
+    if len(base) != 3 or not base.isalpha():
+        raise BadRequest("currency must be a 3-letter code.")
+    return base
+
+
+def _money(value) -> str:
+    return f"{Decimal(value or 0):.2f}"
+
+
+def _encode_cursor(txn_date: date, pk: int) -> str:
+    return base64.urlsafe_b64encode(f"{txn_date.isoformat()}|{pk}".encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        txn_date, pk = raw.split("|")
+        return date.fromisoformat(txn_date), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise BadRequest("Invalid cursor.")
+
+
+@versioned_json
+def transactions_api(request):
+    """
+    GET ?start=&end=&account=&tags=&not_tags=&any_tags=&limit=&cursor=
+    Newest first, keyset (cursor) paginated on (transaction_date, id).
+    Tag filters take comma-separated tag names: all of `tags`, none of `not_tags`, and at
+    least one of `any_tags`.
+    """
+    try:
+        limit = min(int(request.GET.get("limit") or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+    except ValueError:
+        raise BadRequest("limit must be a number.")
+    limit = max(limit, 1)
+
+    sources = _filtered(request)
+    cursor = request.GET.get("cursor")
+    if cursor:
+        c_date, c_pk = _decode_cursor(cursor)
+        after = Q(transaction_date__lt=c_date) | Q(transaction_date=c_date, pk__lt=c_pk)
+        sources = [qs.filter(after) for qs in sources]
+
+    fields = (
+        "id", "transaction_date", "account_id", "statement_id", "description", "amount", "account__currency",
+        "balance", "raw_reference", "tags_mask",
+    )
+    # Each source returns its own first page; merging them in key order gives the page of the union
+    pages = [qs.order_by("-transaction_date", "-id").values_list(*fields)[: limit + 1] for qs in sources]
+    rows = list(islice(heapq.merge(*pages, key=lambda row: (row[1], row[0]), reverse=True), limit + 1))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1][1], rows[-1][0])
+
+    bits = _tag_bits(request) if any(row[-1] for row in rows) else {}
+
+    results = [
+        {
+            "id": pk,
+            "date": txn_date.isoformat(),
+            "account": account_id,
+            "statement": statement_id,
+            "description": description,
+            "amount": str(amount),
+            "currency": currency,
+            "balance": None if balance is None else str(balance),
+            "reference": reference,
+            "tags": tag_names(tags_mask, bits) if tags_mask else [],
+        }
+        for pk, txn_date, account_id, statement_id, description, amount, currency, balance, reference, tags_mask in rows
+    ]
+    return JsonResponse({"results": results, "next_cursor": next_cursor})
+
+
+@versioned_json
+def monthly_summary_api(request):
+    """
+    GET ?start=&end=&account=&tags=&not_tags=&any_tags=&currency=&transfers=include
+    Income / expense / net / count per calendar month, converted into `currency`
+    (default: the user's base currency) at each transaction date's FX rate.
+    Matched transfers between the user's own accounts are left out unless transfers=include.
+    """
+    base = _base_currency(request)
+
+    # One row per (day, currency): conversion happens in Python on this small result,
+    # with as-of rates from the in-process FX table (no per-row lookups).
+    sources = _filtered(request)
+    if request.GET.get("transfers") != "include":
+        sources = [exclude_transfers(qs) for qs in sources]
+    daily = [
+        qs
+        .values("transaction_date", "account__currency")
+        .annotate(
+            income=Sum("amount", filter=Q(amount__gt=0)),
+            expense=Sum("amount", filter=Q(amount__lt=0)),
+            count=Count("id"),
+        )
+        .order_by("transaction_date")
+        .values_list("transaction_date", "account__currency", "income", "expense", "count")
+        for qs in sources
+    ]
+    rows = heapq.merge(*daily, key=lambda row: row[0])
+
+    convert = get_fx_table().converter(base)
+    months = {}
+    try:
+        for txn_date, currency, income, expense, count in rows:
+            month = months.setdefault(txn_date.strftime("%Y-%m"), [Decimal(0), Decimal(0), 0])
+            month[0] += convert(income or 0, currency, txn_date)
+            month[1] += convert(expense or 0, currency, txn_date)
+            month[2] += count
+    except FxRateMissing as e:
+        raise BadRequest(str(e))
+
+    results = [
+        {
+            "month": month,
+            "income": _money(income),
+            "expense": _money(expense),
+            "net": _money(income + expense),
+            "count": count,
+        }
+        for month, (income, expense, count) in months.items()
+    ]
+    return JsonResponse({"currency": base, "results": results})
+
+
+@versioned_json
+def analytics_api(request):
+    """
+    GET ?start=&end=&account=&currency=&period=month|year&merchants=&transfers=include
+    Long-range aggregates computed with NumPy over the user's memory-mapped columnar
+    snapshot (budget.snapshot) instead of the ORM: totals, per-period trend, spend
+    percentiles and top merchants, converted into `currency` like the monthly summary.
+    """
+    # NumPy is only imported by processes that serve analytics (or preload it)
+    from . import analytics
+    from .snapshot import current_snapshot
+
+    base = _base_currency(request)
+    start = _parse_date(request.GET.get("start"), "start")
+    end = _parse_date(request.GET.get("end"), "end")
+    account = _account_param(request)
+    period = request.GET.get("period") or "month"
+    if period not in analytics.PERIODS:
+        raise BadRequest("period must be month or year.")
+    try:
+        merchant_limit = min(max(int(request.GET.get("merchants") or 10), 0), 100)
+    except ValueError:
+        raise BadRequest("merchants must be a number.")
+
+    snapshot = current_snapshot(request.user.pk, _data_version(request)[0])
+    mask = analytics.row_mask(snapshot, start, end, account, request.GET.get("transfers") == "include")
+    currencies = dict(Account.objects.filter(user=request.user).values_list("pk", "currency"))
+    try:
+        amounts = analytics.converted_amounts(snapshot, mask, base, currencies, get_fx_table())
+    except FxRateMissing as e:
+        raise BadRequest(str(e))
+
+    total = analytics.totals(amounts)
+    trend = analytics.by_period(amounts, snapshot.columns["date"][mask], period)
+    merchants = analytics.top_merchants(amounts, snapshot.columns["merchant"][mask], snapshot.merchants, merchant_limit)
+    return JsonResponse(
+        {
+            "currency": base,
+            "totals": {
+                "income": _money(total["income"]),
+                "expense": _money(total["expense"]),
+                "net": _money(total["income"] + total["expense"]),
+                "count": total["count"],
+            },
+            "periods": [
+                {
+                    "period": p["period"],
+                    "income": _money(p["income"]),
+                    "expense": _money(p["expense"]),
+                    "net": _money(p["income"] + p["expense"]),
+                    "count": p["count"],
+                }
+                for p in trend
+            ],
+            "spend_percentiles": {k: _money(v) for k, v in analytics.spend_percentiles(amounts).items()},
+            "top_merchants": [{**m, "spend": _money(m["spend"])} for m in merchants],
+        }
+    )
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class BudgetConfig(AppConfig):
     name = 'budget'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
@@ -0,0 +1,154 @@
+"""
+Yearly archival of cold transactions (manage.py archive_transactions).
+
+Whole years of a user's Transactions that end before the last ARCHIVE_KEEP_MONTHS are moved
+into ArchivedTransaction, so the hot table and its indexes stay sized to recent data. Rows
+keep their ids, amounts, tags and transfer status, so any rollup over both tables is the same
+as before the move. Readers call transaction_sources(): the hot rows for a date range, plus
+the archived rows only when the range actually reaches some.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction as db_transaction
+from django.db.models import Exists, OuterRef, Q, QuerySet
+
+from .coverage import transactions_between
+from .models import ArchivedTransaction, Transaction, TransferLink
+
+
+COLUMNS = (
+    "id", "user_id", "account_id", "statement_id", "transaction_date", "description", "amount", "balance",
+    "raw_reference", "merchant_key", "tags_mask",
+)
+
+
+@dataclass
+class ArchiveResult:
+    users: int = 0
+    moved: int = 0
+
+
+def keep_months() -> int:
+    return getattr(settings, "ARCHIVE_KEEP_MONTHS", 13)
+
+
+def default_through_year(today: Optional[date] = None) -> int:
+    """
+    Last calendar year that ends before the kept window of ARCHIVE_KEEP_MONTHS.
+    """
+    today = today or date.today()
+    window_start = today.year * 12 + today.month - 1 - keep_months()
+    return window_start // 12 - 1
+
+
+def users_with_transactions() -> QuerySet:
+    """
+    Ids of the users with any transactions, hot or archived (one query).
+    """
+    return get_user_model().objects.filter(
+        Q(pk__in=Transaction.objects.values("user_id")) | Q(pk__in=ArchivedTransaction.objects.values("user_id"))
+    ).values_list("pk", flat=True)
+
+
+def archived_between(start: Optional[date] = None, end: Optional[date] = None, **filters) -> QuerySet:
+    """
+    ArchivedTransaction counterpart of budget.coverage.transactions_between (same filters).
+    """
+    qs = ArchivedTransaction.objects.filter(**filters)
+    if start:
+        qs = qs.filter(transaction_date__gte=start)
+    if end:
+        qs = qs.filter(transaction_date__lte=end)
+    return qs
+
+
+def transaction_sources(start: Optional[date] = None, end: Optional[date] = None, **filters) -> List[QuerySet]:
+    """
+    Querysets holding the transactions in [start, end]: the hot table, then the archive if it
+    has rows in the range (one indexed EXISTS). Both expose the same field names, so callers
+    apply the same filters/aggregates to each and combine the results.
+    """
+    sources = [transactions_between(start, end, **filters)]
+    archived = archived_between(start, end, **filters)
+    if archived.exists():
+        sources.append(archived)
+    return sources
+
+
+def archivable(user_id: int, before: date) -> QuerySet:
+    """
+    The user's rows dated before `before`, except transfers whose other side is newer: a
+    TransferLink can only point at hot rows, so such pairs stay hot together.
+    """
+    return (
+        Transaction.objects.filter(user_id=user_id, transaction_date__lt=before)
+        .exclude(transfer_out__inflow__transaction_date__gte=before)
+        .exclude(transfer_in__outflow__transaction_date__gte=before)
+    )
+
+
+def archive_user(user_id: int, through_year: int) -> int:
+    """
+    Moves the user's archivable rows dated up to the end of through_year, set-based and in
+    one DB transaction: INSERT ... SELECT into the archive, then delete their TransferLinks
+    and the hot rows. Returns the number of rows moved.
+    """
+    before = date(through_year + 1, 1, 1)
+    linked = TransferLink.objects.filter(Q(outflow_id=OuterRef("pk")) | Q(inflow_id=OuterRef("pk")))
+    rows = archivable(user_id, before).order_by().values(*COLUMNS, transfer=Exists(linked))
+    compiler = rows.query.get_compiler(connection=connection)
+    select_sql, params = compiler.as_sql()
+    # INSERT ... SELECT matches columns by position: check the SELECT's order, never assume it
+    selected = tuple(alias or expr.target.attname for expr, _, alias in compiler.select)
+    if selected != (*COLUMNS, "transfer"):
+        raise RuntimeError(f"Unexpected archive SELECT column order: {selected}")
+
+    ops = connection.ops
+    archive_table = ops.quote_name(ArchivedTransaction._meta.db_table)
+    columns = ", ".join(
+        ops.quote_name(ArchivedTransaction._meta.get_field(name).column) for name in (*COLUMNS, "is_transfer")
+    )
+    archived = ArchivedTransaction.objects.filter(user_id=user_id, transaction_date__lt=before).values("id")
+    archived_sql, archived_params = archived.query.sql_with_params()
+    hot_table = ops.quote_name(Transaction._meta.db_table)
+    with db_transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {archive_table} ({columns}) {select_sql}", params)
+            moved = cursor.rowcount
+            if moved:
+                TransferLink.objects.filter(Q(outflow_id__in=archived) | Q(inflow_id__in=archived)).delete()
+                # Nothing else references a Transaction, so no cascade to collect
+                cursor.execute(
+                    f"DELETE FROM {hot_table} WHERE {ops.quote_name('user_id')} = %s "
+                    f"AND {ops.quote_name('id')} IN ({archived_sql})",
+                    (user_id, *archived_params),
+                )
+    # Nothing a report shows changes (same rows, same totals), so the DataVersion stays put
+    return moved
+
+
+def archive_transactions(through_year: int, user_ids: Optional[Iterable[int]] = None, progress=None) -> ArchiveResult:
+    """
+    Archives every user's (or just user_ids') transactions dated up to the end of
+    through_year. `progress(user_id, moved)` is called per user.
+    """
+    before = date(through_year + 1, 1, 1)
+    if user_ids is None:
+        user_ids = (
+            Transaction.objects.filter(transaction_date__lt=before)
+            .order_by("user_id")
+            .values_list("user_id", flat=True)
+            .distinct()
+        )
+    result = ArchiveResult()
+    for user_id in list(user_ids):
+        moved = archive_user(user_id, through_year)
+        result.users += 1
+        result.moved += moved
+        if progress:
+            progress(user_id, moved)
+    return result
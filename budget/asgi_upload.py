@@ -0,0 +1,241 @@
+"""
+Streaming statement upload for ASGI deployments.
+
+Django's ASGI handler spools the whole request body before any view runs, so this is a
+small ASGI app mounted in front of it (see project/asgi.py). It authenticates from the
+session cookie, rejects duplicates before reading the body when the client sends
+X-Content-SHA256, streams the body to a temp file while hashing it (disk writes batched
+onto a thread), and hands parsing to a bounded thread pool so the event loop only ever
+waits on I/O.
+
+    POST /budget/upload/stream/?account=<id>&filename=<name.csv|.ofx|.qfx|.pdf>
+    Content-Type: application/octet-stream
+    X-Content-SHA256: <hex>   (optional, enables the early duplicate check)
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.files import File
+from django.db import IntegrityError, close_old_connections
+
+from .importers import import_statement
+from .models import Account, BankStatement
+
+
+MAX_BYTES_DEFAULT = 50 * 1024 * 1024
+# Body chunks are buffered up to this size, then written to the spool file off the event loop
+SPOOL_WRITE_BYTES = 256 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _load_user(session_key: str):
+    """
+    Session cookie -> user, with the same auth-hash checks as AuthenticationMiddleware.
+    """
+    engine = import_module(settings.SESSION_ENGINE)
+    request = SimpleNamespace(session=engine.SessionStore(session_key))
+    return get_user(request)
+
+
+def _store_and_import(user_id: int, account: Account, tmp_path: str, filename: str, file_hash: str) -> dict:
+    """
+    Runs in the import pool: saves the spooled file as a BankStatement and parses it.
+    """
+    close_old_connections()
+    try:
+        source_type = BankStatement.source_type_for(filename)
+        with open(tmp_path, "rb") as f:
+            try:
+                stmt = BankStatement.objects.create(
+                    user_id=user_id,
+                    account=account,
+                    source_file=File(f, name=filename),
+                    source_type=source_type,
+                    file_hash=file_hash,
+                )
+            except IntegrityError:
+                raise UploadError(409, "This statement was already uploaded to this account.")
+
+        if source_type == BankStatement.SOURCE_PDF:
+            return {"statement_id": stmt.pk, "created": 0, "errors": []}
+
+        created_count, errors = import_statement(stmt)
+        return {"statement_id": stmt.pk, "created": created_count, "errors": errors}
+    finally:
+        close_old_connections()
+
+
+class StreamingStatementUpload:
+    """
+    ASGI wrapper: handles POSTs to `path` itself and passes everything else to `app`.
+    """
+
+    def __init__(self, app, path: str = "/budget/upload/stream/"):
+        self.app = app
+        self.path = path
+        self.max_bytes = int(getattr(settings, "STATEMENT_UPLOAD_MAX_BYTES", MAX_BYTES_DEFAULT))
+        workers = int(getattr(settings, "STATEMENT_IMPORT_WORKERS", 4))
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="statement-import")
+        # Bounds queued + running imports; further uploads wait here (after spooling) instead
+        # of piling unbounded work onto the pool.
+        self._slots = None
+        self._slot_count = workers * 4
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            return await self.app(scope, receive, send)
+
+        try:
+            if scope["method"] != "POST":
+                raise UploadError(405, "POST only.")
+            status, payload = await self.handle(scope, receive)
+        except UploadError as e:
+            status, payload = e.status, {"error": e.message}
+        except Exception:
+            logger.exception("Streaming statement upload failed")
+            status, payload = 500, {"error": "The upload could not be processed."}
+        await self._respond(send, status, payload)
+
+    async def handle(self, scope, receive):
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        query = parse_qs(scope.get("query_string", b"").decode())
+
+        # Browsers can't send application/octet-stream cross-site without a CORS preflight,
+        # which this endpoint never grants; that is what keeps the cookie auth CSRF-safe.
+        if headers.get("content-type", "").split(";")[0].strip() != "application/octet-stream":
+            raise UploadError(415, "Send the file as application/octet-stream.")
+        length = headers.get("content-length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            raise UploadError(413, "File too large.")
+
+        filename = os.path.basename((query.get("filename") or [""])[0])
+        ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+        if ext not in ("csv", "ofx", "qfx", "pdf"):
+            raise UploadError(400, "filename must end in .csv, .ofx, .qfx or .pdf.")
+
+        user = await self._authenticate(headers)
+        account = await self._account(user, (query.get("account") or [""])[0])
+
+        claimed = headers.get("x-content-sha256", "").strip().lower()
+        if claimed and await self._is_duplicate(user, account, claimed):
+            raise UploadError(409, "This statement was already uploaded to this account.")
+
+        tmp_path, file_hash = await self._spool(receive)
+        try:
+            if claimed and claimed != file_hash:
+                raise UploadError(400, "X-Content-SHA256 does not match the uploaded body.")
+            if not claimed and await self._is_duplicate(user, account, file_hash):
+                raise UploadError(409, "This statement was already uploaded to this account.")
+
+            if self._slots is None:
+                self._slots = asyncio.Semaphore(self._slot_count)
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(
+                    self.pool, _store_and_import, user.pk, account, tmp_path, filename, file_hash
+                )
+            return 201, result
+        finally:
+            os.remove(tmp_path)
+
+    async def _authenticate(self, headers):
+        cookies = {}
+        for part in headers.get("cookie", "").split(";"):
+            key, _, value = part.strip().partition("=")
+            cookies[key] = value
+        session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+        if not session_key:
+            raise UploadError(401, "Login required.")
+        user = await sync_to_async(_load_user)(session_key)
+        if not user.is_authenticated:
+            raise UploadError(401, "Login required.")
+        return user
+
+    async def _account(self, user, account_id: str) -> Account:
+        if not account_id.isdigit():
+            raise UploadError(400, "account is required.")
+        account = await (
+            Account.objects.select_related("bank")
+            .filter(pk=int(account_id), user_id=user.pk, is_active=True)
+            .afirst()
+        )
+        if account is None:
+            raise UploadError(404, "Account not found.")
+        return account
+
+    async def _is_duplicate(self, user, account, file_hash: str) -> bool:
+        return await BankStatement.objects.filter(
+            user_id=user.pk, account_id=account.pk, file_hash=file_hash
+        ).aexists()
+
+    async def _spool(self, receive):
+        """
+        Writes the body to a temp file, hashing as it goes. Chunks are gathered into
+        SPOOL_WRITE_BYTES batches and written on the default executor, so a slow disk
+        holds up this upload only, not every connection on the loop.
+        """
+        h = hashlib.sha256()
+        size = 0
+        pending, pending_size = [], 0
+        loop = asyncio.get_running_loop()
+        fd, tmp_path = tempfile.mkstemp(prefix="statement-", dir=getattr(settings, "FILE_UPLOAD_TEMP_DIR", None))
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    message = await receive()
+                    if message["type"] == "http.disconnect":
+                        raise UploadError(400, "Client disconnected.")
+                    chunk = message.get("body", b"")
+                    more = message.get("more_body", False)
+                    if chunk:
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise UploadError(413, "File too large.")
+                        h.update(chunk)
+                        pending.append(chunk)
+                        pending_size += len(chunk)
+                    if pending and (pending_size >= SPOOL_WRITE_BYTES or not more):
+                        await loop.run_in_executor(None, out.write, b"".join(pending))
+                        pending, pending_size = [], 0
+                    if not more:
+                        break
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        if not size:
+            os.remove(tmp_path)
+            raise UploadError(400, "Empty upload.")
+        return tmp_path, h.hexdigest()
+
+    async def _respond(self, send, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,90 @@
+"""
+Statement date ranges: pruning for date-range queries and per-account coverage gaps.
+
+Every parsed statement records the span of its transactions (statement_start_date /
+statement_end_date, widened to the period the file states). A date-range query first
+selects the statements overlapping the range from the small, indexed statement table and
+only then touches Transaction, by statement_id. Statements without a range (never parsed,
+or uploaded before ranges were recorded and not yet backfilled) are always kept, so pruning
+never hides rows.
+"""
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import List, Optional
+
+from django.db.models import Q, QuerySet
+
+from .models import BankStatement, Transaction
+
+
+def overlapping_statements(start: Optional[date] = None, end: Optional[date] = None, **filters) -> QuerySet:
+    """
+    Statements whose range overlaps [start, end] (either end open), plus unranged ones.
+    `filters` narrow the statements, e.g. user_id=..., account_id=..., user_id__in=[...].
+    """
+    qs = BankStatement.objects.filter(**filters)
+    overlap = Q()
+    if start:
+        overlap &= Q(statement_end_date__gte=start)
+    if end:
+        overlap &= Q(statement_start_date__lte=end)
+    if overlap:
+        qs = qs.filter(overlap | Q(statement_start_date__isnull=True) | Q(statement_end_date__isnull=True))
+    return qs
+
+
+def transactions_between(start: Optional[date] = None, end: Optional[date] = None, **filters) -> QuerySet:
+    """
+    Transactions dated within [start, end], read only from overlapping statements.
+    `filters` are on fields both models have (user_id, account_id, user_id__in, ...). The
+    statements are an IN subquery on statement_id, so this stays one query however many
+    statements overlap.
+    """
+    qs = Transaction.objects.filter(**filters)
+    if start or end:
+        qs = qs.filter(statement_id__in=overlapping_statements(start, end, **filters).values("pk"))
+    if start:
+        qs = qs.filter(transaction_date__gte=start)
+    if end:
+        qs = qs.filter(transaction_date__lte=end)
+    return qs
+
+
+@dataclass
+class AccountCoverage:
+    account_id: int
+    account_name: str
+    statements: int = 0
+    unranged: int = 0  # statements without a recorded range (not counted as coverage)
+    first: Optional[date] = None
+    last: Optional[date] = None
+    gaps: List[tuple] = field(default_factory=list)  # (first missing day, last missing day, days)
+
+
+def coverage_by_account(user_id: int) -> List[AccountCoverage]:
+    """
+    Per account: covered span and the gaps between its statements' date ranges. One query
+    over BankStatement, ordered by start date; overlapping or adjacent statements merge.
+    """
+    rows = (
+        BankStatement.objects.filter(user_id=user_id)
+        .order_by("account__name", "account_id", "statement_start_date", "statement_end_date")
+        .values_list("account_id", "account__name", "statement_start_date", "statement_end_date")
+    )
+    accounts = {}
+    for account_id, name, start, end in rows:
+        cov = accounts.get(account_id)
+        if cov is None:
+            cov = accounts[account_id] = AccountCoverage(account_id, name)
+        cov.statements += 1
+        if start is None or end is None:
+            cov.unranged += 1
+            continue
+        if cov.last is None:
+            cov.first, cov.last = start, end
+            continue
+        if start > cov.last + timedelta(days=1):
+            missing_from, missing_to = cov.last + timedelta(days=1), start - timedelta(days=1)
+            cov.gaps.append((missing_from, missing_to, (missing_to - missing_from).days + 1))
+        cov.last = max(cov.last, end)
+    return list(accounts.values())
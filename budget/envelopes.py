@@ -0,0 +1,291 @@
+"""
+Monthly budget envelopes.
+
+Each Envelope keeps its actual spend per month in EnvelopeMonth. Imports do not recompute it:
+apply_import() adds the new rows' outflows and subtracts the old rows that transfer matching
+just linked, with one UPDATE per touched (envelope, month). The overspend check then reads back
+only the touched months. Anything else that moves totals (a deleted or re-parsed statement,
+edited tags, an envelope's scope or an account's type) calls refresh_envelopes(), which
+recomputes from the transactions, archived years included; so do an account's currency
+change and reloaded FX rates (refresh_all_envelopes), which change conversions.
+
+Spend is the outflows (amount < 0) that are not transfers, converted into the envelope's
+currency at each row's as-of rate. Refunds do not reduce it.
+"""
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction as db_transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .archive import transaction_sources
+from .fx import FxRateMissing, get_fx_table
+from .models import Account, Envelope, EnvelopeMonth, Transaction, TransferLink
+from .transfers import exclude_transfers
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def matches(envelope: Envelope, account_type: str, tags_mask: int) -> bool:
+    if envelope.account_type and envelope.account_type != account_type:
+        return False
+    if envelope.tag_id and not tags_mask & envelope.tag.mask:
+        return False
+    return True
+
+
+def _add_spend(
+    deltas: Dict[Tuple[int, date], Decimal],
+    envelopes: List[Envelope],
+    converters: dict,
+    rows: Iterable[Tuple[str, str, date, Decimal, int]],
+    sign: int,
+    warnings: List[str],
+) -> None:
+    """
+    Adds sign * spend of each (account_type, currency, date, amount, tags_mask) outflow to the
+    (envelope_id, month) totals of the envelopes it falls in.
+    """
+    table = get_fx_table()
+    for account_type, currency, day, amount, tags_mask in rows:
+        if amount >= 0:
+            continue
+        for envelope in envelopes:
+            if not matches(envelope, account_type, tags_mask):
+                continue
+            convert = converters.get(envelope.currency) or converters.setdefault(
+                envelope.currency, table.converter(envelope.currency)
+            )
+            try:
+                spend = convert(-amount, currency, day)
+            except FxRateMissing as e:
+                if str(e) not in warnings:
+                    warnings.append(str(e))
+                continue
+            key = (envelope.pk, month_start(day))
+            deltas[key] = deltas.get(key, Decimal(0)) + sign * spend
+
+
+def last_transfer_link(user_id: int) -> int:
+    """
+    Highest TransferLink id of the user; apply_import() treats later links as new.
+    """
+    return TransferLink.objects.filter(user_id=user_id).order_by("-pk").values_list("pk", flat=True).first() or 0
+
+
+def apply_import(user_id: int, transactions: List[Transaction], links_after: int) -> List[str]:
+    """
+    Delta update after an import: adds the new rows' spend, subtracts the spend of older rows
+    that became one side of a transfer (links with id > links_after), then runs the overspend
+    check. Returns warnings for months that just went over their limit.
+    """
+    envelopes = list(Envelope.objects.filter(user_id=user_id).select_related("tag"))
+    if not envelopes or not transactions:
+        return []
+    accounts = {
+        pk: (account_type, currency)
+        for pk, account_type, currency in Account.objects.filter(user_id=user_id).values_list(
+            "pk", "account_type", "currency"
+        )
+    }
+
+    linked = set()
+    for outflow_id, inflow_id in TransferLink.objects.filter(user_id=user_id, pk__gt=links_after).values_list(
+        "outflow_id", "inflow_id"
+    ):
+        linked.update((outflow_id, inflow_id))
+    new_ids = {t.pk for t in transactions}
+
+    warnings: List[str] = []
+    deltas: Dict[Tuple[int, date], Decimal] = {}
+    converters = {}
+    _add_spend(
+        deltas,
+        envelopes,
+        converters,
+        (
+            (*accounts[t.account_id], t.transaction_date, t.amount, t.tags_mask)
+            for t in transactions
+            if t.pk not in linked
+        ),
+        1,
+        warnings,
+    )
+    counted_before = linked - new_ids
+    if counted_before:
+        rows = Transaction.objects.filter(pk__in=counted_before).values_list(
+            "account__account_type", "account__currency", "transaction_date", "amount", "tags_mask"
+        )
+        _add_spend(deltas, envelopes, converters, rows, -1, warnings)
+
+    with db_transaction.atomic():
+        _apply_deltas(deltas)
+        warnings += check_overspend(envelopes, {month for _, month in deltas})
+    return warnings
+
+
+def _apply_deltas(deltas: Dict[Tuple[int, date], Decimal]) -> None:
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    EnvelopeMonth.objects.bulk_create(
+        [EnvelopeMonth(envelope_id=envelope_id, month=month) for envelope_id, month in deltas],
+        ignore_conflicts=True,
+    )
+    for (envelope_id, month), delta in deltas.items():
+        EnvelopeMonth.objects.filter(envelope_id=envelope_id, month=month).update(
+            actual=F("actual") + delta, updated_at=timezone.now()
+        )
+
+
+def check_overspend(envelopes: List[Envelope], months: Iterable[date]) -> List[str]:
+    """
+    Flags the given months of the envelopes that just went over their limit (and unflags the
+    ones back under it). One read and at most two updates, whatever the number of transactions.
+    """
+    months = set(months)
+    if not months:
+        return []
+    by_id = {envelope.pk: envelope for envelope in envelopes}
+    now = timezone.now()
+    over, under, warnings = [], [], []
+    rows = EnvelopeMonth.objects.filter(envelope_id__in=by_id, month__in=months).values_list(
+        "pk", "envelope_id", "month", "actual", "overspent_at"
+    )
+    for pk, envelope_id, month, actual, overspent_at in rows:
+        envelope = by_id[envelope_id]
+        if actual > envelope.monthly_limit and overspent_at is None:
+            over.append(pk)
+            warnings.append(
+                f"Budget \"{envelope.name}\" is over its limit for {month:%B %Y}: "
+                f"{actual:.2f} of {envelope.monthly_limit:.2f} {envelope.currency} spent."
+            )
+        elif actual <= envelope.monthly_limit and overspent_at is not None:
+            under.append(pk)
+    if over:
+        EnvelopeMonth.objects.filter(pk__in=over).update(overspent_at=now)
+    if under:
+        EnvelopeMonth.objects.filter(pk__in=under).update(overspent_at=None)
+    return warnings
+
+
+def refresh_envelopes(
+    user_id: int,
+    envelopes: Optional[Iterable[Envelope]] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> None:
+    """
+    Recomputes the months of the user's envelopes (or just `envelopes`) that overlap
+    [start, end] from the transactions: one grouped query per table. Overspend flags are
+    kept for months still over their limit, set for new ones and cleared for the rest.
+    """
+    envelopes = list(
+        Envelope.objects.filter(user_id=user_id).select_related("tag") if envelopes is None else envelopes
+    )
+    if not envelopes:
+        return
+    start = month_start(start) if start else None
+    if end:
+        end = date(end.year + end.month // 12, end.month % 12 + 1, 1)  # through the end of its month
+
+    deltas: Dict[Tuple[int, date], Decimal] = {}
+    converters = {}
+    warnings: List[str] = []  # a missing rate leaves the row out, as in the reports
+    for qs in transaction_sources(start, end, user_id=user_id):
+        if end:
+            qs = qs.filter(transaction_date__lt=end)
+        rows = (
+            exclude_transfers(qs)
+            .filter(amount__lt=0)
+            .values("account__account_type", "account__currency", "transaction_date", "tags_mask")
+            .annotate(spend=Sum("amount"))
+            .order_by()
+            .values_list("account__account_type", "account__currency", "transaction_date", "spend", "tags_mask")
+        )
+        _add_spend(deltas, envelopes, converters, rows.iterator(chunk_size=5000), 1, warnings)
+
+    ids = [envelope.pk for envelope in envelopes]
+    existing = EnvelopeMonth.objects.filter(envelope_id__in=ids)
+    if start:
+        existing = existing.filter(month__gte=start)
+    if end:
+        existing = existing.filter(month__lt=end)
+    flagged = dict(existing.filter(overspent_at__isnull=False).values_list("pk", "overspent_at"))
+    keep = {
+        (envelope_id, month): flagged.get(pk)
+        for pk, envelope_id, month in existing.values_list("pk", "envelope_id", "month")
+    }
+    limits = {envelope.pk: envelope.monthly_limit for envelope in envelopes}
+    now = timezone.now()
+    with db_transaction.atomic():
+        existing.delete()
+        EnvelopeMonth.objects.bulk_create(
+            [
+                EnvelopeMonth(
+                    envelope_id=envelope_id,
+                    month=month,
+                    actual=actual,
+                    overspent_at=(keep.get((envelope_id, month)) or now) if actual > limits[envelope_id] else None,
+                )
+                for (envelope_id, month), actual in deltas.items()
+                if actual
+            ],
+            batch_size=500,
+        )
+
+
+def refresh_all_envelopes(start: Optional[date] = None) -> int:
+    """
+    Recomputes every user's envelopes from `start` on, after FX rates changed: a rate dated
+    D converts rows dated D and later. Returns the number of users refreshed.
+    """
+    user_ids = list(Envelope.objects.order_by("user_id").values_list("user_id", flat=True).distinct())
+    for user_id in user_ids:
+        refresh_envelopes(user_id, start=start)
+    return len(user_ids)
+
+
+def refresh_for_tags(user_id: int, mask: int) -> None:
+    """
+    Recomputes the envelopes scoped to any tag bit in mask (after tags were added/removed).
+    """
+    envelopes = [
+        envelope
+        for envelope in Envelope.objects.filter(user_id=user_id, tag__isnull=False).select_related("tag")
+        if envelope.tag.mask & mask
+    ]
+    if envelopes:
+        refresh_envelopes(user_id, envelopes)
+
+
+def envelope_page(user_id: int, month: date) -> List[dict]:
+    """
+    Rows for the budget page: every envelope with its actual/remaining for `month`.
+    Two queries, however many envelopes there are.
+    """
+    envelopes = list(Envelope.objects.filter(user_id=user_id).select_related("tag"))
+    months = {
+        envelope_id: (actual, overspent_at)
+        for envelope_id, actual, overspent_at in EnvelopeMonth.objects.filter(
+            envelope__user_id=user_id, month=month_start(month)
+        ).values_list("envelope_id", "actual", "overspent_at")
+    }
+    rows = []
+    for envelope in envelopes:
+        actual, overspent_at = months.get(envelope.pk, (Decimal(0), None))
+        rows.append(
+            {
+                "envelope": envelope,
+                "actual": actual,
+                "remaining": envelope.monthly_limit - actual,
+                "overspent": actual > envelope.monthly_limit,
+                "overspent_at": overspent_at,
+                "percent": min(100, int(actual * 100 / envelope.monthly_limit)) if envelope.monthly_limit else 100,
+            }
+        )
+    return rows
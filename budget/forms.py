@@ -1,7 +1,7 @@
 from django import forms
 from django.core.validators import FileExtensionValidator
 
-from .models import Account, Bank
+from .models import Account, Bank, Envelope, Tag
 
 
 class ImportSelectAccountForm(forms.Form):
@@ -21,9 +21,9 @@ class ImportSelectAccountForm(forms.Form):
 class ImportUploadStatementForm(forms.Form):
     source_file = forms.FileField(
         required=True,
-        validators=[FileExtensionValidator(allowed_extensions=["csv", "pdf"])],
+        validators=[FileExtensionValidator(allowed_extensions=["csv", "ofx", "qfx", "pdf"])],
         widget=forms.ClearableFileInput(attrs={"class": "form-control"}),
-        help_text="Upload a CSV (recommended) or PDF (stored for reference).",
+        help_text="Upload an OFX/QFX or CSV export (recommended) or a PDF (stored for reference).",
     )
 
 
@@ -50,6 +50,43 @@ class AccountForm(forms.ModelForm):
 
 
 
+class EnvelopeForm(forms.ModelForm):
+    class Meta:
+        model = Envelope
+        fields = ["name", "tag", "account_type", "monthly_limit"]
+        labels = {"tag": "Category"}
+        widgets = {
+            "name": forms.TextInput(attrs={"class": "form-control", "placeholder": "e.g. Groceries"}),
+            "tag": forms.Select(attrs={"class": "form-select"}),
+            "account_type": forms.Select(attrs={"class": "form-select"}),
+            "monthly_limit": forms.NumberInput(attrs={"class": "form-control", "min": 0, "step": "0.01"}),
+        }
+        help_texts = {
+            "tag": "Only transactions with this tag. Leave empty for all categories.",
+            "account_type": "Only accounts of this type. Leave empty for all accounts.",
+        }
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        self.fields["tag"].queryset = Tag.objects.filter(user=user) if user is not None else Tag.objects.none()
+        self.fields["tag"].empty_label = "All categories"
+        self.fields["account_type"].choices = [("", "All account types")] + Account.ACCOUNT_TYPE_CHOICES
+
+    def clean_name(self):
+        name = (self.cleaned_data["name"] or "").strip()
+        others = Envelope.objects.filter(user=self.user, name=name).exclude(pk=self.instance.pk)
+        if others.exists():
+            raise forms.ValidationError("You already have a budget with this name.")
+        return name
+
+    def clean_monthly_limit(self):
+        limit = self.cleaned_data["monthly_limit"]
+        if limit is not None and limit < 0:
+            raise forms.ValidationError("The limit cannot be negative.")
+        return limit
+
+
 class BankForm(forms.ModelForm):
     class Meta:
         model = Bank
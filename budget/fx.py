@@ -0,0 +1,150 @@
+"""
+Currency conversion for reports.
+
+Rates live in FxRate (loaded from a local CSV by `manage.py load_fx_rates`, no network).
+Each rate is the value of one unit of `currency` in FX_PIVOT_CURRENCY on `rate_date`, and
+applies until the next rate for that currency (as-of lookup). The whole table is held
+per process as sorted per-currency arrays searched with bisect, and rebuilt when
+FxRateVersion shows the rates changed (in any process).
+"""
+import csv
+import threading
+from bisect import bisect_right
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Tuple
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import FxRate, FxRateVersion, UserPreferences
+
+
+class FxRateMissing(ValueError):
+    pass
+
+
+def pivot_currency() -> str:
+    return getattr(settings, "FX_PIVOT_CURRENCY", "USD")
+
+
+class FxTable:
+    """
+    Immutable as-of rate table: {currency: (sorted date ordinals, rates)}.
+    """
+
+    def __init__(self, rates: Iterable[Tuple[str, date, Decimal]]):
+        by_currency: Dict[str, List[Tuple[int, Decimal]]] = {}
+        for currency, rate_date, rate in rates:
+            by_currency.setdefault(currency.upper(), []).append((rate_date.toordinal(), Decimal(rate)))
+
+        self._dates: Dict[str, List[int]] = {}
+        self._rates: Dict[str, List[Decimal]] = {}
+        for currency, points in by_currency.items():
+            points.sort()
+            self._dates[currency] = [d for d, _ in points]
+            self._rates[currency] = [r for _, r in points]
+
+    def currencies(self) -> List[str]:
+        return sorted(self._dates)
+
+    def rate(self, currency: str, on: int) -> Decimal:
+        """
+        Value of one `currency` in the pivot currency as of date ordinal `on`.
+        """
+        currency = currency.upper()
+        if currency == pivot_currency():
+            return Decimal(1)
+        dates = self._dates.get(currency)
+        i = bisect_right(dates, on) - 1 if dates else -1
+        if i < 0:
+            raise FxRateMissing(f"No {currency} rate on or before {date.fromordinal(on).isoformat()}.")
+        return self._rates[currency][i]
+
+    def factor(self, currency: str, base: str, on: int) -> Decimal:
+        if currency.upper() == base.upper():
+            return Decimal(1)
+        return self.rate(currency, on) / self.rate(base, on)
+
+    def converter(self, base: str):
+        """
+        Returns convert(amount, currency, date) -> amount in `base`.
+        Factors are memoised per (currency, day), so a query result with many rows per day
+        does one bisect per distinct (currency, day).
+        """
+        memo: Dict[Tuple[str, int], Decimal] = {}
+        base = base.upper()
+
+        def convert(amount, currency: str, on: date) -> Decimal:
+            currency = currency.upper()
+            if currency == base:
+                return Decimal(amount)
+            key = (currency, on.toordinal())
+            factor = memo.get(key)
+            if factor is None:
+                factor = memo[key] = self.factor(currency, base, key[1])
+            return Decimal(amount) * factor
+
+        return convert
+
+
+_lock = threading.Lock()
+_cache = {"table": None, "version": None}
+
+
+def fx_rates_version() -> int:
+    return FxRateVersion.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+
+
+def bump_fx_rates_version() -> None:
+    """
+    Call after any change to FxRate; cached tables in every process are rebuilt on next use.
+    """
+    updated = FxRateVersion.objects.filter(pk=1).update(version=F("version") + 1, updated_at=timezone.now())
+    if not updated:
+        FxRateVersion.objects.get_or_create(pk=1, defaults={"version": 1})
+
+
+def get_fx_table() -> FxTable:
+    """
+    Process-wide FxTable, rebuilt from the DB whenever FxRateVersion has moved since it was
+    built. Costs one primary-key lookup per call.
+    """
+    version = fx_rates_version()
+    table = _cache["table"]
+    if table is not None and _cache["version"] == version:
+        return table
+
+    with _lock:
+        if _cache["table"] is None or _cache["version"] != version:
+            rows = FxRate.objects.values_list("currency", "rate_date", "rate").iterator(chunk_size=10000)
+            _cache["table"] = FxTable(rows)
+            _cache["version"] = version
+        return _cache["table"]
+
+
+def clear_fx_cache() -> None:
+    with _lock:
+        _cache["table"] = None
+
+
+def base_currency_for(user) -> str:
+    base = UserPreferences.objects.filter(user=user).values_list("base_currency", flat=True).first()
+    return (base or getattr(settings, "DEFAULT_BASE_CURRENCY", "USD")).upper()
+
+
+def read_rates_csv(path) -> List[Tuple[str, date, Decimal]]:
+    """
+    Reads `date,currency,rate` rows (ISO dates; rate = value of one unit in the pivot currency).
+    """
+    rates = []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                rates.append(
+                    (row["currency"].strip().upper(), date.fromisoformat(row["date"].strip()), Decimal(row["rate"].strip()))
+                )
+            except (KeyError, ValueError, InvalidOperation, AttributeError):
+                raise ValueError(f"Line {line_no}: expected date,currency,rate; got {row!r}")
+    return rates
@@ -0,0 +1,105 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from django.db import connection
+
+
+logger = logging.getLogger("budget.import")
+
+
+class ImportMetrics:
+    """
+    Per-stage timers and counters for a single statement import.
+    Stored as a compact dict on BankStatement.import_metrics and emitted as one log line.
+    """
+
+    VERSION = 1
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {
+            "bytes_read": 0,
+            "rows_parsed": 0,
+            "rows_created": 0,
+            "batches_inserted": 0,
+            "queries": 0,
+        }
+        self.rejected: Dict[str, int] = {}
+
+    def __getstate__(self):
+        # perf_counter is per process: carry the elapsed time, not the start mark
+        state = self.__dict__.copy()
+        state["started"] = time.perf_counter() - self.started
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.started = time.perf_counter() - state["started"]
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+
+    def incr(self, counter: str, n: int = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def reject(self, reason: str) -> None:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+    @contextmanager
+    def count_queries(self) -> Iterator[None]:
+        """
+        Counts every SQL statement issued on the default connection while active.
+        """
+        def wrapper(execute, sql, params, many, context):
+            self.counters["queries"] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(wrapper):
+            yield
+
+    def as_dict(self) -> dict:
+        timings_ms = {k: round(v * 1000, 2) for k, v in self.timings.items()}
+        timings_ms["total"] = round((time.perf_counter() - self.started) * 1000, 2)
+        return {
+            "v": self.VERSION,
+            **self.counters,
+            "rows_rejected": dict(self.rejected),
+            "timings_ms": timings_ms,
+        }
+
+    def log(self, statement, record: dict) -> None:
+        payload = {
+            "statement_id": statement.pk,
+            "account_id": statement.account_id,
+            "bank_id": statement.account.bank_id,
+            **record,
+        }
+        logger.info("statement_import %s", json.dumps(payload, sort_keys=True))
+
+
+def timed_lines(text, metrics: ImportMetrics, stage: str = "decode") -> Iterator[str]:
+    """
+    Yields lines from a text stream, charging the time spent decoding them to `stage`.
+    Lets the caller separate decode cost from csv tokenizing cost.
+    """
+    readline = text.readline
+    clock = time.perf_counter
+    while True:
+        t0 = clock()
+        line = readline()
+        metrics.add_time(stage, clock() - t0)
+        if not line:
+            return
+        yield line
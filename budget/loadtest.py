@@ -0,0 +1,537 @@
+"""
+Local load test for the import and read paths (manage.py load_test).
+
+The project's WSGI application is served by a threaded wsgiref server inside this process,
+and client threads drive it over loopback HTTP the way browsers would: statement uploads go
+through every step of StatementImportWizard (session cookie, CSRF token, multipart POST),
+and reads hit the dashboard, reports and budget pages, the JSON summary/analytics endpoints
+and a full cursor-paged export of the transactions API. Only the standard library is used
+and nothing leaves the machine, so it runs offline in CI.
+
+Everything runs in a scratch environment (see scratch_environment): a freshly migrated
+SQLite database and temporary MEDIA_ROOT, PROFILE_DIR and snapshot/report directories, all
+removed afterwards, so the configured database and files are never touched. Client and
+server share this process, so absolute numbers are a lower bound for a real deployment;
+compare runs with each other.
+"""
+import hashlib
+import http.client
+import json
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from http.cookies import SimpleCookie
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.files.base import ContentFile
+from django.core.signals import got_request_exception
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import OperationalError, connection
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from .importers import import_statement
+from .models import Account, Bank, BankStatement, Envelope
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+WIZARD_PREFIX = "statement_import_wizard"
+UPLOAD_NAME = "loadtest-upload-"
+SCRATCH_DIRS = {
+    "MEDIA_ROOT": "media",
+    "PROFILE_DIR": "profiles",
+    "ANALYTICS_SNAPSHOT_DIR": "snapshots",
+    "MONTHLY_REPORTS_DIR": "monthly_reports",
+}
+MERCHANTS = [
+    "GROCERY MART", "CITY FUEL", "COFFEE CORNER", "ONLINE BOOKS", "PHARMACY PLUS", "TRAIN TICKETS",
+    "HARDWARE DEPOT", "STREAMING SVC", "PIZZA PLACE", "GYM MEMBERSHIP", "PET SUPPLIES", "PARKING",
+]
+DEFAULT_MIX = {
+    "upload": 1, "dashboard": 2, "reports": 1, "budgets": 2, "summary": 2, "analytics": 1, "export": 1,
+}
+
+
+# --------------------------------------------------------------------
+# Seeding
+# --------------------------------------------------------------------
+@dataclass
+class SeedUser:
+    user_id: int
+    account_ids: List[int]
+
+
+def synthetic_csv(rnd: random.Random, month: date, rows: int) -> bytes:
+    """
+    A Date,Description,Amount export for one month: card spending, a salary and a card payment.
+    A random reference keeps every file distinct (uploads are stored by content hash).
+    """
+    tag = uuid.UUID(int=rnd.getrandbits(128)).hex[:8]
+    lines = ["Date,Description,Amount"]
+    lines.append(f"{month:%m}/01/{month:%Y},PAYROLL {tag},{rnd.randint(2500, 4000)}.00")
+    for _ in range(rows):
+        day = rnd.randint(1, 28)
+        lines.append(
+            f"{month:%m}/{day:02d}/{month:%Y},{rnd.choice(MERCHANTS)} #{rnd.randint(100, 999)},"
+            f"-{rnd.randint(1, 150)}.{rnd.randint(0, 99):02d}"
+        )
+    lines.append(f"{month:%m}/20/{month:%Y},CARD PAYMENT {tag},-{rnd.randint(200, 900)}.00")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def months_back(count: int, today: Optional[date] = None) -> List[date]:
+    first = (today or date.today()).replace(day=1)
+    months = []
+    for _ in range(count):
+        first = (first - timedelta(days=1)).replace(day=1)
+        months.append(first)
+    return months
+
+
+def seed_users(count: int, statements: int, rows: int, prefix: str, rnd: random.Random, progress=None) -> List[SeedUser]:
+    """
+    Creates (or reuses) `count` users, each with a checking and a credit account, a budget
+    envelope and `statements` monthly statements imported directly (not over HTTP).
+    """
+    User = get_user_model()
+    bank, _ = Bank.objects.get_or_create(name=f"{prefix} bank")
+    seeded = []
+    for n in range(count):
+        user, created = User.objects.get_or_create(username=f"{prefix}-{n}")
+        accounts = [
+            Account.objects.get_or_create(user=user, bank=bank, name=name, defaults={"account_type": kind})[0]
+            for name, kind in (("Checking", Account.CHECKING), ("Card", Account.CREDIT))
+        ]
+        Envelope.objects.get_or_create(
+            user=user, name="Everything", defaults={"monthly_limit": 2500, "currency": "USD"}
+        )
+        if created:
+            for month in months_back(statements):
+                account = rnd.choice(accounts)
+                import_statement(new_statement(user, account, synthetic_csv(rnd, month, rows)))
+        seeded.append(SeedUser(user.pk, [a.pk for a in accounts]))
+        if progress:
+            progress(n + 1, count)
+    return seeded
+
+
+def new_statement(user, account: Account, data: bytes) -> BankStatement:
+    return BankStatement.objects.create(
+        user=user,
+        account=account,
+        source_file=ContentFile(data, name="loadtest.csv"),
+        file_hash=hashlib.sha256(data).hexdigest(),
+    )
+
+
+@contextmanager
+def scratch_environment(keep: bool = False, verbosity: int = 0):
+    """
+    Runs the block against a new SQLite database and empty file directories under one
+    temporary directory (yielded), set up the way the test runner does it. The directory is
+    removed afterwards unless kept.
+    """
+    root = Path(tempfile.mkdtemp(prefix="budget-loadtest-"))
+    test_settings = connection.settings_dict["TEST"]
+    test_name = test_settings.get("NAME")
+    test_settings["NAME"] = str(root / "db.sqlite3")
+    try:
+        with override_settings(**{name: root / sub for name, sub in SCRATCH_DIRS.items()}):
+            old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+            try:
+                yield root
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=verbosity, keepdb=keep)
+    finally:
+        test_settings["NAME"] = test_name
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def session_for(user_id: int) -> str:
+    """
+    A logged-in session key for the user (what Client.force_login does, without a request).
+    """
+    user = get_user_model().objects.get(pk=user_id)
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return session.session_key
+
+
+# --------------------------------------------------------------------
+# Server
+# --------------------------------------------------------------------
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LockErrors:
+    """
+    Counts requests that failed on "database is locked" (SQLite's busy timeout ran out).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, sender, request=None, **kwargs):
+        error = sys.exc_info()[1]
+        if isinstance(error, OperationalError) and "locked" in str(error):
+            with self._lock:
+                self.count += 1
+
+
+@contextmanager
+def serve(lock_errors: LockErrors):
+    """
+    Runs the WSGI app on an ephemeral loopback port; yields (host, port).
+    """
+    server = make_server(
+        "127.0.0.1", 0, WSGIHandler(), server_class=ThreadingWSGIServer, handler_class=QuietHandler
+    )
+    got_request_exception.connect(lock_errors)
+    thread = threading.Thread(target=server.serve_forever, name="loadtest-server", daemon=True)
+    thread.start()
+    try:
+        yield server.server_address[:2]
+    finally:
+        server.shutdown()
+        server.server_close()
+        got_request_exception.disconnect(lock_errors)
+
+
+# --------------------------------------------------------------------
+# Client
+# --------------------------------------------------------------------
+class HttpError(Exception):
+    def __init__(self, status: int, path: str):
+        super().__init__(f"HTTP {status} for {path}")
+        self.status = status
+
+
+class Browser:
+    """
+    One user's cookie jar over plain http.client (one connection per request, like wsgiref).
+    """
+
+    CSRF_FIELD = re.compile(rb'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+    def __init__(self, address: Tuple[str, int], session_key: str, timeout: float = 60):
+        self.address = address
+        self.timeout = timeout
+        self.cookies = {settings.SESSION_COOKIE_NAME: session_key}
+        self.requests = 0
+        self.location = ""  # of the last response
+
+    def request(self, method: str, path: str, body: bytes = None, headers: Dict[str, str] = None, ok=(200,)) -> bytes:
+        headers = dict(headers or {})
+        headers["Cookie"] = "; ".join(f"{name}={value}" for name, value in self.cookies.items())
+        conn = http.client.HTTPConnection(*self.address, timeout=self.timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        finally:
+            conn.close()
+        self.requests += 1
+        self.location = response.headers.get("Location", "")
+        for header in response.headers.get_all("Set-Cookie") or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        if response.status not in ok:
+            raise HttpError(response.status, path)
+        return data
+
+    def get(self, path: str, **params) -> bytes:
+        return self.request("GET", f"{path}?{urlencode(params)}" if params else path)
+
+    def post_form(self, path: str, fields: Dict[str, str], ok=(200,)) -> bytes:
+        body = urlencode(fields).encode()
+        return self.request("POST", path, body, {"Content-Type": "application/x-www-form-urlencoded"}, ok)
+
+    def post_multipart(self, path: str, fields: Dict[str, str], files: Dict[str, Tuple[str, bytes]], ok=(200,)) -> bytes:
+        boundary = uuid.uuid4().hex
+        parts = []
+        for name, value in fields.items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        for name, (filename, data) in files.items():
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                f"Content-Type: text/csv\r\n\r\n".encode() + data + b"\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n".encode())
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        return self.request("POST", path, b"".join(parts), headers, ok)
+
+    def csrf_token(self, page: bytes) -> str:
+        match = self.CSRF_FIELD.search(page)
+        return match.group(1).decode() if match else self.cookies.get(settings.CSRF_COOKIE_NAME, "")
+
+
+# --------------------------------------------------------------------
+# Scenarios: each is one user-visible operation (possibly several requests)
+# --------------------------------------------------------------------
+def scenario_upload(browser: Browser, user: SeedUser, rnd: random.Random, rows: int) -> None:
+    path = reverse("budget:import_statement")
+    page = browser.get(path)
+    token = browser.csrf_token(page)
+    browser.post_form(path, {
+        "csrfmiddlewaretoken": token,
+        f"{WIZARD_PREFIX}-current_step": "account",
+        "account-account": str(rnd.choice(user.account_ids)),
+    })
+    month = rnd.choice(months_back(12))
+    browser.post_multipart(
+        path,
+        {"csrfmiddlewaretoken": token, f"{WIZARD_PREFIX}-current_step": "upload"},
+        {"upload-source_file": (f"{UPLOAD_NAME}{month:%Y-%m}.csv", synthetic_csv(rnd, month, rows))},
+        ok=(302,),  # done() redirects to the dashboard
+    )
+    if not browser.location.endswith(reverse("budget:dashboard")):
+        raise HttpError(302, f"{path} -> {browser.location}")
+
+
+def scenario_page(name: str) -> Callable:
+    def run(browser: Browser, user: SeedUser, rnd: random.Random, rows: int) -> None:
+        browser.get(reverse(name))
+
+    return run
+
+
+def scenario_summary(browser: Browser, user: SeedUser, rnd: random.Random, rows: int) -> None:
+    browser.get(reverse("budget:api_monthly_summary"), start=months_back(12)[-1].isoformat())
+
+
+def scenario_analytics(browser: Browser, user: SeedUser, rnd: random.Random, rows: int) -> None:
+    browser.get(reverse("budget:api_analytics"), period=rnd.choice(["month", "year"]))
+
+
+def scenario_export(browser: Browser, user: SeedUser, rnd: random.Random, rows: int) -> None:
+    """
+    Every transaction of the user, following next_cursor to the end.
+    """
+    path = reverse("budget:api_transactions")
+    params = {"limit": 500}
+    while True:
+        page = json.loads(browser.get(path, **params))
+        if not page["next_cursor"]:
+            return
+        params["cursor"] = page["next_cursor"]
+
+
+SCENARIOS = {
+    "upload": scenario_upload,
+    "dashboard": scenario_page("budget:dashboard"),
+    "reports": scenario_page("budget:reports"),
+    "budgets": scenario_page("budget:envelope_list"),
+    "summary": scenario_summary,
+    "analytics": scenario_analytics,
+    "export": scenario_export,
+}
+
+
+# --------------------------------------------------------------------
+# Results
+# --------------------------------------------------------------------
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of an ascending list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+@dataclass
+class ScenarioStats:
+    latencies: List[float] = field(default_factory=list)  # seconds, successful operations
+    errors: Dict[str, int] = field(default_factory=dict)
+
+    def merge(self, other: "ScenarioStats") -> None:
+        self.latencies.extend(other.latencies)
+        for key, n in other.errors.items():
+            self.errors[key] = self.errors.get(key, 0) + n
+
+    def summary(self, elapsed: float) -> dict:
+        values = sorted(self.latencies)
+        return {
+            "ok": len(values),
+            "errors": sum(self.errors.values()),
+            "error_kinds": dict(self.errors),
+            "per_second": round(len(values) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+            "max_ms": round(values[-1] * 1000, 1) if values else 0.0,
+        }
+
+
+@dataclass
+class LoadTestReport:
+    workers: int
+    users: int
+    elapsed: float
+    requests: int
+    lock_errors: int
+    scenarios: Dict[str, ScenarioStats]
+    peak_rss_mb: Optional[float]
+    peak_rss_growth_mb: Optional[float]
+
+    def as_dict(self) -> dict:
+        operations = sum(len(s.latencies) for s in self.scenarios.values())
+        return {
+            "workers": self.workers,
+            "users": self.users,
+            "elapsed_s": round(self.elapsed, 2),
+            "operations": operations,
+            "operations_per_second": round(operations / self.elapsed, 2) if self.elapsed else 0.0,
+            "requests": self.requests,
+            "requests_per_second": round(self.requests / self.elapsed, 2) if self.elapsed else 0.0,
+            "errors": sum(sum(s.errors.values()) for s in self.scenarios.values()),
+            "sqlite_lock_errors": self.lock_errors,
+            "peak_rss_mb": self.peak_rss_mb,
+            "peak_rss_growth_mb": self.peak_rss_growth_mb,
+            "scenarios": {name: stats.summary(self.elapsed) for name, stats in sorted(self.scenarios.items())},
+        }
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    """
+    "upload=1,dashboard=3" -> weights; scenarios not named keep their default weight.
+    """
+    mix = dict(DEFAULT_MIX)
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}.")
+        try:
+            mix[name] = int(weight)
+        except ValueError:
+            raise ValueError(f"Weight for {name!r} must be a whole number.")
+        if mix[name] < 0:
+            raise ValueError(f"Weight for {name!r} cannot be negative.")
+    if not any(mix.values()):
+        raise ValueError("At least one scenario needs a positive weight.")
+    return mix
+
+
+# --------------------------------------------------------------------
+# Driver
+# --------------------------------------------------------------------
+def run_load_test(
+    users: List[SeedUser],
+    workers: int = 8,
+    duration: float = 30.0,
+    operations: Optional[int] = None,
+    mix: Optional[Dict[str, int]] = None,
+    upload_rows: int = 200,
+    seed: int = 0,
+) -> LoadTestReport:
+    """
+    Runs `workers` client threads against an in-process server until `duration` seconds have
+    passed (or, with `operations`, until each worker has done that many). Every worker picks
+    a random seeded user and a scenario by weight for each operation; each (worker, user)
+    pair has its own session so wizard state is never shared.
+    """
+    mix = mix or DEFAULT_MIX
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+    sessions = {user.user_id: [session_for(user.user_id) for _ in range(workers)] for user in users}
+    connection.close()  # the server threads and this one must not share a connection
+
+    lock_errors = LockErrors()
+    rss_before = peak_rss_mb()
+    results: List[Dict[str, ScenarioStats]] = [dict() for _ in range(workers)]
+    request_counts = [0] * workers
+
+    def worker(index: int, address: Tuple[str, int], deadline: float) -> None:
+        rnd = random.Random(seed * 1000 + index)
+        browsers = {user.user_id: Browser(address, sessions[user.user_id][index]) for user in users}
+        stats = results[index]
+        done = 0
+        try:
+            while time.monotonic() < deadline and (operations is None or done < operations):
+                user = rnd.choice(users)
+                name = rnd.choices(names, weights)[0]
+                entry = stats.setdefault(name, ScenarioStats())
+                started = time.perf_counter()
+                try:
+                    SCENARIOS[name](browsers[user.user_id], user, rnd, upload_rows)
+                except HttpError as e:
+                    key = f"http_{e.status}"
+                    entry.errors[key] = entry.errors.get(key, 0) + 1
+                except (OSError, http.client.HTTPException) as e:
+                    key = type(e).__name__
+                    entry.errors[key] = entry.errors.get(key, 0) + 1
+                else:
+                    entry.latencies.append(time.perf_counter() - started)
+                done += 1
+        finally:
+            request_counts[index] = sum(b.requests for b in browsers.values())
+            connection.close()
+
+    with serve(lock_errors) as address:
+        started = time.monotonic()
+        deadline = started + duration if operations is None else float("inf")
+        threads = [
+            threading.Thread(target=worker, args=(i, address, deadline), name=f"loadtest-client-{i}")
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+    merged: Dict[str, ScenarioStats] = {}
+    for stats in results:
+        for name, entry in stats.items():
+            merged.setdefault(name, ScenarioStats()).merge(entry)
+    rss_after = peak_rss_mb()
+    return LoadTestReport(
+        workers=workers,
+        users=len(users),
+        elapsed=elapsed,
+        requests=sum(request_counts),
+        lock_errors=lock_errors.count,
+        scenarios=merged,
+        peak_rss_mb=rss_after,
+        peak_rss_growth_mb=None if rss_after is None else round(rss_after - rss_before, 1),
+    )
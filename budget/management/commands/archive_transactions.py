@@ -0,0 +1,59 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from budget.archive import archivable, archive_transactions, default_through_year, keep_months
+from budget.models import Transaction
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = (
+        "Moves transactions of whole past years into the archive table (ArchivedTransaction). "
+        "By default every year that ends before the last ARCHIVE_KEEP_MONTHS months. Reports "
+        "still include archived rows whenever a requested range reaches them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--through-year", type=int, help="Archive rows dated up to the end of this year.")
+        parser.add_argument("--user", type=int, action="append", help="Only this user id (repeatable).")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would move.")
+        parser.add_argument("--vacuum", action="store_true", help="VACUUM the SQLite database afterwards.")
+
+    def handle(self, *args, through_year=None, user=None, dry_run=False, vacuum=False, **options):
+        latest = default_through_year()
+        if through_year is None:
+            through_year = latest
+        elif through_year > latest:
+            raise CommandError(
+                f"{through_year} overlaps the last {keep_months()} months (ARCHIVE_KEEP_MONTHS); "
+                f"the latest year that can be archived is {latest}."
+            )
+
+        if dry_run:
+            before = date(through_year + 1, 1, 1)
+            user_ids = user or (
+                Transaction.objects.filter(transaction_date__lt=before)
+                .order_by("user_id")
+                .values_list("user_id", flat=True)
+                .distinct()
+            )
+            total = sum(archivable(user_id, before).count() for user_id in user_ids)
+            self.stdout.write(f"Would archive {total} transaction(s) dated up to {through_year}-12-31.")
+            return
+
+        def progress(user_id, moved):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"  user {user_id}: {moved} moved")
+
+        result = archive_transactions(through_year, user_ids=user, progress=progress)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {result.moved} transaction(s) dated up to {through_year}-12-31 for {result.users} user(s)."
+            )
+        )
+        if vacuum and connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("VACUUM")
+            self.stdout.write("Database vacuumed.")
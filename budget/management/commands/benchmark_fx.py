@@ -0,0 +1,64 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from budget.fx import FxTable, pivot_currency
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = "Benchmarks as-of FX conversion (budget.fx.FxTable) on synthetic data. No database access."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--currencies", type=int, default=5)
+        parser.add_argument("--days", type=int, default=3 * 365, help="Span of transaction dates.")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, rows, currencies, days, seed, **options):
+        rnd = random.Random(seed)
+        pool = [pivot_currency(), "EUR", "GBP", "JPY", "CAD", "AUD", "CHF", "MXN", "SEK", "NZD"]
+        codes = pool[:max(1, min(currencies, len(pool)))]
+        start = date(2022, 1, 1)
+
+        # Business-day rates for every non-pivot currency, starting a week early so every
+        # transaction date has an as-of rate
+        rates = []
+        for code in codes[1:]:
+            level = Decimal(rnd.uniform(0.005, 1.5)).quantize(Decimal("0.000001"))
+            for offset in range(-7, days):
+                d = start + timedelta(days=offset)
+                if d.weekday() < 5:
+                    rates.append((code, d, level * Decimal(1 + rnd.uniform(-0.01, 0.01)).quantize(Decimal("0.0001"))))
+
+        dates = [start + timedelta(days=offset) for offset in range(days)]
+        data = [
+            (Decimal(rnd.randint(-50000, 50000)) / 100, rnd.choice(codes), rnd.choice(dates))
+            for _ in range(rows)
+        ]
+        self.stdout.write(f"{rows:,} rows, {len(codes)} currencies, {len(rates):,} rates over {days} days")
+
+        t0 = time.perf_counter()
+        table = FxTable(rates)
+        build = time.perf_counter() - t0
+
+        for base in (codes[0], codes[-1]):
+            convert = table.converter(base)
+            t0 = time.perf_counter()
+            total = Decimal(0)
+            for amount, currency, on in data:
+                total += convert(amount, currency, on)
+            elapsed = time.perf_counter() - t0
+            self.stdout.write(
+                f"  to {base}: {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s), total {total:.2f}"
+            )
+
+        # Uncached lookups: one bisect per row, as a baseline for the memo
+        t0 = time.perf_counter()
+        for amount, currency, on in data[:100_000]:
+            amount * table.factor(currency, codes[0], on.toordinal())
+        per_row = (time.perf_counter() - t0) / min(rows, 100_000)
+        self.stdout.write(f"  table build {build * 1000:.1f} ms; unmemoised lookup {per_row * 1e6:.2f} µs/row")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from budget.archive import users_with_transactions
+from budget.snapshot import rebuild_snapshot, snapshot_root
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = (
+        "Rebuilds the per-user columnar analytics snapshots in ANALYTICS_SNAPSHOT_DIR ahead of time "
+        "(otherwise the first analytics request after a non-import change rebuilds it)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", help="Only this user id (repeatable).")
+
+    def handle(self, *args, user=None, **options):
+        user_ids = user or users_with_transactions()
+        for user_id in user_ids:
+            snapshot = rebuild_snapshot(user_id)
+            self.stdout.write(f"user {user_id}: {len(snapshot)} rows, {len(snapshot.merchants) - 1} merchants")
+        self.stdout.write(self.style.SUCCESS(f"Snapshots written to {snapshot_root()}"))
@@ -0,0 +1,89 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from budget.models import BankStatement
+from budget.storage import COMPRESSION_SUFFIXES, READ_CHUNK, compression_suffix, write_chunks
+
+
+BATCH_SIZE = 500
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = "Compresses stored statement CSV/OFX files in place (Brotli or gzip) and repoints their statements."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=sorted(COMPRESSION_SUFFIXES),
+            default=getattr(settings, "STATEMENT_STORAGE_COMPRESSION", "") or "br",
+            help="Compression to use (default: STATEMENT_STORAGE_COMPRESSION, else br).",
+        )
+
+    def handle(self, *args, format="br", **options):
+        suffix = COMPRESSION_SUFFIXES[format]
+        done = skipped = before = after = 0
+
+        names = (
+            BankStatement.objects.exclude(source_type=BankStatement.SOURCE_PDF)
+            .exclude(source_file="")
+            .values_list("source_file", flat=True)
+            .distinct()
+            .order_by("source_file")
+        )
+        storage = BankStatement._meta.get_field("source_file").storage
+        for name in self.pages(names):
+            if compression_suffix(name):
+                continue
+            if not storage.exists(name):
+                skipped += 1
+                self.stderr.write(f"{name} is missing, skipped.")
+                continue
+
+            new_name = name + suffix
+            src = storage.path(name)
+            dst = storage.path(new_name)
+            if not os.path.exists(dst):
+                # Compress next to the original, then rename into place
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst), prefix=".compress-")
+                try:
+                    with os.fdopen(fd, "wb") as out, open(src, "rb") as f:
+                        write_chunks(out, iter(lambda: f.read(READ_CHUNK), b""), suffix)
+                    os.replace(tmp, dst)
+                except BaseException:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                    raise
+
+            before += os.path.getsize(src)
+            after += os.path.getsize(dst)
+            with transaction.atomic():
+                # Content-addressed files can be shared by several statements
+                BankStatement.objects.filter(source_file=name).update(source_file=new_name)
+                # Readers that loaded a row before the repoint keep finding the old name until then
+                transaction.on_commit(lambda name=name: storage.delete(name))
+            done += 1
+
+        if done and not after:
+            raise CommandError("Compression produced empty output.")
+        ratio = f" ({before / after:.1f}x smaller)" if after else ""
+        self.stdout.write(
+            self.style.SUCCESS(f"Compressed {done} file(s): {before} -> {after} bytes{ratio}; {skipped} missing.")
+        )
+
+    def pages(self, names):
+        """
+        Yields the names a page at a time, keyed on the name itself (they are distinct): each
+        page is read in full before any row is repointed, so no cursor is open on the table
+        while it is written.
+        """
+        last = ""
+        while True:
+            page = list(names.filter(source_file__gt=last)[:BATCH_SIZE])
+            if not page:
+                return
+            last = page[-1]
+            yield from page
@@ -0,0 +1,94 @@
+import hashlib
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from budget.models import BankStatement, StatementFileLock
+from budget.signals import release_statement_file
+from budget.storage import compression_suffix, content_addressed_name, decompressing_reader, is_content_addressed
+
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = (
+        "Moves statement files stored under the legacy user/account layout into "
+        "content-addressed storage (one file per SHA-256) and removes the duplicates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report what would move without touching files.")
+
+    def handle(self, *args, dry_run=False, **options):
+        moved = shared = missing = mismatched = 0
+
+        legacy = (
+            BankStatement.objects.exclude(source_file="")
+            .only("id", "file_hash", "source_file")
+            .order_by("id")
+        )
+        for stmt in self.pages(legacy):
+            old_name = stmt.source_file.name
+            if is_content_addressed(old_name):
+                continue
+
+            storage = stmt.source_file.storage
+            if not storage.exists(old_name):
+                missing += 1
+                self.stderr.write(f"Statement {stmt.pk}: {old_name} is missing, skipped.")
+                continue
+
+            # Verify the stored hash before trusting it as the file's identity
+            h = hashlib.sha256()
+            with storage.open(old_name, "rb") as f:
+                stream = decompressing_reader(f, old_name)
+                for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+                    h.update(chunk)
+            if h.hexdigest() != stmt.file_hash:
+                mismatched += 1
+                self.stderr.write(f"Statement {stmt.pk}: content hash does not match file_hash, skipped.")
+                continue
+
+            suffix = compression_suffix(old_name)
+            new_name = content_addressed_name(stmt.file_hash, old_name[: len(old_name) - len(suffix)]) + suffix
+            if dry_run:
+                already_there = storage.exists(new_name)
+                shared += already_there
+                moved += not already_there
+                continue
+
+            with transaction.atomic():
+                # Held until the row points at new_name, like any statement storing a file
+                StatementFileLock.acquire(stmt.file_hash)
+                if storage.exists(new_name):
+                    shared += 1
+                else:
+                    with storage.open(old_name, "rb") as f:
+                        # Same suffix on both names: the bytes are already in their stored form
+                        storage.save_stored(new_name, f)
+                    moved += 1
+                BankStatement.objects.filter(pk=stmt.pk).update(source_file=new_name)
+            release_statement_file(old_name, stmt.file_hash, storage)
+
+        prefix = "[dry run] " if dry_run else ""
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix}{moved} file(s) moved, {shared} deduplicated onto an existing file, "
+                f"{missing} missing, {mismatched} hash mismatch(es)."
+            )
+        )
+
+    def pages(self, statements):
+        """
+        Yields the statements a page of primary keys at a time: each page is read in full
+        before any of its rows is updated, so no cursor is open on the table while it is written.
+        """
+        last_pk = 0
+        while True:
+            page = list(statements.filter(pk__gt=last_pk)[:BATCH_SIZE])
+            if not page:
+                return
+            last_pk = page[-1].pk
+            yield from page
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from budget.archive import users_with_transactions
+from budget.models import ArchivedTransaction, Transaction
+from budget.recurring import evaluate_groups, normalize_description
+
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = (
+        "Rebuilds recurring transaction series. Fills merchant_key for rows (hot and archived) "
+        "imported before it existed, then re-detects every merchant group."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", help="Only this user id (repeatable).")
+
+    def handle(self, *args, user=None, **options):
+        backfilled = sum(self.backfill(model, user) for model in (Transaction, ArchivedTransaction))
+
+        user_ids = user or users_with_transactions()
+        found = 0
+        for user_id in user_ids:
+            keys = set()
+            for model in (Transaction, ArchivedTransaction):
+                keys.update(model.objects.filter(user_id=user_id).values_list("merchant_key", flat=True).distinct())
+            found += evaluate_groups(user_id, keys)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {backfilled} merchant key(s); {found} recurring series found."))
+
+    def backfill(self, model, user=None) -> int:
+        """
+        Sets merchant_key on the model's rows that have none, a page of primary keys at a
+        time: every page is read in full before it is written, so no cursor is open on the
+        table while bulk_update writes to it. Rows whose description yields no key stay empty.
+        """
+        missing = model.objects.filter(merchant_key="")
+        if user:
+            missing = missing.filter(user_id__in=user)
+
+        backfilled = 0
+        last_pk = 0
+        while True:
+            page = list(missing.filter(pk__gt=last_pk).order_by("pk").values_list("pk", "description")[:BATCH_SIZE])
+            if not page:
+                return backfilled
+            last_pk = page[-1][0]
+            batch = []
+            for pk, description in page:
+                key = normalize_description(description)
+                if key:
+                    batch.append(model(pk=pk, merchant_key=key))
+            model.objects.bulk_update(batch, ["merchant_key"])
+            backfilled += len(batch)
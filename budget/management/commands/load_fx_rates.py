@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from budget.envelopes import refresh_all_envelopes
+from budget.fx import bump_fx_rates_version, clear_fx_cache, read_rates_csv
+from budget.models import FxRate
+from budget.versioning import bump_all_data_versions
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = (
+        "Loads FX rates from a local CSV with columns date,currency,rate "
+        "(rate = value of one unit of currency in FX_PIVOT_CURRENCY). Existing dates are updated."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--replace", action="store_true", help="Delete all stored rates first.")
+
+    def handle(self, *args, path, replace=False, **options):
+        try:
+            rates = read_rates_csv(path)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        with transaction.atomic():
+            if replace:
+                FxRate.objects.all().delete()
+            FxRate.objects.bulk_create(
+                [FxRate(currency=c, rate_date=d, rate=r) for c, d, r in rates],
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=["currency", "rate_date"],
+                update_fields=["rate"],
+            )
+            # Other processes rebuild their cached tables; converted reports changed for everyone
+            bump_fx_rates_version()
+            bump_all_data_versions()
+        clear_fx_cache()
+        # Budget actuals are stored converted, so recompute them from the earliest new rate
+        if rates:
+            refresh_all_envelopes(None if replace else min(d for _, d, _ in rates))
+        elif replace:
+            refresh_all_envelopes()
+
+        currencies = sorted({c for c, _, _ in rates})
+        self.stdout.write(self.style.SUCCESS(f"Loaded {len(rates)} rate(s) for {', '.join(currencies) or 'no currencies'}."))
@@ -0,0 +1,102 @@
+import json
+import logging
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from budget.loadtest import DEFAULT_MIX, parse_mix, run_load_test, scratch_environment, seed_users
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = (
+        "Seeds users with accounts and synthetic statements, then drives concurrent wizard uploads, "
+        "page reads and API exports against an in-process WSGI server over loopback HTTP. Reports "
+        "throughput, p50/p95/p99 latency, SQLite lock errors and memory. Runs offline against a "
+        "throwaway database and temporary media, profile and snapshot directories."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10, help="Seeded users.")
+        parser.add_argument("--statements", type=int, default=3, help="Statements imported per seeded user.")
+        parser.add_argument("--rows", type=int, default=200, help="Rows per seeded or uploaded statement.")
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent client threads.")
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run.")
+        parser.add_argument("--operations", type=int, help="Stop after this many operations per worker instead.")
+        parser.add_argument(
+            "--mix",
+            default="",
+            help="Scenario weights, e.g. upload=2,export=0. Defaults: "
+            + ",".join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()),
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed (data and request mix).")
+        parser.add_argument("--prefix", default="loadtest", help="Username prefix of the seeded users.")
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the scratch directory (database, media, profiles) afterwards."
+        )
+        parser.add_argument("--json", dest="json_path", help="Also write the report as JSON to this file.")
+        parser.add_argument(
+            "--max-error-rate",
+            type=float,
+            help="Exit with an error if more than this fraction of operations failed (for CI).",
+        )
+
+    def handle(self, *args, users, statements, rows, workers, duration, operations=None, mix="", seed=0,
+               prefix="loadtest", keep=False, json_path=None, max_error_rate=None, **options):
+        if users < 1 or workers < 1:
+            raise CommandError("--users and --workers must be at least 1.")
+        try:
+            weights = parse_mix(mix)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        def progress(done, total):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"  seeded {done}/{total}")
+
+        # Failed requests are counted in the report; their tracebacks only at -v 2
+        request_logger = logging.getLogger("django.request")
+        level = request_logger.level
+        if options["verbosity"] < 2:
+            request_logger.setLevel(logging.CRITICAL)
+        try:
+            with scratch_environment(keep=keep, verbosity=max(options["verbosity"] - 1, 0)) as root:
+                self.stdout.write(f"Seeding {users} user(s) with {statements} statement(s) of {rows} rows...")
+                seeded = seed_users(users, statements, rows, prefix, random.Random(seed), progress=progress)
+                limit = f"{operations} operation(s) per worker" if operations else f"{duration:g}s"
+                self.stdout.write(f"Running {workers} worker(s) for {limit}...")
+                report = run_load_test(
+                    seeded, workers=workers, duration=duration, operations=operations, mix=weights,
+                    upload_rows=rows, seed=seed,
+                ).as_dict()
+        finally:
+            request_logger.setLevel(level)
+        if keep:
+            self.stdout.write(f"Scratch data kept in {root}")
+
+        self.stdout.write(
+            f"{report['operations']} operation(s), {report['requests']} request(s) in {report['elapsed_s']}s: "
+            f"{report['operations_per_second']} ops/s, {report['requests_per_second']} req/s"
+        )
+        self.stdout.write(f"{'scenario':<10} {'ok':>6} {'err':>5} {'ops/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for name, s in report["scenarios"].items():
+            self.stdout.write(
+                f"{name:<10} {s['ok']:>6} {s['errors']:>5} {s['per_second']:>7} "
+                f"{s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8} {s['max_ms']:>8}"
+            )
+            if s["error_kinds"]:
+                self.stdout.write(f"{'':<10} errors: {s['error_kinds']}")
+        self.stdout.write(f"SQLite lock errors: {report['sqlite_lock_errors']}")
+        if report["peak_rss_mb"] is not None:
+            self.stdout.write(
+                f"Peak RSS: {report['peak_rss_mb']} MB (+{report['peak_rss_growth_mb']} MB during the run)"
+            )
+
+        if json_path:
+            with open(json_path, "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {json_path}")
+
+        total = report["operations"] + report["errors"]
+        if max_error_rate is not None and total and report["errors"] / total > max_error_rate:
+            raise CommandError(f"{report['errors']} of {total} operation(s) failed (limit {max_error_rate:.0%}).")
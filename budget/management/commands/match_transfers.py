@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from budget.archive import users_with_transactions
+from budget.envelopes import refresh_envelopes
+from budget.models import Transaction
+from budget.transfers import match_transfers, window_days
+from budget.versioning import bump_data_version
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = (
+        "Links transfers between a user's own accounts (-X / +X within TRANSFER_MATCH_WINDOW_DAYS) "
+        "for transactions imported before matching ran on import. Existing links are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", help="Only this user id (repeatable).")
+
+    def handle(self, *args, user=None, **options):
+        user_ids = user or users_with_transactions()
+        total = 0
+        for user_id in user_ids:
+            span = Transaction.objects.filter(user_id=user_id).aggregate(start=Min("transaction_date"), end=Max("transaction_date"))
+            if not span["start"]:
+                continue
+            linked = match_transfers(user_id, span["start"], span["end"])
+            if linked:
+                # Both sides now drop out of reports, analytics and budget actuals
+                bump_data_version(user_id)
+                window = timedelta(days=window_days())
+                refresh_envelopes(user_id, start=span["start"] - window, end=span["end"] + window)
+            total += linked
+        self.stdout.write(self.style.SUCCESS(f"Linked {total} transfer(s) (window {window_days()} days)."))
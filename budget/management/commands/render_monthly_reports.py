@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from budget.monthly_reports import parse_month, render_monthly_reports, reports_dir
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = (
+        "Renders each user's month-end summary PDF into MONTHLY_REPORTS_DIR/<YYYY-MM>/. "
+        "Reports that already exist are skipped, so an interrupted run can simply be started again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", required=True, help="YYYY-MM")
+        parser.add_argument("--user", type=int, action="append", help="Only this user id (repeatable).")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Render processes (1 = render in this process).",
+        )
+        parser.add_argument("--force", action="store_true", help="Re-render reports that already exist.")
+
+    def handle(self, *args, month, user=None, workers=1, force=False, **options):
+        try:
+            parse_month(month)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        def progress(user_id, error):
+            if options["verbosity"] > 1 or error:
+                self.stdout.write(f"  user {user_id}: {f'FAILED ({error})' if error else 'ok'}")
+
+        result = render_monthly_reports(month, user_ids=user, workers=workers, force=force, progress=progress)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{month}: {result.rendered} rendered, {result.skipped} already done, into {reports_dir() / month}"
+            )
+        )
+        if result.failed:
+            self.stderr.write(f"{len(result.failed)} failed: {sorted(result.failed)}")
@@ -0,0 +1,47 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from budget.reparse import reparse_in_batches, stale_statements
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = (
+        "Re-imports CSV statements whose mapping_version_used is older than their bank's "
+        "current mapping_version, from the stored source files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bank", type=int, action="append", help="Only statements of this bank id (repeatable).")
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=min(4, os.cpu_count() or 1),
+            help="Parallel worker processes (1 = run in this process).",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only report how many statements are stale.")
+
+    def handle(self, *args, bank=None, batch_size=50, workers=1, dry_run=False, **options):
+        qs = stale_statements()
+        if bank:
+            qs = qs.filter(account__bank_id__in=bank)
+        ids = list(qs.order_by("id").values_list("id", flat=True))
+
+        if dry_run or not ids:
+            self.stdout.write(f"{len(ids)} stale statement(s).")
+            return
+
+        def progress(batch):
+            self.stdout.write(f"  batch: {batch.statements} statement(s), {batch.created} transaction(s)")
+
+        result = reparse_in_batches(ids, batch_size=max(batch_size, 1), workers=workers, progress=progress)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Re-imported {result.statements} statement(s): {result.deleted} transaction(s) deleted, "
+                f"{result.created} created."
+            )
+        )
+        if result.failed:
+            self.stderr.write(f"{len(result.failed)} failed to parse: {sorted(result.failed)}")
@@ -0,0 +1,54 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from budget.archive import transaction_sources
+from budget.tags import TagError, create_tag, mask_for, tag_bits, update_tags
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = (
+        "Adds or removes tags on a user's transactions matching the filters, with one UPDATE per table (archived years included). "
+        "Tags given with --tag are created if they do not exist."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, required=True, help="User id.")
+        parser.add_argument("--tag", action="append", default=[], help="Tag to add (repeatable).")
+        parser.add_argument("--remove", action="append", default=[], help="Tag to remove (repeatable).")
+        parser.add_argument("--start", help="YYYY-MM-DD, inclusive.")
+        parser.add_argument("--end", help="YYYY-MM-DD, inclusive.")
+        parser.add_argument("--account", type=int, help="Only this account id.")
+        parser.add_argument("--merchant", help="Only this merchant key (see Transaction.merchant_key).")
+        parser.add_argument("--match", help="Only descriptions containing this text (case-insensitive).")
+
+    def handle(self, *args, user, tag, remove, start=None, end=None, account=None, merchant=None, match=None, **options):
+        if not (tag or remove):
+            raise CommandError("Give at least one --tag or --remove.")
+        try:
+            start = date.fromisoformat(start) if start else None
+            end = date.fromisoformat(end) if end else None
+        except ValueError:
+            raise CommandError("--start/--end must be YYYY-MM-DD.")
+
+        filters = {"user_id": user}
+        if account is not None:
+            filters["account_id"] = account
+        sources = transaction_sources(start, end, **filters)
+        if merchant:
+            sources = [qs.filter(merchant_key=merchant) for qs in sources]
+        if match:
+            sources = [qs.filter(description__icontains=match) for qs in sources]
+
+        try:
+            add = 0
+            for name in tag:
+                add |= create_tag(user, name).mask
+            bits = tag_bits(user)
+            drop = mask_for(bits, (name for name in remove if name in bits))
+        except TagError as e:
+            raise CommandError(str(e))
+
+        updated = sum(update_tags(user, qs, add=add, remove=drop) for qs in sources)
+        self.stdout.write(self.style.SUCCESS(f"Updated tags on {updated} transaction(s)."))
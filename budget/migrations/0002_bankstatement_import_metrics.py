@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-19 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankstatement',
+            name='import_metrics',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
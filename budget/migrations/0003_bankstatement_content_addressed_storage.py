@@ -0,0 +1,20 @@
+# Generated by Django 4.2.20 on 2026-10-19 08:04
+
+import budget.models
+import budget.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0002_bankstatement_import_metrics'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bankstatement',
+            name='source_file',
+            field=models.FileField(storage=budget.storage.statement_storage, upload_to=budget.models.statement_upload_to),
+        ),
+    ]
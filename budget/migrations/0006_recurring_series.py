@@ -0,0 +1,60 @@
+# Generated by Django 4.2.20 on 2026-10-19 08:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('budget', '0005_fxrate_userpreferences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('merchant_key', models.CharField(max_length=120)),
+                ('amount_band', models.IntegerField()),
+                ('sample_description', models.CharField(blank=True, max_length=200)),
+                ('cadence', models.CharField(choices=[('weekly', 'Weekly'), ('biweekly', 'Every 2 weeks'), ('monthly', 'Monthly'), ('quarterly', 'Quarterly'), ('annual', 'Annual')], max_length=12)),
+                ('interval_days', models.FloatField()),
+                ('typical_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('occurrences', models.PositiveIntegerField()),
+                ('first_date', models.DateField()),
+                ('last_date', models.DateField()),
+                ('next_expected_date', models.DateField()),
+                ('confidence', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['next_expected_date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='merchant_key',
+            field=models.CharField(blank=True, max_length=120),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'merchant_key'], name='budget_tran_user_id_845571_idx'),
+        ),
+        migrations.AddField(
+            model_name='recurringseries',
+            name='account',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='budget.account'),
+        ),
+        migrations.AddField(
+            model_name='recurringseries',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_series', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='recurringseries',
+            constraint=models.UniqueConstraint(fields=('user', 'merchant_key', 'amount_band'), name='uniq_recurring_user_key_band'),
+        ),
+    ]
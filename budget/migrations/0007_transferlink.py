@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-19 08:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('budget', '0006_recurring_series'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransferLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('day_gap', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('inflow', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='transfer_in', to='budget.transaction')),
+                ('outflow', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='transfer_out', to='budget.transaction')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfer_links', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
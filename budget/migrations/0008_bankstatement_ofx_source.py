@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-19 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0007_transferlink'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bankstatement',
+            name='source_type',
+            field=models.CharField(choices=[('csv', 'CSV'), ('pdf', 'PDF'), ('ofx', 'OFX/QFX')], default='csv', max_length=8),
+        ),
+    ]
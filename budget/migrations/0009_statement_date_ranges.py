@@ -0,0 +1,40 @@
+# Generated by Django 4.2.20 on 2026-10-19 08:29
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def backfill_date_ranges(apps, schema_editor):
+    """
+    Statements imported before ranges were recorded: span of their transactions.
+    """
+    BankStatement = apps.get_model("budget", "BankStatement")
+    Transaction = apps.get_model("budget", "Transaction")
+    spans = (
+        Transaction.objects.filter(statement__statement_start_date__isnull=True)
+        .values("statement_id")
+        .annotate(first=Min("transaction_date"), last=Max("transaction_date"))
+        .order_by()
+        .values_list("statement_id", "first", "last")
+    )
+    for statement_id, first, last in spans.iterator():
+        BankStatement.objects.filter(pk=statement_id).update(statement_start_date=first, statement_end_date=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0008_bankstatement_ofx_source'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bankstatement',
+            index=models.Index(fields=['user', 'statement_end_date', 'statement_start_date'], name='budget_bank_user_id_af09e5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bankstatement',
+            index=models.Index(fields=['account', 'statement_start_date', 'statement_end_date'], name='budget_bank_account_dcb897_idx'),
+        ),
+        migrations.RunPython(backfill_date_ranges, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.20 on 2026-10-19 08:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('budget', '0010_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('transaction_date', models.DateField()),
+                ('description', models.CharField(max_length=500)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('balance', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('raw_reference', models.CharField(blank=True, max_length=120)),
+                ('merchant_key', models.CharField(blank=True, max_length=120)),
+                ('tags_mask', models.BigIntegerField(default=0)),
+                ('is_transfer', models.BooleanField(default=False)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_transactions', to='budget.account')),
+                ('statement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to='budget.bankstatement')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-transaction_date', '-id'],
+                'indexes': [models.Index(fields=['user', 'transaction_date'], name='budget_arch_user_id_31b6af_idx'), models.Index(fields=['user', 'merchant_key'], name='budget_arch_user_id_d9c7ed_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.20 on 2026-10-19 09:34
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0013_fxrateversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatementFileLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=64, unique=True)),
+                ('locked_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+
+from .storage import configured_compression_suffix, content_addressed_name, statement_storage
 
 
 class Bank(models.Model):
@@ -78,34 +81,39 @@ class Account(models.Model):
 
 
 def statement_upload_to(instance: "BankStatement", filename: str) -> str:
-    # e.g. statements/user_5/account_12/2025-12-23_filename.csv
-    # Keep it simple and organized.
+    # e.g. statements/sha256/ab/cd/abcd…ef.csv(.br) — stored once per distinct content
+    if instance.file_hash:
+        return content_addressed_name(instance.file_hash, filename) + configured_compression_suffix(filename)
+    # Legacy layout, only when no hash was computed
     return f"statements/user_{instance.user_id}/account_{instance.account_id}/{filename}"
 
 
 class BankStatement(models.Model):
     """
-    One uploaded statement file (CSV or PDF). CSVs will be parsed into Transactions.
-    PDFs are stored for reference unless you add parsing later.
+    One uploaded statement file (CSV, OFX/QFX or PDF). CSV and OFX files are parsed into
+    Transactions. PDFs are stored for reference unless you add parsing later.
     """
 
     SOURCE_CSV = "csv"
     SOURCE_PDF = "pdf"
+    SOURCE_OFX = "ofx"
     SOURCE_TYPE_CHOICES = [
         (SOURCE_CSV, "CSV"),
         (SOURCE_PDF, "PDF"),
+        (SOURCE_OFX, "OFX/QFX"),
     ]
+    EXTENSION_SOURCE_TYPES = {"pdf": SOURCE_PDF, "ofx": SOURCE_OFX, "qfx": SOURCE_OFX}
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="statements")
     account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name="statements")
 
-    source_file = models.FileField(upload_to=statement_upload_to)
+    source_file = models.FileField(upload_to=statement_upload_to, storage=statement_storage)
     source_type = models.CharField(max_length=8, choices=SOURCE_TYPE_CHOICES, default=SOURCE_CSV)
 
     file_hash = models.CharField(max_length=64, db_index=True)  # sha256 hex
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
-    # Optional metadata you can fill during/after import
+    # Span of the statement's transactions (and the period the file states), set on import
     statement_start_date = models.DateField(blank=True, null=True)
     statement_end_date = models.DateField(blank=True, null=True)
     row_count = models.PositiveIntegerField(default=0)
@@ -117,8 +125,16 @@ class BankStatement(models.Model):
     parsed_ok = models.BooleanField(default=False)
     parse_error = models.TextField(blank=True)
 
+    # Per-stage timings/counters from the last import (see budget.instrumentation.ImportMetrics)
+    import_metrics = models.JSONField(blank=True, null=True)
+
     class Meta:
         ordering = ["-uploaded_at"]
+        indexes = [
+            # Date-range pruning and coverage scans (budget.coverage)
+            models.Index(fields=["user", "statement_end_date", "statement_start_date"]),
+            models.Index(fields=["account", "statement_start_date", "statement_end_date"]),
+        ]
         constraints = [
             models.UniqueConstraint(fields=["user", "account", "file_hash"], name="uniq_statement_user_account_hash")
         ]
@@ -126,6 +142,36 @@ class BankStatement(models.Model):
     def __str__(self) -> str:
         return f"{self.account.name} ({self.uploaded_at:%Y-%m-%d})"
 
+    @classmethod
+    def source_type_for(cls, filename: str) -> str:
+        ext = (filename or "").rsplit(".", 1)[-1].lower()
+        return cls.EXTENSION_SOURCE_TYPES.get(ext, cls.SOURCE_CSV)
+
+    def save(self, *args, **kwargs):
+        if self.file_hash and self.source_file and not self.source_file._committed:
+            # Storing a new file may reuse a content-addressed one: hold its hash's lock until
+            # this row commits, so a concurrent release can't delete the file in between
+            with transaction.atomic():
+                StatementFileLock.acquire(self.file_hash)
+                return super().save(*args, **kwargs)
+        return super().save(*args, **kwargs)
+
+
+class StatementFileLock(models.Model):
+    """
+    One row per statement file hash. Taking it (acquire(), inside a transaction) serializes
+    reusing a content-addressed file against deleting it once unreferenced (budget.signals).
+    """
+
+    file_hash = models.CharField(max_length=64, unique=True)
+    locked_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def acquire(cls, file_hash: str) -> None:
+        cls.objects.bulk_create([cls(file_hash=file_hash)], ignore_conflicts=True)
+        # The UPDATE takes the row lock (the database write lock on SQLite) until commit
+        cls.objects.filter(file_hash=file_hash).update(locked_at=timezone.now())
+
 
 class Transaction(models.Model):
     """
@@ -147,6 +193,12 @@ class Transaction(models.Model):
     balance = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
     raw_reference = models.CharField(max_length=120, blank=True)  # bank-provided ID if present
 
+    # Normalized description (budget.recurring.normalize_description), groups charges by merchant
+    merchant_key = models.CharField(max_length=120, blank=True)
+
+    # Bit Tag.bit set for each of the user's tags on this row (budget.tags)
+    tags_mask = models.BigIntegerField(default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -154,7 +206,253 @@ class Transaction(models.Model):
         indexes = [
             models.Index(fields=["user", "transaction_date"]),
             models.Index(fields=["account", "transaction_date"]),
+            models.Index(fields=["user", "merchant_key"]),
         ]
 
     def __str__(self) -> str:
         return f"{self.transaction_date} {self.description[:40]} {self.amount}"
+
+
+class ArchivedTransaction(models.Model):
+    """
+    Transactions of past years moved out of the hot table by `manage.py archive_transactions`
+    (budget.archive), keeping their ids. Same columns minus created_at; is_transfer stands in
+    for the TransferLink (both sides of a transfer are archived together). Reports read these
+    rows only when their date range reaches them (budget.archive.transaction_sources).
+    """
+
+    id = models.BigIntegerField(primary_key=True)  # the Transaction id it had
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="archived_transactions")
+    account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name="archived_transactions")
+    statement = models.ForeignKey(BankStatement, on_delete=models.CASCADE, related_name="archived_transactions")
+
+    transaction_date = models.DateField()
+    description = models.CharField(max_length=500)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    balance = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    raw_reference = models.CharField(max_length=120, blank=True)
+    merchant_key = models.CharField(max_length=120, blank=True)
+    tags_mask = models.BigIntegerField(default=0)
+    is_transfer = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["-transaction_date", "-id"]
+        indexes = [
+            models.Index(fields=["user", "transaction_date"]),
+            models.Index(fields=["user", "merchant_key"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.transaction_date} {self.description[:40]} {self.amount} (archived)"
+
+
+class DataVersion(models.Model):
+    """
+    Per-user counter bumped whenever the user's financial data changes (import, statement
+    delete, account edits). Read APIs derive ETag/Last-Modified from it, so an unchanged
+    poll costs one lookup.
+    """
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="data_version")
+    version = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.user_id} v{self.version}"
+
+
+class FxRate(models.Model):
+    """
+    Value of one unit of `currency` in settings.FX_PIVOT_CURRENCY, from rate_date until the
+    next rate for that currency. Loaded from a local CSV (manage.py load_fx_rates).
+    """
+
+    currency = models.CharField(max_length=3)
+    rate_date = models.DateField()
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+
+    class Meta:
+        ordering = ["currency", "rate_date"]
+        constraints = [
+            models.UniqueConstraint(fields=["currency", "rate_date"], name="uniq_fxrate_currency_date")
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.currency} {self.rate_date} {self.rate}"
+
+
+class FxRateVersion(models.Model):
+    """
+    Single row (pk=1) counting changes to FxRate. Every process compares it with the version
+    its cached FxTable was built from (budget.fx.get_fx_table), so a reload reaches them all.
+    """
+
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"FX rates v{self.version}"
+
+
+class UserPreferences(models.Model):
+    """
+    Per-user settings for reporting. Reports convert every account's currency into base_currency.
+    """
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="budget_preferences")
+    base_currency = models.CharField(max_length=3, default="USD")
+
+    class Meta:
+        verbose_name_plural = "user preferences"
+
+    def __str__(self) -> str:
+        return f"{self.user_id} ({self.base_currency})"
+
+
+class RecurringSeries(models.Model):
+    """
+    A detected recurring charge/deposit (subscription, bill, paycheck): transactions with the
+    same merchant_key and amount band at a regular cadence. Maintained by budget.recurring.
+    """
+
+    WEEKLY = "weekly"
+    BIWEEKLY = "biweekly"
+    MONTHLY = "monthly"
+    QUARTERLY = "quarterly"
+    ANNUAL = "annual"
+
+    CADENCE_CHOICES = [
+        (WEEKLY, "Weekly"),
+        (BIWEEKLY, "Every 2 weeks"),
+        (MONTHLY, "Monthly"),
+        (QUARTERLY, "Quarterly"),
+        (ANNUAL, "Annual"),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="recurring_series")
+    account = models.ForeignKey(Account, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    merchant_key = models.CharField(max_length=120)
+    amount_band = models.IntegerField()
+    sample_description = models.CharField(max_length=200, blank=True)
+
+    cadence = models.CharField(max_length=12, choices=CADENCE_CHOICES)
+    interval_days = models.FloatField()
+    typical_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    occurrences = models.PositiveIntegerField()
+    first_date = models.DateField()
+    last_date = models.DateField()
+    next_expected_date = models.DateField()
+    confidence = models.FloatField()
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["next_expected_date"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "merchant_key", "amount_band"], name="uniq_recurring_user_key_band"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.sample_description or self.merchant_key} ({self.cadence}, {self.typical_amount})"
+
+
+class TransferLink(models.Model):
+    """
+    Pairs the two sides of a transfer between a user's own accounts (e.g. checking -X and
+    credit card +X), so reports can leave both out of income/expense. Maintained by
+    budget.transfers.
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="transfer_links")
+    outflow = models.OneToOneField(Transaction, on_delete=models.CASCADE, related_name="transfer_out")
+    inflow = models.OneToOneField(Transaction, on_delete=models.CASCADE, related_name="transfer_in")
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    day_gap = models.PositiveSmallIntegerField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"{self.outflow_id} -> {self.inflow_id} ({self.amount})"
+
+
+class Tag(models.Model):
+    """
+    User-defined label (tax-deductible, reimbursable, trip-x). Membership is stored as bit
+    `bit` of Transaction.tags_mask, so multi-tag filters are one bitwise comparison instead of
+    joins. At most 63 per user: bits 0-62 keep the signed 64-bit column non-negative.
+    """
+
+    MAX_PER_USER = 63
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="tags")
+    name = models.CharField(max_length=60)
+    bit = models.PositiveSmallIntegerField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["name"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "name"], name="uniq_tag_user_name"),
+            models.UniqueConstraint(fields=["user", "bit"], name="uniq_tag_user_bit"),
+            models.CheckConstraint(check=models.Q(bit__lt=63), name="tag_bit_range"),
+        ]
+
+    def __str__(self) -> str:
+        return self.name
+
+    @property
+    def mask(self) -> int:
+        return 1 << self.bit
+
+
+class Envelope(models.Model):
+    """
+    A monthly spending budget. Scope: a category (Tag), an account type, both (tagged spending
+    in that account type) or neither (all spending). Matched transfers never count. Actual
+    spend per month is kept in EnvelopeMonth by budget.envelopes, in the envelope's currency.
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="envelopes")
+    name = models.CharField(max_length=100)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, blank=True, null=True, related_name="envelopes")
+    account_type = models.CharField(max_length=20, choices=Account.ACCOUNT_TYPE_CHOICES, blank=True)
+    monthly_limit = models.DecimalField(max_digits=12, decimal_places=2)
+    currency = models.CharField(max_length=3)  # the user's base currency when it was created
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["name"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "name"], name="uniq_envelope_user_name")
+        ]
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class EnvelopeMonth(models.Model):
+    """
+    Running actual spend of one envelope in one calendar month. Imports add their delta to
+    `actual`; pages read these rows instead of aggregating Transaction.
+    """
+
+    envelope = models.ForeignKey(Envelope, on_delete=models.CASCADE, related_name="months")
+    month = models.DateField()  # first day of the month
+    actual = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # spend, positive
+    overspent_at = models.DateTimeField(blank=True, null=True)  # when actual first passed the limit
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-month"]
+        constraints = [
+            models.UniqueConstraint(fields=["envelope", "month"], name="uniq_envelope_month")
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.envelope_id} {self.month:%Y-%m} {self.actual}"
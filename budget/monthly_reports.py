@@ -0,0 +1,314 @@
+"""
+Month-end summary PDFs for every user (manage.py render_monthly_reports).
+
+Data is fetched per chunk of users with a fixed number of grouped queries (never one
+query set per user) and handed to a process pool as plain dicts. Each worker imports
+WeasyPrint and compiles the report stylesheet on its first report, then renders many reports
+with it; a renderer that fails to load fails that worker's reports (with the real error), not
+the pool. Files are written to a temp name and renamed into place, so an existing report is always
+complete and a re-run skips it: an interrupted run resumes where it stopped.
+"""
+import calendar
+import logging
+import os
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from itertools import chain
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import Count, Q, Sum
+from django.template.loader import render_to_string
+
+from .archive import transaction_sources
+from .fx import FxRateMissing, get_fx_table
+from .models import RecurringSeries, UserPreferences
+from .transfers import exclude_transfers
+
+
+logger = logging.getLogger(__name__)
+
+USER_CHUNK = 500
+TOP_MERCHANTS = 10
+
+
+@dataclass
+class RenderResult:
+    rendered: int = 0
+    skipped: int = 0
+    failed: Dict[int, str] = field(default_factory=dict)  # user id -> error
+
+
+def parse_month(value: str) -> Tuple[date, date]:
+    """
+    'YYYY-MM' -> (first day, last day).
+    """
+    try:
+        year, month = (int(part) for part in value.split("-"))
+        first = date(year, month, 1)
+    except ValueError:
+        raise ValueError(f"Expected YYYY-MM, got {value!r}.")
+    return first, date(year, month, calendar.monthrange(year, month)[1])
+
+
+def reports_dir() -> Path:
+    return Path(getattr(settings, "MONTHLY_REPORTS_DIR", Path(settings.MEDIA_ROOT) / "monthly_reports"))
+
+
+def report_path(first: date, user_id: int) -> Path:
+    return reports_dir() / first.strftime("%Y-%m") / f"user-{user_id}.pdf"
+
+
+def users_with_activity(first: date, last: date) -> List[int]:
+    users = set()
+    for qs in transaction_sources(first, last):
+        users.update(qs.order_by().values_list("user_id", flat=True).distinct())
+    return sorted(users)
+
+
+def collect_month_data(user_ids: List[int], first: date, last: date) -> Dict[int, dict]:
+    """
+    Report context for each user in user_ids, from five grouped queries regardless of how
+    many users there are (two more for a month that reaches the archive). Matched transfers
+    are left out of income/expense. Totals and the top merchants are in the user's base
+    currency, converted at each day's rate.
+    """
+    sources = [exclude_transfers(qs) for qs in transaction_sources(first, last, user_id__in=user_ids)]
+    users = get_user_model().objects.filter(pk__in=user_ids).values_list("pk", "username", "email")
+    bases = dict(UserPreferences.objects.filter(user_id__in=user_ids).values_list("user_id", "base_currency"))
+    default_base = getattr(settings, "DEFAULT_BASE_CURRENCY", "USD")
+
+    reports = {
+        pk: {
+            "user_id": pk,
+            "username": username,
+            "email": email,
+            "month": first,
+            "base_currency": (bases.get(pk) or default_base).upper(),
+            "accounts": {},
+            "income": Decimal(0),
+            "expense": Decimal(0),
+            "count": 0,
+            "merchants": [],
+            "upcoming": [],
+            "warnings": [],
+        }
+        for pk, username, email in users
+    }
+
+    # Per (user, account, day): accounts in native currency, totals in the user's base currency
+    daily = [
+        qs.values("user_id", "account_id", "transaction_date")
+        .annotate(
+            income=Sum("amount", filter=Q(amount__gt=0)),
+            expense=Sum("amount", filter=Q(amount__lt=0)),
+            count=Count("id"),
+        )
+        .order_by()
+        .values_list(
+            "user_id", "account_id", "account__name", "account__currency", "transaction_date", "income", "expense", "count"
+        )
+        for qs in sources
+    ]
+    table = get_fx_table()
+    converters = {}
+
+    def to_base(report: dict, amount, currency: str, day: date) -> Optional[Decimal]:
+        base = report["base_currency"]
+        convert = converters.get(base) or converters.setdefault(base, table.converter(base))
+        try:
+            return convert(amount, currency, day)
+        except FxRateMissing as e:
+            if str(e) not in report["warnings"]:
+                report["warnings"].append(str(e))
+            return None
+
+    rows = chain.from_iterable(qs.iterator(chunk_size=5000) for qs in daily)
+    for user_id, account_id, name, currency, day, income, expense, count in rows:
+        report = reports[user_id]
+        account = report["accounts"].setdefault(
+            account_id,
+            {"name": name, "currency": currency, "income": Decimal(0), "expense": Decimal(0), "count": 0},
+        )
+        account["income"] += income or 0
+        account["expense"] += expense or 0
+        account["count"] += count
+        report["count"] += count
+
+        converted = [to_base(report, amount or 0, currency, day) for amount in (income, expense)]
+        if None not in converted:
+            report["income"] += converted[0]
+            report["expense"] += converted[1]
+
+    # Ranked in the base currency: 100 EUR and 100 JPY are not the same spend
+    merchants = {}
+    for qs in sources:
+        grouped = (
+            qs.filter(amount__lt=0)
+            .values("user_id", "merchant_key", "account__currency", "transaction_date")
+            .annotate(spend=Sum("amount"), count=Count("id"))
+            .order_by()
+            .values_list("user_id", "merchant_key", "account__currency", "transaction_date", "spend", "count")
+        )
+        for user_id, key, currency, day, spend, count in grouped.iterator(chunk_size=5000):
+            spend = to_base(reports[user_id], -spend, currency, day)
+            if spend is None:
+                continue
+            total = merchants.setdefault((user_id, key), [Decimal(0), 0])
+            total[0] += spend
+            total[1] += count
+    for (user_id, key), (spend, count) in sorted(merchants.items(), key=lambda item: -item[1][0]):
+        report = reports[user_id]
+        if len(report["merchants"]) < TOP_MERCHANTS:
+            report["merchants"].append(
+                {"merchant": key or "(unknown)", "currency": report["base_currency"], "spend": spend, "count": count}
+            )
+
+    next_first = last.toordinal() + 1
+    upcoming = (
+        RecurringSeries.objects.filter(
+            user_id__in=user_ids,
+            next_expected_date__gte=date.fromordinal(next_first),
+            next_expected_date__lt=date.fromordinal(next_first + 31),
+        )
+        .order_by("user_id", "next_expected_date")
+        .values_list("user_id", "sample_description", "merchant_key", "typical_amount", "next_expected_date")
+    )
+    for user_id, description, key, amount, expected in upcoming:
+        reports[user_id]["upcoming"].append({"description": description or key, "amount": amount, "date": expected})
+
+    for report in reports.values():
+        report["accounts"] = sorted(report["accounts"].values(), key=lambda a: a["name"])
+        report["net"] = report["income"] + report["expense"]
+    return reports
+
+
+# ---- worker side -------------------------------------------------------------------------
+
+_worker = {}
+
+
+def _init_worker():
+    """
+    Runs once per worker. Must not fail: an initializer error breaks the whole pool, so the
+    renderer is loaded by the first render_report instead.
+    """
+    import django
+
+    django.setup()
+    connections.close_all()
+
+
+def _load_renderer():
+    """
+    WeasyPrint's import and the stylesheet/font setup are the expensive parts, so every
+    report in this process reuses them.
+    """
+    if _worker:
+        return
+    from weasyprint import CSS, HTML
+    from weasyprint.text.fonts import FontConfiguration
+
+    fonts = FontConfiguration()
+    _worker["HTML"] = HTML
+    _worker["fonts"] = fonts
+    _worker["css"] = CSS(string=render_to_string("budget/monthly_report.css"), font_config=fonts)
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def render_report(report: dict, path: str) -> int:
+    """
+    Renders one report to `path`. Returns its user id.
+    """
+    _load_renderer()
+    html = render_to_string("budget/monthly_report.html", {"report": report})
+    pdf = _worker["HTML"](string=html).write_pdf(stylesheets=[_worker["css"]], font_config=_worker["fonts"])
+    write_atomic(Path(path), pdf)
+    return report["user_id"]
+
+
+# ---- driver ------------------------------------------------------------------------------
+
+def render_monthly_reports(
+    month: str,
+    user_ids: Optional[Iterable[int]] = None,
+    workers: int = 1,
+    force: bool = False,
+    progress=None,
+) -> RenderResult:
+    """
+    Renders the month's report for every user with activity (or just user_ids), skipping
+    users whose report already exists unless force. `progress(user_id, error)` is called
+    per finished report, with error None on success.
+    """
+    first, last = parse_month(month)
+    candidates = sorted(user_ids) if user_ids else users_with_activity(first, last)
+    result = RenderResult()
+
+    todo = []
+    for user_id in candidates:
+        if not force and report_path(first, user_id).exists():
+            result.skipped += 1
+        else:
+            todo.append(user_id)
+
+    def done(user_id: int, error: Optional[BaseException] = None):
+        if error is None:
+            result.rendered += 1
+        else:
+            logger.error("Monthly report for user %s failed", user_id, exc_info=error)
+            result.failed[user_id] = f"{type(error).__name__}: {error}"
+        if progress:
+            progress(user_id, result.failed.get(user_id))
+
+    chunks = [todo[i:i + USER_CHUNK] for i in range(0, len(todo), USER_CHUNK)]
+    if workers <= 1:
+        for chunk in chunks:
+            for user_id, report in collect_month_data(chunk, first, last).items():
+                try:
+                    render_report(report, str(report_path(first, user_id)))
+                except Exception as e:
+                    done(user_id, e)
+                else:
+                    done(user_id)
+        return result
+
+    pending = {}
+
+    def drain(limit: int):
+        while len(pending) > limit:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                user_id = pending.pop(future)
+                error = future.exception()
+                done(user_id, error)
+
+    # Children must open their own connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for chunk in chunks:
+            for user_id, report in collect_month_data(chunk, first, last).items():
+                pending[pool.submit(render_report, report, str(report_path(first, user_id)))] = user_id
+            # Keep about one chunk queued, so the pool stays busy while the next one is fetched
+            drain(USER_CHUNK)
+        drain(0)
+    return result
@@ -0,0 +1,155 @@
+"""
+Streaming OFX/QFX reader (OFX 1.x SGML and 2.x XML).
+
+The document is never built into a tree: a tokenizer turns chunks of the byte stream into
+start/end/text events and a small state machine keeps only the fields of the STMTTRN record
+it is in. SGML leaf elements have no end tags (<TRNAMT>-12.00<FITID>...), so a leaf's value
+is simply the text that follows its start tag; the same rule reads XML too.
+"""
+import codecs
+import html
+import re
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+
+CHUNK_SIZE = 64 * 1024
+HEADER_BYTES = 4096  # enough for the SGML header / XML prolog in one read
+
+# OFX 1.x CHARSET header values that are not Python codec names
+_SGML_CHARSETS = {"1252": "cp1252", "ISO-8859-1": "latin-1", "NONE": "cp1252"}
+_XML_ENCODING = re.compile(rb"""encoding\s*=\s*["']([A-Za-z0-9._-]+)["']""")
+
+START, END, TEXT = "start", "end", "text"
+
+
+@dataclass
+class OfxStatementInfo:
+    """
+    Header-level data, filled in as the stream is read (complete once records are exhausted).
+    """
+
+    version: int = 0
+    currency: str = ""
+    start_date: str = ""  # raw OFX datetimes, earliest DTSTART / latest DTEND seen
+    end_date: str = ""
+    account_ids: List[str] = field(default_factory=list)
+
+
+def _detect_encoding(head: bytes) -> Tuple[int, str]:
+    """
+    (OFX major version, codec) from the first bytes of the file.
+    """
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if text.startswith(b"<?xml") or text.upper().startswith(b"<?OFX"):
+        match = _XML_ENCODING.search(head[:512])
+        return 2, (match.group(1).decode("ascii") if match else "utf-8")
+    encoding, charset = "USASCII", "1252"
+    for line in text[:1024].splitlines():
+        key, _, value = line.decode("ascii", "replace").partition(":")
+        if key.strip().upper() == "ENCODING":
+            encoding = value.strip().upper()
+        elif key.strip().upper() == "CHARSET":
+            charset = value.strip().upper()
+    if encoding in ("UTF-8", "UNICODE"):
+        return 1, "utf-8"
+    return 1, _SGML_CHARSETS.get(charset, "cp1252")
+
+
+def iter_tokens(stream: BinaryIO, info: Optional[OfxStatementInfo] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Yields (START, NAME), (END, NAME) and (TEXT, value) from an OFX byte stream, reading it
+    CHUNK_SIZE bytes at a time. Headers, processing instructions and comments are skipped.
+    """
+    head = stream.read(max(CHUNK_SIZE, HEADER_BYTES))
+    version, codec = _detect_encoding(head)
+    if info is not None:
+        info.version = version
+
+    decoder = codecs.getincrementaldecoder(codec)(errors="replace")
+    buf = decoder.decode(head)
+    # Everything before the first tag is the SGML header (or XML prolog whitespace)
+    start = buf.find("<")
+    buf = buf[start:] if start >= 0 else ""
+    eof = not head
+
+    while True:
+        pos = 0
+        n = len(buf)
+        while pos < n:
+            if buf[pos] == "<":
+                if buf.startswith("<!--", pos):
+                    close = buf.find("-->", pos + 4)
+                    if close < 0:
+                        break
+                    pos = close + 3
+                    continue
+                close = buf.find(">", pos + 1)
+                if close < 0:
+                    break
+                tag = buf[pos + 1:close].strip()
+                pos = close + 1
+                if not tag or tag[0] in "?!":
+                    continue
+                if tag[0] == "/":
+                    yield END, tag[1:].strip().upper()
+                    continue
+                name = tag.split(None, 1)[0].rstrip("/").upper()
+                yield START, name
+                if tag.endswith("/"):
+                    yield END, name
+            else:
+                nxt = buf.find("<", pos)
+                if nxt < 0 and not eof:
+                    break  # the text may continue in the next chunk
+                end = n if nxt < 0 else nxt
+                text = buf[pos:end].strip()
+                if text:
+                    yield TEXT, html.unescape(text)
+                pos = end
+        if eof:
+            return
+        chunk = stream.read(CHUNK_SIZE)
+        eof = not chunk
+        buf = buf[pos:] + decoder.decode(chunk, final=eof)
+
+
+def iter_transactions(stream: BinaryIO, info: Optional[OfxStatementInfo] = None) -> Iterator[Dict[str, str]]:
+    """
+    Yields each STMTTRN as {FIELD: raw value} (e.g. DTPOSTED, TRNAMT, FITID, NAME, MEMO).
+    `info` receives CURDEF, ACCTID and the BANKTRANLIST DTSTART/DTEND range as they stream by.
+    """
+    info = info if info is not None else OfxStatementInfo()
+    record: Optional[Dict[str, str]] = None
+    leaf: Optional[str] = None
+    in_tranlist = False
+
+    for kind, value in iter_tokens(stream, info):
+        if kind == TEXT:
+            if leaf is None:
+                continue
+            if record is not None:
+                record[leaf] = value
+            elif leaf == "CURDEF" and not info.currency:
+                info.currency = value.upper()
+            elif leaf == "ACCTID" and value not in info.account_ids:
+                info.account_ids.append(value)
+            elif in_tranlist and leaf == "DTSTART":
+                info.start_date = min(info.start_date, value) if info.start_date else value
+            elif in_tranlist and leaf == "DTEND":
+                info.end_date = max(info.end_date, value)
+            leaf = None
+        elif kind == START:
+            if value == "STMTTRN":
+                record, leaf = {}, None
+            elif value == "BANKTRANLIST":
+                in_tranlist, leaf = True, None
+            else:
+                leaf = value
+        else:
+            leaf = None
+            if value == "STMTTRN" and record is not None:
+                yield record
+                record = None
+            elif value == "BANKTRANLIST":
+                in_tranlist = False
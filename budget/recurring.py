@@ -0,0 +1,148 @@
+"""
+Recurring transaction / subscription detection.
+
+Transactions are grouped by (merchant_key, amount band), each group is sorted by date and
+its gaps are matched against known cadences: O(n log n) overall, no pairwise comparison.
+After an import only the groups whose merchant_key appears in the new statement are
+re-evaluated (Transaction.merchant_key is indexed per user).
+"""
+import heapq
+import math
+import re
+from datetime import timedelta
+from statistics import median
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction as db_transaction
+
+from .models import ArchivedTransaction, RecurringSeries, Transaction
+
+
+# name, expected gap in days, tolerance in days
+CADENCES = [
+    (RecurringSeries.WEEKLY, 7, 1.5),
+    (RecurringSeries.BIWEEKLY, 14, 2),
+    (RecurringSeries.MONTHLY, 30.44, 3.5),
+    (RecurringSeries.QUARTERLY, 91.3, 6),
+    (RecurringSeries.ANNUAL, 365.25, 8),
+]
+MIN_OCCURRENCES = {RecurringSeries.ANNUAL: 2}
+DEFAULT_MIN_OCCURRENCES = 3
+MIN_CONFIDENCE = 0.6
+
+# Amounts within ~25% of each other share a band
+BAND_BASE = math.log(1.25)
+
+# Card-processor noise that varies between charges of the same merchant
+_NOISE = {
+    "pos", "debit", "credit", "purchase", "card", "ach", "recurring", "payment", "pmt", "autopay",
+    "online", "web", "www", "com", "inc", "llc", "ltd", "co", "the", "xx", "xxxx",
+}
+_NON_ALPHA = re.compile(r"[^a-z]+")
+LOOKUP_CHUNK = 500
+
+
+def normalize_description(description: str) -> str:
+    """
+    'NETFLIX.COM 866-579-7172 CA #1234' -> 'netflix ca'. Drops digits, punctuation and noise words.
+    """
+    tokens = [t for t in _NON_ALPHA.split((description or "").lower()) if len(t) > 1 and t not in _NOISE]
+    return " ".join(tokens[:5])[:120]
+
+
+def amount_band(amount) -> int:
+    a = float(amount)
+    if a == 0:
+        return 0
+    band = int(math.floor(math.log(abs(a)) / BAND_BASE)) + 1
+    return band if a > 0 else -band
+
+
+def classify(dates: List) -> Optional[Tuple[str, float, float]]:
+    """
+    dates: sorted, de-duplicated. Returns (cadence, median gap, confidence) or None.
+    """
+    if len(dates) < 2:
+        return None
+    gaps = [(b - a).days for a, b in zip(dates, dates[1:])]
+    typical = median(gaps)
+    for cadence, expected, tolerance in CADENCES:
+        if abs(typical - expected) > tolerance:
+            continue
+        if len(dates) < MIN_OCCURRENCES.get(cadence, DEFAULT_MIN_OCCURRENCES):
+            return None
+        on_cadence = sum(1 for g in gaps if abs(g - expected) <= tolerance)
+        confidence = on_cadence / len(gaps)
+        if confidence < MIN_CONFIDENCE:
+            return None
+        return cadence, typical, confidence
+    return None
+
+
+def _series_from_group(user_id: int, key: str, band: int, rows: List[tuple]) -> Optional[RecurringSeries]:
+    # rows: (date, amount, account_id, description), already sorted by date
+    dates = sorted({r[0] for r in rows})
+    found = classify(dates)
+    if found is None:
+        return None
+    cadence, gap, confidence = found
+    amounts = sorted(r[1] for r in rows)
+    accounts: Dict[int, int] = {}
+    for r in rows:
+        accounts[r[2]] = accounts.get(r[2], 0) + 1
+    return RecurringSeries(
+        user_id=user_id,
+        merchant_key=key,
+        amount_band=band,
+        cadence=cadence,
+        interval_days=gap,
+        typical_amount=amounts[len(amounts) // 2],
+        occurrences=len(dates),
+        first_date=dates[0],
+        last_date=dates[-1],
+        next_expected_date=dates[-1] + timedelta(days=round(gap)),
+        confidence=round(confidence, 3),
+        account_id=max(accounts, key=accounts.get),
+        sample_description=rows[-1][3][:200],
+    )
+
+
+def evaluate_groups(user_id: int, merchant_keys: Iterable[str]) -> int:
+    """
+    Re-detects series for the given merchant keys of one user and replaces their stored rows.
+    Returns the number of series now stored for those keys.
+    """
+    keys = sorted({k for k in merchant_keys if k})
+    if not keys:
+        return 0
+
+    groups: Dict[Tuple[str, int], List[tuple]] = {}
+    for start in range(0, len(keys), LOOKUP_CHUNK):
+        # Archived years are history too (a yearly charge needs them); merged in date order
+        sources = [
+            model.objects.filter(user_id=user_id, merchant_key__in=keys[start:start + LOOKUP_CHUNK])
+            .order_by("merchant_key", "transaction_date")
+            .values_list("merchant_key", "transaction_date", "amount", "account_id", "description")
+            .iterator(chunk_size=5000)
+            for model in (ArchivedTransaction, Transaction)
+        ]
+        for key, txn_date, amount, account_id, description in heapq.merge(*sources, key=lambda row: row[:2]):
+            groups.setdefault((key, amount_band(amount)), []).append((txn_date, amount, account_id, description))
+
+    series = [
+        s for (key, band), rows in groups.items()
+        if (s := _series_from_group(user_id, key, band, rows)) is not None
+    ]
+
+    with db_transaction.atomic():
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            RecurringSeries.objects.filter(user_id=user_id, merchant_key__in=keys[start:start + LOOKUP_CHUNK]).delete()
+        RecurringSeries.objects.bulk_create(series, batch_size=500)
+    return len(series)
+
+
+def detect_for_transactions(user_id: int, transactions: Iterable[Transaction]) -> int:
+    """
+    Incremental entry point after an import: only the groups the new rows belong to.
+    """
+    return evaluate_groups(user_id, {t.merchant_key for t in transactions})
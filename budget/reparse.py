@@ -0,0 +1,228 @@
+"""
+Re-importing statements after a Bank mapping change.
+
+A statement is stale when its mapping_version_used is older than its bank's current
+mapping_version. Re-parsing reads each file again from source_file, then replaces the
+batch's transactions: one set-based DELETE (no collector, nothing loaded into memory)
+followed by the normal batched insert. A file that no longer parses keeps its old rows.
+"""
+import logging
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import connection, connections, transaction as db_transaction
+from django.db.models import F, Q, QuerySet
+
+from .envelopes import refresh_envelopes
+from .importers import ParsedStatement, parse_statement_csv, save_parsed_statement
+from .instrumentation import ImportMetrics
+from .models import ArchivedTransaction, BankStatement, Transaction, TransferLink
+from .recurring import evaluate_groups
+from .transfers import window_days
+from .versioning import bump_data_version
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReparseResult:
+    statements: int = 0
+    deleted: int = 0
+    created: int = 0
+    failed: List[int] = field(default_factory=list)
+
+    def merge(self, other: "ReparseResult") -> None:
+        self.statements += other.statements
+        self.deleted += other.deleted
+        self.created += other.created
+        self.failed.extend(other.failed)
+
+
+def stale_statements(qs: QuerySet = None) -> QuerySet:
+    """
+    CSV statements parsed with an older mapping_version than their bank's current one.
+    """
+    qs = BankStatement.objects.all() if qs is None else qs
+    return qs.filter(
+        source_type=BankStatement.SOURCE_CSV,
+        mapping_version_used__lt=F("account__bank__mapping_version"),
+    )
+
+
+def delete_statement_transactions(statement_ids: Iterable[int]) -> int:
+    """
+    DELETE FROM budget_transaction WHERE statement_id IN (SELECT ...), bypassing the
+    collector. Anything that references Transaction rows must be cleared here first.
+    """
+    statement_ids = list(statement_ids)
+    # The other side of a removed link is matched again when the new rows are saved
+    TransferLink.objects.filter(
+        Q(outflow__statement_id__in=statement_ids) | Q(inflow__statement_id__in=statement_ids)
+    ).delete()
+    statements_sql, params = BankStatement.objects.filter(pk__in=statement_ids).values("pk").query.sql_with_params()
+    deleted = 0
+    with connection.cursor() as cursor:
+        # Re-imported rows go to the hot table, even for statements of archived years
+        for model in (Transaction, ArchivedTransaction):
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)} "
+                f"WHERE {connection.ops.quote_name(model._meta.get_field('statement').column)} IN ({statements_sql})",
+                params,
+            )
+            deleted += cursor.rowcount
+    return deleted
+
+
+def old_ranges(statements: Iterable[BankStatement]) -> Dict[int, Tuple[Optional[date], Optional[date]]]:
+    """
+    {user_id: (start, end)} spanning the statements' recorded date ranges; (None, None) when
+    any of them has no range.
+    """
+    ranges = {}
+    for stmt in statements:
+        start, end = stmt.statement_start_date, stmt.statement_end_date
+        if stmt.user_id in ranges:
+            old_start, old_end = ranges[stmt.user_id]
+            if not (start and old_start):
+                start = end = None
+            else:
+                start, end = min(start, old_start), max(end, old_end)
+        ranges[stmt.user_id] = (start, end)
+    return ranges
+
+
+def parse_batch(statement_ids: List[int]) -> List[Tuple[BankStatement, ParsedStatement, ImportMetrics]]:
+    """
+    Parse phase for a batch (read-only, safe to run in worker processes).
+    """
+    parsed = []
+    statements = BankStatement.objects.filter(pk__in=statement_ids).select_related("account__bank", "user")
+    for stmt in statements:
+        metrics = ImportMetrics()
+        try:
+            with metrics.count_queries():
+                result = parse_statement_csv(stmt, metrics)
+        except Exception as e:  # unreadable file etc.; keep going with the batch
+            logger.exception("Re-parse of statement %s failed", stmt.pk)
+            result = ParsedStatement(None, [str(e)])
+        parsed.append((stmt, result, metrics))
+    return parsed
+
+
+def write_batch(parsed: List[Tuple[BankStatement, ParsedStatement, ImportMetrics]]) -> ReparseResult:
+    """
+    Write phase for a batch, in one DB transaction: set-based delete of the old rows, then
+    insert the new ones. A statement whose file no longer parses keeps its old rows and
+    mapping version (so it stays stale and is retried), with the error in parse_error.
+    """
+    result = ReparseResult(statements=len(parsed))
+    unreadable = [(stmt, parsed_statement) for stmt, parsed_statement, _ in parsed if parsed_statement.transactions is None]
+    parsed = [entry for entry in parsed if entry[1].transactions is not None]
+    ids = [stmt.pk for stmt, _, _ in parsed]
+    with db_transaction.atomic():
+        for stmt, parsed_statement in unreadable:
+            result.failed.append(stmt.pk)
+            BankStatement.objects.filter(pk=stmt.pk).update(parse_error="\n".join(parsed_statement.errors)[:2000])
+        if not ids:
+            return result
+
+        # Merchants that only the old rows had still need their recurring series re-checked
+        old_keys = {}
+        # Tags live on the rows being replaced; carry them over to identical new rows
+        tagged = {}
+        for model in (Transaction, ArchivedTransaction):
+            rows = model.objects.filter(statement_id__in=ids)
+            for user_id, key in rows.values_list("user_id", "merchant_key").distinct():
+                old_keys.setdefault(user_id, set()).add(key)
+            for *key, mask in rows.filter(tags_mask__gt=0).values_list(
+                "statement_id", "transaction_date", "amount", "description", "raw_reference", "tags_mask"
+            ):
+                tagged.setdefault(tuple(key), []).append(mask)
+
+        result.deleted = delete_statement_transactions(ids)
+        # Mark the data changed before any re-insert (the analytics snapshot only appends)
+        for user_id in {stmt.user_id for stmt, _, _ in parsed}:
+            bump_data_version(user_id)
+        BankStatement.objects.filter(pk__in=ids).update(
+            parsed_ok=False, row_count=0, statement_start_date=None, statement_end_date=None
+        )
+        # Budgets lose the old rows (and regain their unlinked transfer counterparts, up to the
+        # match window away) here; the new rows are added by delta as each is saved
+        window = timedelta(days=window_days())
+        for user_id, (start, end) in old_ranges(stmt for stmt, _, _ in parsed).items():
+            refresh_envelopes(user_id, start=start and start - window, end=end and end + window)
+
+        for stmt, parsed_statement, metrics in parsed:
+            stmt.parsed_ok = False
+            for txn in parsed_statement.transactions or ():
+                masks = tagged.get((stmt.pk, txn.transaction_date, txn.amount, txn.description, txn.raw_reference))
+                if masks:
+                    txn.tags_mask = masks.pop()
+            created, errors = save_parsed_statement(stmt, parsed_statement, metrics)
+            if stmt.parsed_ok:
+                result.created += created
+            else:
+                result.failed.append(stmt.pk)
+                BankStatement.objects.filter(pk=stmt.pk).update(parse_error="\n".join(errors)[:2000])
+
+        for user_id, keys in old_keys.items():
+            evaluate_groups(user_id, keys)
+    return result
+
+
+def _init_worker():
+    import django
+
+    django.setup()
+    connections.close_all()
+
+
+def _parse_batch_in_worker(statement_ids: List[int]):
+    try:
+        return parse_batch(statement_ids)
+    finally:
+        connections.close_all()
+
+
+def reparse_in_batches(statement_ids: List[int], batch_size: int = 50, workers: int = 1, progress=None) -> ReparseResult:
+    """
+    Re-imports statement_ids batch by batch. With workers > 1, batches are parsed in a
+    process pool and this process does every write (SQLite allows one writer at a time).
+    At most 2 * workers batches are in flight, so parsed rows never pile up ahead of the
+    writes. `progress(batch_result)` is called as each batch is written.
+    """
+    batches = [statement_ids[i:i + batch_size] for i in range(0, len(statement_ids), batch_size)]
+    total = ReparseResult()
+
+    def write(parsed):
+        batch_result = write_batch(parsed)
+        total.merge(batch_result)
+        if progress:
+            progress(batch_result)
+
+    if workers <= 1 or len(batches) <= 1:
+        for batch in batches:
+            write(parse_batch(batch))
+        return total
+
+    pending = set()
+
+    def drain(limit: int):
+        nonlocal pending
+        while len(pending) > limit:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                write(future.result())
+
+    # Children must open their own connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for batch in batches:
+            pending.add(pool.submit(_parse_batch_in_worker, batch))
+            # One batch running and one queued per worker
+            drain(2 * workers - 1)
+        drain(0)
+    return total
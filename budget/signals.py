@@ -0,0 +1,123 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Max, Min
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .envelopes import refresh_envelopes
+from .models import (
+    Account, ArchivedTransaction, BankStatement, Envelope, StatementFileLock, Tag, Transaction, UserPreferences,
+)
+from .recurring import evaluate_groups
+from .tags import filter_by_tags, update_tags
+from .transfers import match_transfers, window_days
+from .versioning import bump_data_version
+
+
+def release_statement_file(name: str, file_hash: str, storage) -> None:
+    """
+    Deletes a stored statement file once no BankStatement references it any more.
+    Content-addressed files are shared, so the row count is the reference count. The check
+    and the delete run under the hash's StatementFileLock, which a statement storing the same
+    content holds until it commits: either its row is seen here, or it writes the file anew.
+    """
+    if not name:
+        return
+    with transaction.atomic():
+        StatementFileLock.acquire(file_hash)
+        if BankStatement.objects.filter(file_hash=file_hash, source_file=name).exists():
+            return
+        storage.delete(name)
+
+
+@receiver(pre_delete, sender=BankStatement)
+def remember_statement_merchants(sender, instance: BankStatement, **kwargs):
+    # The transactions are gone by post_delete; keep their keys to re-detect recurring series
+    instance._merchant_keys = set()
+    for model in (Transaction, ArchivedTransaction):
+        instance._merchant_keys.update(
+            model.objects.filter(statement=instance).values_list("merchant_key", flat=True).distinct()
+        )
+
+
+@receiver(pre_delete, sender=BankStatement)
+def remember_statement_dates(sender, instance: BankStatement, **kwargs):
+    instance._date_range = Transaction.objects.filter(statement=instance).aggregate(
+        start=Min("transaction_date"), end=Max("transaction_date")
+    )
+
+
+@receiver(post_delete, sender=BankStatement)
+def recheck_recurring_series(sender, instance: BankStatement, **kwargs):
+    evaluate_groups(instance.user_id, getattr(instance, "_merchant_keys", ()))
+
+
+@receiver(post_delete, sender=BankStatement)
+def rematch_orphaned_transfers(sender, instance: BankStatement, **kwargs):
+    # Counterparts of the deleted rows lost their links; they may pair with something else
+    dates = getattr(instance, "_date_range", None) or {}
+    if dates.get("start"):
+        match_transfers(instance.user_id, dates["start"], dates["end"])
+
+
+@receiver(post_delete, sender=BankStatement)
+def refresh_statement_envelopes(sender, instance: BankStatement, **kwargs):
+    # After rematch_orphaned_transfers: freed counterparts count as spend again unless re-paired
+    start, end = instance.statement_start_date, instance.statement_end_date
+    window = timedelta(days=window_days())
+    refresh_envelopes(instance.user_id, start=start and start - window, end=end and end + window)
+
+
+@receiver(post_delete, sender=BankStatement)
+def delete_unreferenced_statement_file(sender, instance: BankStatement, **kwargs):
+    name, file_hash = instance.source_file.name, instance.file_hash
+    storage = instance.source_file.storage
+    # Only touch the disk once the delete is committed
+    transaction.on_commit(lambda: release_statement_file(name, file_hash, storage))
+    bump_data_version(instance.user_id)
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+@receiver(post_save, sender=UserPreferences)
+def account_changed(sender, instance, **kwargs):
+    bump_data_version(instance.user_id)
+
+
+@receiver(pre_save, sender=Account)
+def remember_account_scope(sender, instance: Account, **kwargs):
+    instance._previous_scope = (
+        Account.objects.filter(pk=instance.pk).values_list("account_type", "currency").first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Account)
+def refresh_account_envelopes(sender, instance: Account, created=False, **kwargs):
+    previous = getattr(instance, "_previous_scope", None)
+    if created or previous is None:
+        return
+    account_type, currency = previous
+    if currency != instance.currency:
+        # Every envelope now converts this account's rows from another currency
+        refresh_envelopes(instance.user_id)
+    elif account_type != instance.account_type:
+        envelopes = Envelope.objects.filter(user_id=instance.user_id).exclude(account_type="").select_related("tag")
+        refresh_envelopes(instance.user_id, envelopes)
+
+
+@receiver(post_save, sender=Envelope)
+def refresh_saved_envelope(sender, instance: Envelope, **kwargs):
+    # New or changed scope/limit: rebuild its months
+    refresh_envelopes(instance.user_id, [instance])
+
+
+@receiver(post_delete, sender=Tag)
+def clear_deleted_tag_bit(sender, instance: Tag, origin=None, **kwargs):
+    # The bit goes to the user's next tag, so no row may keep it
+    if getattr(origin, "model", type(origin)) is get_user_model():
+        return  # the user's transactions are being deleted too
+    for model in (Transaction, ArchivedTransaction):
+        rows = filter_by_tags(model.objects.all(), any_of=instance.mask)
+        update_tags(instance.user_id, rows, remove=instance.mask)
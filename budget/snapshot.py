@@ -0,0 +1,290 @@
+"""
+Per-user columnar snapshot of Transaction for long-range analytics (budget.analytics).
+
+Each column is a .npy file under ANALYTICS_SNAPSHOT_DIR/<user_id>/<generation>/, read back
+with mmap_mode="r", so aggregates over years of rows never go through the ORM. Files are
+preallocated with spare capacity and grown by doubling: an import appends its rows in
+place, then meta.json (row count, merchant names, the DataVersion the snapshot matches) is
+replaced atomically. Readers only look at rows below the row count in the meta they read.
+
+Only imports append. Anything else (statement delete, re-parse, account edit) moves the
+user's DataVersion past the snapshot's, and the next read rebuilds it into a new generation.
+Rebuilds read archived rows (budget.archive) too; archiving itself changes no row.
+"""
+import heapq
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from numpy.lib.format import open_memmap
+
+from .models import ArchivedTransaction, Transaction, TransferLink
+from .versioning import get_data_version
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no advisory locks on Windows
+    fcntl = None
+
+
+FORMAT = 1
+COLUMNS = {
+    "id": np.int64,         # Transaction.pk, ascending
+    "date": np.int32,       # date ordinal
+    "cents": np.int64,      # signed amount in minor units of the account's currency
+    "account": np.int32,
+    "merchant": np.int32,   # index into Snapshot.merchants (merchant_key); 0 is ""
+    "transfer": np.bool_,   # either side of a TransferLink
+}
+MIN_CAPACITY = 1024
+CHUNK_ROWS = 20000
+
+
+@dataclass
+class Snapshot:
+    data_version: int
+    columns: Dict[str, np.ndarray]  # read-only memory maps, already cut to the row count
+    merchants: List[str]
+
+    def __len__(self) -> int:
+        return len(self.columns["id"])
+
+
+def snapshot_root() -> Path:
+    return Path(getattr(settings, "ANALYTICS_SNAPSHOT_DIR", Path(settings.BASE_DIR) / "snapshots"))
+
+
+def _user_dir(user_id: int) -> Path:
+    return snapshot_root() / str(user_id)
+
+
+@contextmanager
+def _locked(user_dir: Path):
+    user_dir.mkdir(parents=True, exist_ok=True)
+    with open(user_dir / ".lock", "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_meta(user_dir: Path) -> Optional[dict]:
+    try:
+        meta = json.loads((user_dir / "meta.json").read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    return meta if meta.get("format") == FORMAT else None
+
+
+def _write_meta(user_dir: Path, meta: dict) -> None:
+    tmp = user_dir / f".meta.{uuid.uuid4().hex}.tmp"
+    tmp.write_text(json.dumps(meta))
+    os.replace(tmp, user_dir / "meta.json")
+
+
+def _open(user_dir: Path, meta: dict) -> Snapshot:
+    gen_dir = user_dir / meta["generation"]
+    rows = meta["rows"]
+    columns = {name: np.load(gen_dir / f"{name}.npy", mmap_mode="r")[:rows] for name in COLUMNS}
+    return Snapshot(meta["data_version"], columns, meta["merchants"])
+
+
+def _new_generation(user_dir: Path, capacity: int) -> str:
+    name = uuid.uuid4().hex[:12]
+    gen_dir = user_dir / name
+    gen_dir.mkdir()
+    for column, dtype in COLUMNS.items():
+        column_file = open_memmap(gen_dir / f"{column}.npy", mode="w+", dtype=dtype, shape=(capacity,))
+        del column_file
+    return name
+
+
+def _ensure_capacity(gen_dir: Path, meta: dict, needed: int) -> None:
+    if needed <= meta["capacity"]:
+        return
+    capacity = max(meta["capacity"] * 2, needed, MIN_CAPACITY)
+    rows = meta["rows"]
+    for column, dtype in COLUMNS.items():
+        path = gen_dir / f"{column}.npy"
+        tmp = gen_dir / f".{column}.grow"
+        grown = open_memmap(tmp, mode="w+", dtype=dtype, shape=(capacity,))
+        if rows:
+            grown[:rows] = np.load(path, mmap_mode="r")[:rows]
+        grown.flush()
+        del grown
+        # Readers holding the old file keep its mapping; new readers see the same first rows
+        os.replace(tmp, path)
+    meta["capacity"] = capacity
+
+
+def _to_columns(rows: List[tuple], meta: dict, merchant_ids: Dict[str, int]) -> Dict[str, np.ndarray]:
+    """
+    rows: (pk, date, amount, account_id, merchant_key, is_transfer), ascending pk.
+    New merchant keys are added to meta["merchants"].
+    """
+    merchants = []
+    for row in rows:
+        key = row[4] or ""
+        index = merchant_ids.get(key)
+        if index is None:
+            index = merchant_ids[key] = len(meta["merchants"])
+            meta["merchants"].append(key)
+        merchants.append(index)
+    return {
+        "id": np.fromiter((r[0] for r in rows), np.int64, len(rows)),
+        "date": np.fromiter((r[1].toordinal() for r in rows), np.int32, len(rows)),
+        "cents": np.fromiter((int(Decimal(r[2]).scaleb(2)) for r in rows), np.int64, len(rows)),
+        "account": np.fromiter((r[3] for r in rows), np.int32, len(rows)),
+        "merchant": np.array(merchants, dtype=np.int32),
+        "transfer": np.fromiter((bool(r[5]) for r in rows), np.bool_, len(rows)),
+    }
+
+
+def _append(gen_dir: Path, meta: dict, columns: Dict[str, np.ndarray]) -> None:
+    n = len(columns["id"])
+    if not n:
+        return
+    start = meta["rows"]
+    _ensure_capacity(gen_dir, meta, start + n)
+    for name in COLUMNS:
+        target = open_memmap(gen_dir / f"{name}.npy", mode="r+")
+        target[start:start + n] = columns[name]
+        target.flush()
+        del target
+    meta["rows"] = start + n
+    meta["last_id"] = int(columns["id"][-1])
+
+
+def _rebuild(user_id: int, user_dir: Path) -> Snapshot:
+    # Read the version first: a change during the scan leaves the snapshot stale, not wrong
+    version, _ = get_data_version(user_id)
+    qs = Transaction.objects.filter(user_id=user_id)
+    archived = ArchivedTransaction.objects.filter(user_id=user_id)
+    count = qs.count() + archived.count()
+    meta = {
+        "format": FORMAT,
+        "data_version": version,
+        "rows": 0,
+        "capacity": max(MIN_CAPACITY, count + count // 4),
+        "last_id": 0,
+        "merchants": [""],
+    }
+    meta["generation"] = _new_generation(user_dir, meta["capacity"])
+    gen_dir = user_dir / meta["generation"]
+    merchant_ids = {"": 0}
+
+    hot = (
+        (pk, txn_date, amount, account_id, key, out_link is not None or in_link is not None)
+        for pk, txn_date, amount, account_id, key, out_link, in_link in qs.order_by("pk").values_list(
+            "pk", "transaction_date", "amount", "account_id", "merchant_key", "transfer_out__id", "transfer_in__id"
+        ).iterator(chunk_size=CHUNK_ROWS)
+    )
+    cold = archived.order_by("pk").values_list(
+        "pk", "transaction_date", "amount", "account_id", "merchant_key", "is_transfer"
+    ).iterator(chunk_size=CHUNK_ROWS)
+
+    chunk = []
+    # Archived rows keep their ids, so the two pk-ordered streams merge into one id order
+    for row in heapq.merge(hot, cold, key=lambda row: row[0]):
+        chunk.append(row)
+        if len(chunk) >= CHUNK_ROWS:
+            _append(gen_dir, meta, _to_columns(chunk, meta, merchant_ids))
+            chunk = []
+    _append(gen_dir, meta, _to_columns(chunk, meta, merchant_ids))
+
+    _write_meta(user_dir, meta)
+    for path in user_dir.iterdir():
+        if path.is_dir() and path.name != meta["generation"]:
+            shutil.rmtree(path, ignore_errors=True)
+    return _open(user_dir, meta)
+
+
+def rebuild_snapshot(user_id: int) -> Snapshot:
+    user_dir = _user_dir(user_id)
+    with _locked(user_dir):
+        return _rebuild(user_id, user_dir)
+
+
+def current_snapshot(user_id: int, version: Optional[int] = None) -> Snapshot:
+    """
+    The user's snapshot at their current DataVersion, rebuilt first if it is missing or stale.
+    """
+    if version is None:
+        version, _ = get_data_version(user_id)
+    user_dir = _user_dir(user_id)
+    meta = _read_meta(user_dir)
+    if meta and meta["data_version"] == version:
+        try:
+            return _open(user_dir, meta)
+        except FileNotFoundError:  # generation swapped out underneath us
+            pass
+
+    with _locked(user_dir):
+        # Another request may have rebuilt it while we waited
+        meta = _read_meta(user_dir)
+        if meta and meta["data_version"] == version:
+            return _open(user_dir, meta)
+        return _rebuild(user_id, user_dir)
+
+
+def append_to_snapshot(user_id: int, transactions: Iterable[Transaction]) -> int:
+    """
+    Incremental entry point after an import (call it after the import's DataVersion bump
+    and transfer matching). Appends the new rows if the snapshot was current just before
+    this import; otherwise leaves it to be rebuilt on the next read. Returns rows appended.
+    """
+    txns = sorted(transactions, key=lambda t: t.pk or 0)
+    user_dir = _user_dir(user_id)
+    if not txns or _read_meta(user_dir) is None:
+        return 0  # never built: nobody has asked for analytics yet
+
+    version, _ = get_data_version(user_id)
+    with _locked(user_dir):
+        meta = _read_meta(user_dir)
+        if meta is None or meta["data_version"] != version - 1:
+            return 0
+        if txns[0].pk is None or txns[0].pk <= meta["last_id"]:
+            return 0
+
+        statement_ids = {t.statement_id for t in txns}
+        linked = {
+            pk
+            for pair in TransferLink.objects.filter(
+                Q(outflow__statement_id__in=statement_ids) | Q(inflow__statement_id__in=statement_ids)
+            ).values_list("outflow_id", "inflow_id")
+            for pk in pair
+        }
+
+        gen_dir = user_dir / meta["generation"]
+        old_rows, old_last_id = meta["rows"], meta["last_id"]
+        merchant_ids = {key: i for i, key in enumerate(meta["merchants"])}
+        rows = [(t.pk, t.transaction_date, t.amount, t.account_id, t.merchant_key, t.pk in linked) for t in txns]
+        _append(gen_dir, meta, _to_columns(rows, meta, merchant_ids))
+
+        # Older rows that this import's transfer matching paired up
+        matched = np.array(sorted(pk for pk in linked if pk <= old_last_id), dtype=np.int64)
+        if matched.size and old_rows:
+            ids = np.load(gen_dir / "id.npy", mmap_mode="r")[:old_rows]
+            pos = np.searchsorted(ids, matched)
+            found = pos < old_rows
+            found[found] = ids[pos[found]] == matched[found]
+            flags = open_memmap(gen_dir / "transfer.npy", mode="r+")
+            flags[pos[found]] = True
+            flags.flush()
+            del flags
+
+        meta["data_version"] = version
+        _write_meta(user_dir, meta)
+    return len(rows)
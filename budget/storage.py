@@ -0,0 +1,173 @@
+import gzip
+import io
+import os
+import tempfile
+
+import brotli
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+CAS_PREFIX = "statements/sha256"
+
+# STATEMENT_STORAGE_COMPRESSION value -> suffix appended to the stored name
+COMPRESSION_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+BROTLI_QUALITY = 6  # upload-time compression: most of the ratio of q11 at a fraction of the CPU
+READ_CHUNK = 64 * 1024
+
+
+def content_addressed_name(file_hash: str, filename: str) -> str:
+    """
+    statements/sha256/ab/cd/abcd...ef.csv — one path per distinct file content.
+    The extension is kept so source type / readers can still tell CSV from PDF.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    return f"{CAS_PREFIX}/{file_hash[:2]}/{file_hash[2:4]}/{file_hash}{ext}"
+
+
+def is_content_addressed(name: str) -> bool:
+    return (name or "").startswith(CAS_PREFIX + "/")
+
+
+def compression_suffix(name: str) -> str:
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if (name or "").endswith(suffix):
+            return suffix
+    return ""
+
+
+def configured_compression_suffix(filename: str) -> str:
+    """
+    Suffix new statement files get per STATEMENT_STORAGE_COMPRESSION.
+    PDFs are already compressed and are stored as-is.
+    """
+    if os.path.splitext(filename)[1].lower() == ".pdf":
+        return ""
+    return COMPRESSION_SUFFIXES.get(getattr(settings, "STATEMENT_STORAGE_COMPRESSION", "") or "", "")
+
+
+def write_chunks(out, chunks, suffix: str) -> None:
+    """
+    Writes chunks to a binary file, compressing on the fly when suffix is .br/.gz.
+    """
+    if suffix == ".br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            out.write(compressor.process(chunk))
+        out.write(compressor.finish())
+    elif suffix == ".gz":
+        with gzip.GzipFile(fileobj=out, mode="wb", mtime=0) as gz:
+            for chunk in chunks:
+                gz.write(chunk)
+    else:
+        for chunk in chunks:
+            out.write(chunk)
+
+
+class BrotliReader(io.RawIOBase):
+    """
+    Readable stream that inflates a Brotli file one input chunk at a time.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._decompressor = brotli.Decompressor()
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            chunk = self.raw.read(READ_CHUNK)
+            if not chunk:
+                return 0
+            self._pending = self._decompressor.process(chunk)
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+def decompressing_reader(raw, name: str):
+    """
+    Wraps an open binary file so reads return the original (uncompressed) bytes.
+    Decompression is streamed; the whole file is never inflated in memory.
+    """
+    suffix = compression_suffix(name)
+    if suffix == ".br":
+        return io.BufferedReader(BrotliReader(raw), buffer_size=READ_CHUNK)
+    if suffix == ".gz":
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    return raw
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage for statement files named by their SHA-256 (see content_addressed_name).
+    Saving a name that already exists is a no-op rather than a suffixed copy, so the same
+    export uploaded to several accounts or by several users is stored once.
+    Deleting is reference counted by the BankStatement post_delete handler (budget.signals).
+    Names ending in .br/.gz are compressed while writing; read them with decompressing_reader.
+    """
+
+    def existing_variant(self, name: str) -> str:
+        """
+        The stored name for this content if any compression variant is already on disk, else "".
+        """
+        base = name[: -len(compression_suffix(name))] if compression_suffix(name) else name
+        for candidate in (name, base, *(base + s for s in COMPRESSION_SUFFIXES.values())):
+            if self.exists(candidate):
+                return candidate
+        return ""
+
+    def get_available_name(self, name, max_length=None):
+        if is_content_addressed(name):
+            # Same name means same bytes: reuse it
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def save_stored(self, name: str, content) -> str:
+        """
+        Saves content that is already in the stored form of `name` (e.g. the bytes of another
+        .br file) unchanged: unlike save(), it is never compressed a second time.
+        """
+        return self._save(name, content, compress=False)
+
+    def _save(self, name, content, compress=True):
+        if not is_content_addressed(name):
+            return super()._save(name, content)
+        existing = self.existing_variant(name)
+        if existing:
+            return existing
+
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temp file and rename, so concurrent uploads of the same content
+        # can't interleave or leave a partial file at the final path.
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                chunks = (c if isinstance(c, bytes) else c.encode() for c in content.chunks())
+                write_chunks(f, chunks, compression_suffix(name) if compress else "")
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+
+_statement_storage = ContentAddressedStorage()
+
+
+def statement_storage():
+    """
+    Storage callable for BankStatement.source_file (keeps the backend out of migrations).
+    """
+    return _statement_storage
@@ -0,0 +1,101 @@
+"""
+Transaction tags as bits of Transaction.tags_mask.
+
+Each of a user's tags (at most Tag.MAX_PER_USER) owns one bit. "tagged A and B, not C" is
+a single comparison, (tags_mask & (A|B|C)) = (A|B), and tagging a selection is one
+UPDATE ... SET tags_mask = (tags_mask | add) & ~remove. No join table is touched.
+"""
+from typing import Dict, Iterable, List
+
+from django.db import IntegrityError
+from django.db import transaction as db_transaction
+from django.db.models import F, QuerySet
+from django.db.models.lookups import Exact, GreaterThan
+
+from .envelopes import refresh_for_tags
+from .models import Tag
+from .versioning import bump_data_version
+
+
+ALL_BITS = (1 << Tag.MAX_PER_USER) - 1
+
+
+class TagError(ValueError):
+    pass
+
+
+def tag_bits(user_id: int) -> Dict[str, int]:
+    """
+    {name: mask} for the user's tags.
+    """
+    return {name: 1 << bit for name, bit in Tag.objects.filter(user_id=user_id).values_list("name", "bit")}
+
+
+def mask_for(bits: Dict[str, int], names: Iterable[str]) -> int:
+    mask = 0
+    for name in names:
+        if name not in bits:
+            raise TagError(f"Unknown tag {name!r}.")
+        mask |= bits[name]
+    return mask
+
+
+def tag_names(mask: int, bits: Dict[str, int]) -> List[str]:
+    return [name for name, bit in bits.items() if mask & bit]
+
+
+def free_bit(user_id: int) -> int:
+    used = set(Tag.objects.filter(user_id=user_id).values_list("bit", flat=True))
+    for bit in range(Tag.MAX_PER_USER):
+        if bit not in used:
+            return bit
+    raise TagError(f"A user can have at most {Tag.MAX_PER_USER} tags.")
+
+
+def create_tag(user_id: int, name: str) -> Tag:
+    """
+    The user's tag called `name`, created on the lowest free bit if it does not exist.
+    """
+    name = name.strip()
+    if not name:
+        raise TagError("Tag name is required.")
+    existing = Tag.objects.filter(user_id=user_id, name=name).first()
+    if existing:
+        return existing
+    try:
+        with db_transaction.atomic():
+            return Tag.objects.create(user_id=user_id, name=name, bit=free_bit(user_id))
+    except IntegrityError:
+        # Created concurrently (same name or same bit); the name may now exist
+        existing = Tag.objects.filter(user_id=user_id, name=name).first()
+        if existing:
+            return existing
+        raise TagError("Tag could not be created, please retry.")
+
+
+def filter_by_tags(qs: QuerySet, all_of: int = 0, none_of: int = 0, any_of: int = 0) -> QuerySet:
+    """
+    Rows carrying every tag in all_of, none in none_of and (if given) at least one in any_of.
+    """
+    if all_of & none_of:
+        return qs.none()
+    if all_of or none_of:
+        qs = qs.filter(Exact(F("tags_mask").bitand(all_of | none_of), all_of))
+    if any_of:
+        qs = qs.filter(GreaterThan(F("tags_mask").bitand(any_of), 0))
+    return qs
+
+
+def update_tags(user_id: int, qs: QuerySet, add: int = 0, remove: int = 0) -> int:
+    """
+    Adds/removes tag bits on every row of qs (limited to user_id) in one UPDATE.
+    Returns the number of rows matched.
+    """
+    if not (add or remove):
+        return 0
+    keep = ALL_BITS & ~remove
+    updated = qs.filter(user_id=user_id).update(tags_mask=F("tags_mask").bitor(add).bitand(keep))
+    if updated:
+        bump_data_version(user_id)
+        refresh_for_tags(user_id, add | remove)
+    return updated
@@ -1,3 +1,1506 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import traceback
+from concurrent.futures import Future
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
+
+import brotli
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from . import monthly_reports, ofx, reparse, snapshot
+from .admin import BankStatementAdmin
+from .archive import archive_user
+from .asgi_upload import StreamingStatementUpload
+from .coverage import overlapping_statements, transactions_between
+from .envelopes import refresh_envelopes
+from .fx import FxRateMissing, FxTable, bump_fx_rates_version, clear_fx_cache, fx_rates_version, get_fx_table
+from .importers import import_statement, import_statement_csv
+from .models import (
+    Account, ArchivedTransaction, Bank, BankStatement, Envelope, EnvelopeMonth, FxRate, RecurringSeries,
+    StatementFileLock, Tag, Transaction, TransferLink, UserPreferences,
+)
+from .reparse import reparse_in_batches, stale_statements
+from .recurring import amount_band, classify, normalize_description
+from .tags import TagError, create_tag, filter_by_tags, update_tags
+from .transfers import pair_transfers
+from .versioning import bump_data_version, get_data_version
+from project.middleware import PrecompressedStaticMiddleware, endpoint_stats
+
+
+class QueryRecorder:
+    """
+    execute_wrapper hook that keeps each SQL statement with the project frames that issued it.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((sql, self._stack()))
+        return execute(sql, params, many, context)
+
+    @staticmethod
+    def _stack():
+        frames = traceback.extract_stack()[:-2]
+        base = str(settings.BASE_DIR)
+        ours = [f for f in frames if f.filename.startswith(base) and not f.filename.endswith("tests.py")]
+        return traceback.format_list(ours or frames[-8:])
+
+
+class QueryBudgetCrawlTests(TestCase):
+    """
+    Crawls every named URL in budget.urls and accounts.urls as a logged-in user at two
+    data sizes and fails if any page's query count grows with the data (N+1 regressions).
+    """
+
+    URLCONFS = [("budget", "budget.urls"), ("accounts", "accounts.urls")]
+    SMALL = 10
+    LARGE = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user("crawler", "crawler@example.com", "pw-crawler-123")
+
+    def setUp(self):
+        # The analytics API writes per-user snapshot files and slow pages write profiler
+        # captures; keep both out of the project tree
+        snapshots = self.enterContext(tempfile.TemporaryDirectory())
+        profiles = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(ANALYTICS_SNAPSHOT_DIR=snapshots, PROFILE_DIR=profiles))
+
+    def seed(self, total: int) -> None:
+        """
+        Tops the user up to `total` banks/accounts/statements (with a few transactions each).
+        """
+        start = Account.objects.filter(user=self.user).count()
+        banks = Bank.objects.bulk_create(
+            [Bank(name=f"Bank {i}", mapping={"date_column": "Date"}) for i in range(start, total)]
+        )
+        accounts = Account.objects.bulk_create(
+            [Account(user=self.user, bank=b, name=f"Account {i}") for i, b in enumerate(banks, start)]
+        )
+        statements = BankStatement.objects.bulk_create(
+            [
+                BankStatement(
+                    user=self.user,
+                    account=a,
+                    source_file=f"statements/seed_{a.pk}.csv",
+                    file_hash=f"{a.pk:064d}",
+                    parsed_ok=True,
+                )
+                for a in accounts
+            ]
+        )
+        Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    user=self.user,
+                    account_id=s.account_id,
+                    statement=s,
+                    transaction_date="2025-01-%02d" % (d + 1),
+                    description=f"Seed {d}",
+                    amount=-d,
+                )
+                for s in statements
+                for d in range(3)
+            ]
+        )
+
+    def url_kwargs(self, name: str) -> dict:
+        """
+        Sample kwargs for URL patterns with parameters. New parameterised URLs must be added here.
+        """
+        samples = {
+            "budget:bank_edit": lambda: {"pk": Bank.objects.order_by("pk").first().pk},
+            "budget:envelope_edit": lambda: {
+                "pk": Envelope.objects.get_or_create(
+                    user=self.user, name="Groceries", defaults={"monthly_limit": 400, "currency": "USD"}
+                )[0].pk
+            },
+            "accounts:password_reset_confirm": lambda: {
+                "uidb64": urlsafe_base64_encode(force_bytes(self.user.pk)),
+                "token": default_token_generator.make_token(self.user),
+            },
+        }
+        if name not in samples:
+            self.fail(f"No sample kwargs for parameterised URL {name!r}; add it to url_kwargs().")
+        return samples[name]()
+
+    def crawl_targets(self):
+        for namespace, urlconf in self.URLCONFS:
+            for pattern in import_module(urlconf).urlpatterns:
+                if not isinstance(pattern, URLPattern) or not pattern.name:
+                    continue
+                name = f"{namespace}:{pattern.name}"
+                params = getattr(pattern.pattern, "converters", {})
+                yield name, reverse(name, kwargs=self.url_kwargs(name) if params else None)
+
+    def crawl(self) -> dict:
+        results = {}
+        for name, url in self.crawl_targets():
+            # logout (and friends) end the session, so log in fresh for every page
+            self.client.force_login(self.user)
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                response = self.client.get(url)
+            self.assertLess(response.status_code, 500, f"{name} ({url}) returned {response.status_code}")
+            results[name] = recorder.queries
+        return results
+
+    def test_query_counts_do_not_grow_with_data(self):
+        self.seed(self.SMALL)
+        small = self.crawl()
+        self.seed(self.LARGE)
+        large = self.crawl()
+
+        failures = []
+        for name, queries in large.items():
+            baseline = small[name]
+            if len(queries) <= len(baseline):
+                continue
+            # Report the statements beyond the small-size count: they are the ones that scale
+            extra = queries[len(baseline):]
+            detail = "\n".join(f"  SQL: {sql}\n{''.join(stack)}" for sql, stack in extra[:5])
+            failures.append(
+                f"{name}: {len(baseline)} queries at {self.SMALL} rows, "
+                f"{len(queries)} at {self.LARGE} rows. First extra queries:\n{detail}"
+            )
+        if failures:
+            self.fail("Query count grew with data size:\n\n" + "\n\n".join(failures))
+
+
+class ImportTimeBudgetTests(SimpleTestCase):
+    """
+    Imports project.wsgi in a fresh interpreter under `python -X importtime` and fails if it
+    pulls in a dependency that is meant to load on first use, or if it gets slower than
+    IMPORT_TIME_BUDGET_MS (best of a few runs, to ride out a noisy machine).
+    """
+
+    LAZY_MODULES = (
+        "numpy",
+        "weasyprint",
+        "fontTools",
+        "PIL",
+        "zopfli",
+        "formtools.wizard.views",
+        "crispy_forms.helper",
+        "budget.analytics",
+        "budget.snapshot",
+        "budget.monthly_reports",
+    )
+    BUDGET_MS = int(os.getenv("IMPORT_TIME_BUDGET_MS", "900"))
+    RUNS = 3
+    LINE = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)$")
+
+    def import_times(self) -> dict:
+        """
+        {module: cumulative microseconds} for one cold import.
+        """
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": "project.settings"}
+        env.pop("DJANGO_PRELOAD", None)
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import project.wsgi"],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(proc.returncode, 0, proc.stderr[-2000:])
+        times = {}
+        for line in proc.stderr.splitlines():
+            match = self.LINE.match(line)
+            if match:
+                times[match.group(2)] = int(match.group(1))
+        return times
+
+    def test_wsgi_import_stays_lean(self):
+        runs = [self.import_times() for _ in range(self.RUNS)]
+
+        eager = [m for m in self.LAZY_MODULES if any(m in times for times in runs)]
+        self.assertFalse(eager, f"project.wsgi now imports {eager}; import them where they are used.")
+
+        best_ms = min(times["project.wsgi"] for times in runs) / 1000
+        if best_ms > self.BUDGET_MS:
+            slowest = sorted(runs[0].items(), key=lambda kv: kv[1], reverse=True)[:15]
+            detail = "\n".join(f"  {us / 1000:8.1f} ms  {name}" for name, us in slowest)
+            self.fail(f"project.wsgi import took {best_ms:.0f} ms (budget {self.BUDGET_MS} ms). Slowest:\n{detail}")
+
+
+def statement_csv(*rows) -> bytes:
+    """
+    A Date,Description,Amount export from (YYYY-MM-DD, description, amount) tuples.
+    """
+    lines = ["Date,Description,Amount"]
+    lines += [f"{d[5:7]}/{d[8:10]}/{d[:4]},{description},{amount}" for d, description, amount in rows]
+    return ("\n".join(lines) + "\n").encode()
+
+
+class BudgetDataMixin:
+    """
+    A user with a checking and a credit account, and a throwaway MEDIA_ROOT and snapshot dir.
+    """
+
+    def setUp(self):
+        self.media = self.enterContext(tempfile.TemporaryDirectory())
+        snapshots = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=self.media, ANALYTICS_SNAPSHOT_DIR=snapshots))
+        self.user = get_user_model().objects.create_user("owner", "owner@example.com", "pw-owner-123")
+        self.bank = Bank.objects.create(name="Test Bank")
+        self.checking = Account.objects.create(user=self.user, bank=self.bank, name="Checking")
+        self.card = Account.objects.create(
+            user=self.user, bank=self.bank, name="Card", account_type=Account.CREDIT
+        )
+
+    def add_statement(self, account, data: bytes, name: str = "statement.csv") -> BankStatement:
+        return BankStatement.objects.create(
+            user=self.user,
+            account=account,
+            source_file=ContentFile(data, name=name),
+            source_type=BankStatement.source_type_for(name),
+            file_hash=hashlib.sha256(data).hexdigest(),
+        )
+
+    def import_rows(self, account, *rows, name: str = "statement.csv"):
+        """
+        Creates and imports a statement; returns (statement, created, errors).
+        """
+        stmt = self.add_statement(account, statement_csv(*rows), name)
+        created, errors = import_statement(stmt)
+        stmt.refresh_from_db()
+        return stmt, created, errors
+
+
+class BudgetDataTestCase(BudgetDataMixin, TestCase):
+    pass
+
+
+class StatementFileStorageTests(BudgetDataTestCase):
+    def legacy_statement(self, data: bytes) -> BankStatement:
+        name = f"statements/user_{self.user.pk}/account_{self.checking.pk}/legacy.csv"
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(data)
+        return BankStatement.objects.create(
+            user=self.user, account=self.checking, source_file=name, file_hash=hashlib.sha256(data).hexdigest()
+        )
+
+    def test_compress_then_dedupe_keeps_files_readable(self):
+        data = statement_csv(("2025-01-02", "Coffee", "-3.50"), ("2025-01-03", "Salary", "1000.00"))
+        stmt = self.legacy_statement(data)
+
+        legacy_path = os.path.join(self.media, stmt.source_file.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("compress_statement_files", format="br", stdout=io.StringIO())
+        self.assertFalse(os.path.exists(legacy_path))  # removed once the rows point at the .br
+        call_command("dedupe_statement_files", stdout=io.StringIO(), stderr=io.StringIO())
+
+        stmt.refresh_from_db()
+        self.assertTrue(stmt.source_file.name.startswith("statements/sha256/"))
+        self.assertTrue(stmt.source_file.name.endswith(".csv.br"))
+        created, errors = import_statement(stmt)
+        self.assertEqual((created, errors), (2, []))
+        self.assertEqual(
+            sorted(Transaction.objects.filter(statement=stmt).values_list("description", flat=True)),
+            ["Coffee", "Salary"],
+        )
+
+
+class ImportMetricsTests(BudgetDataTestCase):
+    def test_import_stores_and_logs_its_metrics(self):
+        data = statement_csv(
+            ("2025-01-02", "Coffee", "-3.50"),
+            ("2025-01-03", "Salary", "1000.00"),
+            ("yyyy-mm-dd", "No date", "-1.00"),
+            ("2025-01-04", "No amount", "n/a"),
+        )
+        stmt = self.add_statement(self.checking, data)
+        with self.assertLogs("budget.import", "INFO") as logs:
+            created, errors = import_statement(stmt)
+        self.assertEqual(created, 2)
+
+        stmt.refresh_from_db()
+        record = stmt.import_metrics
+        self.assertEqual(
+            {key: record[key] for key in ("v", "bytes_read", "rows_parsed", "rows_created", "batches_inserted")},
+            {"v": 1, "bytes_read": len(data), "rows_parsed": 4, "rows_created": 2, "batches_inserted": 1},
+        )
+        self.assertEqual(record["rows_rejected"], {"invalid_date": 1, "invalid_amount": 1})
+        self.assertGreater(record["queries"], 0)
+        self.assertLessEqual(
+            {"decode", "csv", "convert", "insert", "recurring", "transfers", "envelopes", "snapshot", "total"},
+            set(record["timings_ms"]),
+        )
+        self.assertEqual(BankStatementAdmin.import_ms(None, stmt), record["timings_ms"]["total"])
+
+        [line] = logs.output
+        prefix = "INFO:budget.import:statement_import "
+        self.assertTrue(line.startswith(prefix), line)
+        self.assertEqual(
+            json.loads(line[len(prefix):]),
+            {"statement_id": stmt.pk, "account_id": self.checking.pk, "bank_id": self.bank.pk, **record},
+        )
+
+
+class FxTableTests(SimpleTestCase):
+    def setUp(self):
+        self.table = FxTable(
+            [
+                ("EUR", date(2025, 1, 1), Decimal("1.10")),
+                ("EUR", date(2025, 1, 10), Decimal("1.20")),
+                ("gbp", date(2025, 1, 5), Decimal("1.25")),
+            ]
+        )
+
+    def test_rate_is_the_latest_on_or_before_the_date(self):
+        rate = lambda d: self.table.rate("EUR", d.toordinal())
+        self.assertEqual(rate(date(2025, 1, 1)), Decimal("1.10"))
+        self.assertEqual(rate(date(2025, 1, 9)), Decimal("1.10"))
+        self.assertEqual(rate(date(2025, 1, 10)), Decimal("1.20"))
+        self.assertEqual(rate(date(2026, 6, 1)), Decimal("1.20"))
+        self.assertEqual(self.table.rate("usd", 1), Decimal(1))  # the pivot
+        with self.assertRaises(FxRateMissing):
+            rate(date(2024, 12, 31))
+        with self.assertRaises(FxRateMissing):
+            self.table.rate("JPY", date(2025, 1, 1).toordinal())
+
+    def test_converter_goes_through_the_pivot(self):
+        to_usd = self.table.converter("USD")
+        self.assertEqual(to_usd(Decimal("10"), "EUR", date(2025, 1, 2)), Decimal("11.00"))
+        self.assertEqual(to_usd(Decimal("10"), "usd", date(2025, 1, 2)), Decimal("10"))
+        to_gbp = self.table.converter("gbp")
+        # 12 EUR = 14.40 USD = 11.52 GBP on Jan 12
+        self.assertEqual(to_gbp(Decimal("12"), "EUR", date(2025, 1, 12)), Decimal("11.52"))
+        with self.assertRaises(FxRateMissing):
+            to_gbp(Decimal("1"), "EUR", date(2025, 1, 2))  # no GBP rate before Jan 5
+
+
+class FxCacheTests(TestCase):
+    def setUp(self):
+        clear_fx_cache()
+        self.addCleanup(clear_fx_cache)
+        FxRate.objects.create(currency="EUR", rate_date=date(2025, 1, 1), rate=Decimal("1.10"))
+
+    def test_cached_table_follows_rate_changes_from_other_processes(self):
+        self.assertEqual(get_fx_table().rate("EUR", date(2025, 1, 2).toordinal()), Decimal("1.10"))
+        with self.assertNumQueries(1):  # version check only
+            get_fx_table()
+
+        # What load_fx_rates does in another process: no clear_fx_cache() here
+        FxRate.objects.update(rate=Decimal("1.30"))
+        bump_fx_rates_version()
+        self.assertEqual(get_fx_table().rate("EUR", date(2025, 1, 2).toordinal()), Decimal("1.30"))
+
+    def test_load_fx_rates_bumps_versions(self):
+        user = get_user_model().objects.create_user("fx", "fx@example.com", "pw-fx-12345")
+        bump_data_version(user.pk)
+        before = get_data_version(user.pk)[0]
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write("date,currency,rate\n2025-01-01,EUR,1.05\n")
+        self.addCleanup(os.remove, f.name)
+        version = fx_rates_version()
+        call_command("load_fx_rates", f.name, stdout=io.StringIO())
+        self.assertGreater(fx_rates_version(), version)
+        self.assertGreater(get_data_version(user.pk)[0], before)
+        self.assertEqual(FxRate.objects.get(currency="EUR").rate, Decimal("1.05"))
+
+
+class PairTransfersTests(SimpleTestCase):
+    def test_pairs_only_within_the_window(self):
+        out = (1, 10, "USD", 100, Decimal("-50"))
+        edge = (2, 20, "USD", 103, Decimal("50"))
+        self.assertEqual(pair_transfers([out, edge], window=3), [(out, edge)])
+        self.assertEqual(pair_transfers([out, (2, 20, "USD", 104, Decimal("50"))], window=3), [])
+        self.assertEqual(pair_transfers([out, (2, 20, "USD", 96, Decimal("50"))], window=3), [])
+
+    def test_same_account_and_other_currency_never_pair(self):
+        out = (1, 10, "USD", 100, Decimal("-50"))
+        self.assertEqual(pair_transfers([out, (2, 10, "USD", 100, Decimal("50"))], window=3), [])
+        self.assertEqual(pair_transfers([out, (2, 20, "EUR", 100, Decimal("50"))], window=3), [])
+
+    def test_picks_the_closest_inflow(self):
+        out = (1, 10, "USD", 100, Decimal("-50"))
+        early = (2, 20, "USD", 98, Decimal("50"))
+        close = (3, 30, "USD", 101, Decimal("50"))
+        late = (4, 20, "USD", 103, Decimal("50"))
+        self.assertEqual(pair_transfers([late, early, out, close], window=3), [(out, close)])
+
+    def test_each_inflow_is_used_once(self):
+        a = (1, 10, "USD", 100, Decimal("-50"))
+        b = (2, 10, "USD", 101, Decimal("-50"))
+        inflow = (3, 20, "USD", 100, Decimal("50"))
+        self.assertEqual(pair_transfers([a, b, inflow], window=3), [(a, inflow)])
+
+
+class MatchTransfersCommandTests(BudgetDataTestCase):
+    def test_new_links_bump_version_and_refresh_envelopes(self):
+        envelope = Envelope.objects.create(user=self.user, name="All", monthly_limit=Decimal("100"), currency="USD")
+        self.import_rows(self.checking, ("2025-01-10", "Card payment", "-500.00"), ("2025-01-11", "Coffee", "-4.00"))
+        self.import_rows(self.card, ("2025-01-11", "Payment received", "500.00"), name="card.csv")
+        # Data imported before transfer matching existed: no links, payment counted as spend
+        TransferLink.objects.all().delete()
+        EnvelopeMonth.objects.filter(envelope=envelope).update(actual=Decimal("504.00"))
+        before = get_data_version(self.user.pk)[0]
+
+        out = io.StringIO()
+        call_command("match_transfers", stdout=out)
+
+        self.assertIn("Linked 1 transfer(s)", out.getvalue())
+        self.assertEqual(TransferLink.objects.count(), 1)
+        self.assertGreater(get_data_version(self.user.pk)[0], before)
+        self.assertEqual(EnvelopeMonth.objects.get(envelope=envelope, month=date(2025, 1, 1)).actual, Decimal("4.00"))
+
+    def test_no_new_links_leaves_version_alone(self):
+        self.import_rows(self.checking, ("2025-01-11", "Coffee", "-4.00"))
+        before = get_data_version(self.user.pk)[0]
+        call_command("match_transfers", stdout=io.StringIO())
+        self.assertEqual(get_data_version(self.user.pk)[0], before)
+
+
+class StatementPruningTests(BudgetDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.january, _, _ = self.import_rows(self.checking, ("2025-01-05", "Jan", "-1.00"), name="jan.csv")
+        self.march, _, _ = self.import_rows(self.checking, ("2025-03-05", "Mar", "-3.00"), name="mar.csv")
+
+    def descriptions(self, start, end):
+        return sorted(transactions_between(start, end, user_id=self.user.pk).values_list("description", flat=True))
+
+    def test_statements_outside_the_range_are_pruned(self):
+        self.assertEqual((self.january.statement_start_date, self.january.statement_end_date), (date(2025, 1, 5),) * 2)
+        self.assertEqual(
+            list(overlapping_statements(date(2025, 3, 1), date(2025, 3, 31), user_id=self.user.pk)), [self.march]
+        )
+        # Narrow January's range so its row would only be found by scanning Transaction
+        BankStatement.objects.filter(pk=self.january.pk).update(statement_end_date=date(2025, 1, 4))
+        self.assertEqual(self.descriptions(date(2025, 1, 5), date(2025, 3, 31)), ["Mar"])
+        with self.assertNumQueries(1):  # statement ids are a subquery, not a separate fetch
+            list(transactions_between(date(2025, 1, 1), date(2025, 12, 31), user_id=self.user.pk))
+
+    def test_unranged_statements_are_always_scanned(self):
+        BankStatement.objects.filter(pk=self.january.pk).update(statement_start_date=None, statement_end_date=None)
+        self.assertIn(self.january, overlapping_statements(date(2025, 3, 1), date(2025, 3, 31), user_id=self.user.pk))
+        self.assertEqual(self.descriptions(date(2025, 1, 1), date(2025, 1, 31)), ["Jan"])
+        self.assertEqual(self.descriptions(date(2025, 3, 1), date(2025, 3, 31)), ["Mar"])
+
+
+class LoadTestSmokeTests(SimpleTestCase):
+    """
+    Runs `manage.py load_test` for a handful of operations in a fresh interpreter. The
+    configured database points at a path that must still not exist afterwards: the command
+    works in its own scratch environment.
+    """
+
+    def test_handful_of_operations(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            configured_db = os.path.join(tmp, "configured.sqlite3")
+            report_path = os.path.join(tmp, "report.json")
+            env = {**os.environ, "DJANGO_SETTINGS_MODULE": "project.settings", "SQLITE_TMP_PATH": configured_db}
+            proc = subprocess.run(
+                [
+                    sys.executable, "manage.py", "load_test", "--users", "2", "--statements", "1", "--rows", "5",
+                    "--workers", "2", "--operations", "4", "--max-error-rate", "0", "--json", report_path,
+                ],
+                cwd=settings.BASE_DIR,
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            self.assertEqual(proc.returncode, 0, proc.stdout[-2000:] + proc.stderr[-2000:])
+            self.assertFalse(os.path.exists(configured_db))
+            with open(report_path) as f:
+                report = json.load(f)
+        self.assertEqual(report["operations"], 8)
+        self.assertEqual(report["errors"], 0)
+
+
+class StubHTML:
+    """
+    Stands in for weasyprint.HTML; fails for reports whose HTML mentions "broken".
+    """
+
+    def __init__(self, string):
+        self.string = string
+
+    def write_pdf(self, stylesheets=None, font_config=None):
+        if "broken" in self.string:
+            raise RuntimeError("cannot lay out page")
+        return b"%PDF-stub\n" + self.string.encode()
+
+
+class MonthlyReportTests(BudgetDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(MONTHLY_REPORTS_DIR=os.path.join(self.media, "monthly_reports")))
+        self.enterContext(mock.patch.dict(monthly_reports._worker, HTML=StubHTML, fonts=None, css=None))
+        clear_fx_cache()
+        self.addCleanup(clear_fx_cache)
+
+    def add_user(self, username: str, *rows):
+        user = get_user_model().objects.create_user(username, f"{username}@example.com", "pw-report-123")
+        account = Account.objects.create(user=user, bank=self.bank, name="Checking")
+        data = statement_csv(*rows)
+        stmt = BankStatement.objects.create(
+            user=user, account=account, source_file=ContentFile(data, name=f"{username}.csv"),
+            file_hash=hashlib.sha256(data).hexdigest(),
+        )
+        import_statement(stmt)
+        return user
+
+    def test_collection_query_count_does_not_grow_with_users(self):
+        ids = [self.add_user(f"user{n}", ("2025-01-05", f"Shop {n}", "-10.00")).pk for n in range(3)]
+        get_fx_table()
+        first, last = monthly_reports.parse_month("2025-01")
+        with CaptureQueriesContext(connection) as one:
+            monthly_reports.collect_month_data(ids[:1], first, last)
+        with CaptureQueriesContext(connection) as three:
+            reports = monthly_reports.collect_month_data(ids, first, last)
+        self.assertEqual(len(one), len(three))
+        self.assertEqual(sorted(reports), ids)
+        self.assertEqual(reports[ids[2]]["expense"], Decimal("-10.00"))
+
+    def test_rerun_skips_finished_reports_and_failures_carry_their_error(self):
+        users = [self.add_user(f"user{n}", ("2025-01-05", "Shop", "-10.00")) for n in range(2)]
+        broken = self.add_user("broken", ("2025-01-05", "Shop", "-10.00"))
+
+        with self.assertLogs("budget.monthly_reports", "ERROR"):
+            result = monthly_reports.render_monthly_reports("2025-01")
+        self.assertEqual((result.rendered, result.skipped), (2, 0))
+        self.assertEqual(result.failed, {broken.pk: "RuntimeError: cannot lay out page"})
+        first, _ = monthly_reports.parse_month("2025-01")
+        self.assertTrue(all(monthly_reports.report_path(first, u.pk).exists() for u in users))
+        self.assertFalse(monthly_reports.report_path(first, broken.pk).exists())
+
+        # Resume: only the missing reports are rendered again
+        monthly_reports.report_path(first, users[0].pk).unlink()
+        seen = []
+        with self.assertLogs("budget.monthly_reports", "ERROR"):
+            result = monthly_reports.render_monthly_reports("2025-01", progress=lambda user_id, error: seen.append(user_id))
+        self.assertEqual((result.rendered, result.skipped), (1, 1))
+        self.assertEqual(sorted(seen), sorted([users[0].pk, broken.pk]))
+
+    def test_top_merchants_are_ranked_in_the_base_currency(self):
+        FxRate.objects.create(currency="EUR", rate_date=date(2025, 1, 1), rate=Decimal("1.50"))
+        UserPreferences.objects.create(user=self.user, base_currency="USD")
+        euro = Account.objects.create(user=self.user, bank=self.bank, name="Euro", currency="EUR")
+        self.import_rows(self.checking, ("2025-01-05", "Big USD", "-120.00"), ("2025-01-06", "Small USD", "-5.00"))
+        self.import_rows(euro, ("2025-01-07", "Euro shop", "-100.00"), name="eur.csv")
+
+        first, last = monthly_reports.parse_month("2025-01")
+        report = monthly_reports.collect_month_data([self.user.pk], first, last)[self.user.pk]
+        ranked = [(m["spend"], m["currency"]) for m in report["merchants"]]
+        self.assertEqual(ranked, [(Decimal("150.00"), "USD"), (Decimal("120.00"), "USD"), (Decimal("5.00"), "USD")])
+        self.assertEqual(report["expense"], Decimal("-275.00"))
+
+
+OFX_SGML = b"""OFXHEADER:100
+DATA:OFXSGML
+VERSION:102
+SECURITY:NONE
+ENCODING:USASCII
+CHARSET:1252
+COMPRESSION:NONE
+OLDFILEUID:NONE
+NEWFILEUID:NONE
+
+<OFX>
+<SIGNONMSGSRSV1><SONRS><STATUS><CODE>0<SEVERITY>INFO</STATUS><DTSERVER>20250201120000</SONRS></SIGNONMSGSRSV1>
+<BANKMSGSRSV1><STMTTRNRS><TRNUID>1<STMTRS><CURDEF>USD
+<BANKACCTFROM><BANKID>123<ACCTID>9876<ACCTTYPE>CHECKING</BANKACCTFROM>
+<BANKTRANLIST><DTSTART>20250101<DTEND>20250131235959.000[-5:EST]
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20250105120000<TRNAMT>-12.50<FITID>F1<NAME>BARNES &amp; NOBLE<MEMO>Books</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20250110<TRNAMT>1000.00<FITID>F2<NAME>PAYROLL</STMTTRN>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20250105120000<TRNAMT>-12.50<FITID>F1<NAME>BARNES &amp; NOBLE<MEMO>Books</STMTTRN>
+</BANKTRANLIST><LEDGERBAL><BALAMT>987.50<DTASOF>20250131</LEDGERBAL></STMTRS></STMTTRNRS></BANKMSGSRSV1>
+</OFX>
+"""
+
+OFX_XML = b"""<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<?OFX OFXHEADER="200" VERSION="220" SECURITY="NONE" OLDFILEUID="NONE" NEWFILEUID="NONE"?>
+<OFX>
+  <BANKMSGSRSV1><STMTTRNRS><TRNUID>1</TRNUID><STMTRS>
+    <CURDEF>USD</CURDEF>
+    <BANKACCTFROM><BANKID>123</BANKID><ACCTID>9876</ACCTID><ACCTTYPE>CHECKING</ACCTTYPE></BANKACCTFROM>
+    <BANKTRANLIST>
+      <DTSTART>20250201</DTSTART><DTEND>20250228</DTEND>
+      <STMTTRN>
+        <TRNTYPE>DEBIT</TRNTYPE><DTPOSTED>20250203</DTPOSTED><TRNAMT>-7.25</TRNAMT>
+        <FITID>F3</FITID><NAME>Caf\xc3\xa9 &lt;Corner&gt;</NAME><MEMO/>
+      </STMTTRN>
+      <!-- a comment with <STMTTRN> inside is not a record -->
+      <STMTTRN>
+        <TRNTYPE>CREDIT</TRNTYPE><DTPOSTED>20250210</DTPOSTED><TRNAMT>25.00</TRNAMT><FITID>F4</FITID><NAME>Refund</NAME>
+      </STMTTRN>
+    </BANKTRANLIST>
+  </STMTRS></STMTTRNRS></BANKMSGSRSV1>
+</OFX>
+"""
+
+
+class OfxReaderTests(SimpleTestCase):
+    def records(self, data: bytes, info=None):
+        return list(ofx.iter_transactions(io.BytesIO(data), info))
+
+    def test_sgml_leaves_without_end_tags(self):
+        info = ofx.OfxStatementInfo()
+        records = self.records(OFX_SGML, info)
+        self.assertEqual(len(records), 3)
+        self.assertEqual(
+            records[0],
+            {"TRNTYPE": "DEBIT", "DTPOSTED": "20250105120000", "TRNAMT": "-12.50", "FITID": "F1",
+             "NAME": "BARNES & NOBLE", "MEMO": "Books"},
+        )
+        self.assertEqual((info.version, info.currency, info.account_ids), (1, "USD", ["9876"]))
+        self.assertEqual((info.start_date, info.end_date), ("20250101", "20250131235959.000[-5:EST]"))
+
+    def test_xml_entities_and_comments(self):
+        info = ofx.OfxStatementInfo()
+        records = self.records(OFX_XML, info)
+        self.assertEqual([r["FITID"] for r in records], ["F3", "F4"])
+        self.assertEqual(records[0]["NAME"], "Caf\xe9 <Corner>")
+        self.assertNotIn("MEMO", records[0])
+        self.assertEqual((info.version, info.start_date, info.end_date), (2, "20250201", "20250228"))
+
+    def test_any_chunk_boundary_gives_the_same_records(self):
+        for data in (OFX_SGML, OFX_XML):
+            expected = self.records(data)
+            for size in range(1, 24):
+                with self.subTest(size=size), mock.patch.object(ofx, "HEADER_BYTES", 240), \
+                        mock.patch.object(ofx, "CHUNK_SIZE", size):
+                    self.assertEqual(self.records(data), expected)
+
+
+class OfxImportTests(BudgetDataTestCase):
+    def import_ofx(self, data: bytes, name: str):
+        stmt = self.add_statement(self.checking, data, name)
+        created, errors = import_statement(stmt)
+        stmt.refresh_from_db()
+        return stmt, created, errors
+
+    def test_sgml_statement(self):
+        stmt, created, errors = self.import_ofx(OFX_SGML, "jan.ofx")
+        self.assertEqual((created, errors), (2, []))  # the repeated F1 is dropped
+        self.assertEqual(
+            sorted(Transaction.objects.filter(statement=stmt).values_list("raw_reference", "description", "amount")),
+            [("F1", "BARNES & NOBLE - Books", Decimal("-12.50")), ("F2", "PAYROLL", Decimal("1000.00"))],
+        )
+        # The range the file states, not just the span of its transactions
+        self.assertEqual((stmt.statement_start_date, stmt.statement_end_date), (date(2025, 1, 1), date(2025, 1, 31)))
+
+    def test_xml_statement(self):
+        stmt, created, errors = self.import_ofx(OFX_XML, "feb.qfx")
+        self.assertEqual((created, errors), (2, []))
+        self.assertEqual((stmt.statement_start_date, stmt.statement_end_date), (date(2025, 2, 1), date(2025, 2, 28)))
+
+    def test_fitids_already_imported_from_another_statement_are_skipped(self):
+        self.import_ofx(OFX_SGML, "jan.ofx")
+        overlap = OFX_SGML.replace(b"<FITID>F2<NAME>PAYROLL", b"<FITID>F9<NAME>BONUS")
+        stmt, created, errors = self.import_ofx(overlap, "jan-again.ofx")
+        self.assertEqual(created, 1)
+        self.assertEqual(errors, ["Skipped 1 transaction(s) already imported from another statement."])
+        self.assertEqual(list(Transaction.objects.filter(statement=stmt).values_list("raw_reference", flat=True)), ["F9"])
+        self.assertEqual(Transaction.objects.filter(account=self.checking, raw_reference="F1").count(), 1)
+
+
+    def test_fitids_moved_to_the_archive_are_skipped(self):
+        self.import_ofx(OFX_SGML, "jan.ofx")
+        self.assertEqual(archive_user(self.user.pk, 2025), 2)
+        overlap = OFX_SGML.replace(b"<FITID>F2<NAME>PAYROLL", b"<FITID>F9<NAME>BONUS")
+        stmt, created, errors = self.import_ofx(overlap, "jan-again.ofx")
+        self.assertEqual(created, 1)
+        self.assertEqual(list(Transaction.objects.filter(statement=stmt).values_list("raw_reference", flat=True)), ["F9"])
+
+    def test_csv_name_is_kept(self):
+        self.assertIs(import_statement_csv, import_statement)
+
+class RecurringRulesTests(SimpleTestCase):
+    def test_normalize_description(self):
+        self.assertEqual(normalize_description("NETFLIX.COM 866-579-7172 CA #1234"), "netflix ca")
+        self.assertEqual(normalize_description("POS PURCHASE Spotify USA 0042"), "spotify usa")
+        self.assertEqual(normalize_description("one two three four five six seven"), "one two three four five")
+        self.assertEqual(normalize_description("#1234 / 99"), "")
+        self.assertEqual(normalize_description(None), "")
+
+    def test_amount_band(self):
+        self.assertEqual(amount_band(0), 0)
+        self.assertEqual(amount_band(Decimal("10.00")), amount_band(Decimal("11.00")))
+        self.assertNotEqual(amount_band(Decimal("10.00")), amount_band(Decimal("12.50")))
+        self.assertEqual(amount_band(Decimal("-10.00")), -amount_band(Decimal("10.00")))
+
+    def test_classify(self):
+        monthly = [date(2025, 1, 15), date(2025, 2, 14), date(2025, 3, 15), date(2025, 4, 15)]
+        self.assertEqual(classify(monthly)[:2], (RecurringSeries.MONTHLY, 30))  # gaps 30, 29, 31
+        self.assertEqual(classify(monthly)[2], 1.0)
+        self.assertIsNone(classify(monthly[:2]))  # three occurrences needed
+        self.assertEqual(classify([date(2023, 3, 1), date(2024, 3, 2)])[0], RecurringSeries.ANNUAL)
+        weekly = [date(2025, 1, 1) + timedelta(days=7 * n) for n in range(4)]
+        self.assertEqual(classify(weekly)[0], RecurringSeries.WEEKLY)
+        self.assertIsNone(classify([date(2025, 1, 1), date(2025, 1, 9), date(2025, 3, 20), date(2025, 3, 24)]))
+        # Mostly monthly with two stray gaps: below the confidence threshold
+        self.assertIsNone(
+            classify([date(2025, 1, 1), date(2025, 1, 31), date(2025, 2, 10), date(2025, 3, 12), date(2025, 3, 20)])
+        )
+
+
+class DetectRecurringCommandTests(BudgetDataTestCase):
+    def test_backfills_hot_and_archived_rows_page_by_page(self):
+        stmt, _, _ = self.import_rows(
+            self.checking,
+            ("2025-01-15", "NETFLIX.COM 866-579-7172", "-15.49"),
+            ("2025-02-15", "NETFLIX.COM 866-579-7172", "-15.49"),
+            ("2025-03-15", "NETFLIX.COM 866-579-7172", "-15.49"),
+            ("2025-03-16", "#0001", "-1.00"),
+        )
+        ArchivedTransaction.objects.create(
+            id=10_000, user=self.user, account=self.checking, statement=stmt,
+            transaction_date=date(2024, 12, 15), description="NETFLIX.COM 866-579-7172", amount=Decimal("-15.49"),
+        )
+        Transaction.objects.update(merchant_key="")
+        RecurringSeries.objects.all().delete()
+
+        out = io.StringIO()
+        with mock.patch("budget.management.commands.detect_recurring.BATCH_SIZE", 2):
+            call_command("detect_recurring", stdout=out)
+
+        self.assertIn("Backfilled 4 merchant key(s); 1 recurring series found.", out.getvalue())
+        self.assertEqual(set(Transaction.objects.values_list("merchant_key", flat=True)), {"netflix", ""})
+        self.assertEqual(ArchivedTransaction.objects.get().merchant_key, "netflix")
+        series = RecurringSeries.objects.get()
+        self.assertEqual((series.merchant_key, series.cadence), ("netflix", RecurringSeries.MONTHLY))
+
+
+    def test_users_with_only_archived_rows_are_included(self):
+        self.import_rows(
+            self.checking,
+            ("2023-01-15", "NETFLIX.COM 866-579-7172", "-15.49"),
+            ("2023-02-15", "NETFLIX.COM 866-579-7172", "-15.49"),
+            ("2023-03-15", "NETFLIX.COM 866-579-7172", "-15.49"),
+        )
+        archive_user(self.user.pk, 2023)
+        self.assertFalse(Transaction.objects.exists())
+        RecurringSeries.objects.all().delete()
+
+        out = io.StringIO()
+        call_command("detect_recurring", stdout=out)
+        self.assertIn("1 recurring series found.", out.getvalue())
+
+class ArchiveTests(BudgetDataTestCase):
+    def summary(self, **params):
+        response = self.client.get(reverse("budget:api_monthly_summary"), {"start": "2023-01-01", **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_archived_year_keeps_totals_and_transfer_status(self):
+        self.import_rows(
+            self.checking,
+            ("2023-03-10", "Card payment", "-200.00"),
+            ("2023-05-01", "Salary", "1000.00"),
+            ("2023-05-02", "Coffee", "-4.00"),
+            ("2023-12-30", "Card payment", "-50.00"),
+            ("2025-01-05", "Coffee", "-3.00"),
+        )
+        self.import_rows(
+            self.card, ("2023-03-11", "Payment received", "200.00"), ("2024-01-02", "Payment received", "50.00"),
+            name="card.csv",
+        )
+        self.assertEqual(TransferLink.objects.count(), 2)
+        self.client.force_login(self.user)
+        before = (self.summary(), self.summary(transfers="include"))
+        self.assertEqual([m["month"] for m in before[0]["results"]][:2], ["2023-05", "2025-01"])
+
+        self.assertEqual(archive_user(self.user.pk, 2023), 4)
+
+        self.assertEqual(
+            sorted(ArchivedTransaction.objects.values_list("description", "amount", "is_transfer")),
+            [
+                ("Card payment", Decimal("-200.00"), True),
+                ("Coffee", Decimal("-4.00"), False),
+                ("Payment received", Decimal("200.00"), True),
+                ("Salary", Decimal("1000.00"), False),
+            ],
+        )
+        # The pair across the year boundary stays hot, with its link
+        link = TransferLink.objects.get()
+        self.assertEqual((link.outflow.transaction_date, link.inflow.transaction_date), (date(2023, 12, 30), date(2024, 1, 2)))
+        self.assertFalse(Transaction.objects.filter(transaction_date__lt=date(2023, 12, 1)).exists())
+        self.assertEqual(Transaction.objects.count(), 3)
+        self.assertEqual((self.summary(), self.summary(transfers="include")), before)
+        self.assertEqual(archive_user(self.user.pk, 2023), 0)
+
+
+class EnvelopeTests(BudgetDataTestCase):
+    JANUARY = date(2025, 1, 1)
+
+    def setUp(self):
+        super().setUp()
+        clear_fx_cache()
+        self.addCleanup(clear_fx_cache)
+        self.everything = Envelope.objects.create(
+            user=self.user, name="Everything", monthly_limit=Decimal("100"), currency="USD"
+        )
+        self.cards = Envelope.objects.create(
+            user=self.user, name="Cards", account_type=Account.CREDIT, monthly_limit=Decimal("1000"), currency="USD"
+        )
+
+    def actual(self, envelope, month=JANUARY):
+        row = EnvelopeMonth.objects.filter(envelope=envelope, month=month).first()
+        return row.actual if row else Decimal(0)
+
+    def test_imports_add_outflows_by_scope(self):
+        self.import_rows(self.checking, ("2025-01-02", "Coffee", "-4.00"), ("2025-01-03", "Refund", "20.00"))
+        self.import_rows(self.card, ("2025-01-05", "Books", "-30.00"), ("2025-02-01", "Fuel", "-40.00"), name="card.csv")
+        self.assertEqual(self.actual(self.everything), Decimal("34.00"))  # refunds do not reduce spend
+        self.assertEqual(self.actual(self.cards), Decimal("30.00"))
+        self.assertEqual(self.actual(self.everything, date(2025, 2, 1)), Decimal("40.00"))
+
+    def test_new_transfer_link_subtracts_the_counted_side(self):
+        self.import_rows(self.checking, ("2025-01-10", "Card payment", "-500.00"), ("2025-01-11", "Coffee", "-4.00"))
+        self.assertEqual(self.actual(self.everything), Decimal("504.00"))
+        self.import_rows(self.card, ("2025-01-11", "Payment received", "500.00"), name="card.csv")
+        self.assertEqual(TransferLink.objects.count(), 1)
+        self.assertEqual(self.actual(self.everything), Decimal("4.00"))
+
+    def test_overspend_is_flagged_once_and_cleared(self):
+        tv, _, errors = self.import_rows(self.checking, ("2025-01-02", "TV", "-150.00"), name="a.csv")
+        self.assertEqual(
+            errors, ['Budget "Everything" is over its limit for January 2025: 150.00 of 100.00 USD spent.']
+        )
+        month = EnvelopeMonth.objects.get(envelope=self.everything, month=self.JANUARY)
+        self.assertIsNotNone(month.overspent_at)
+
+        _, _, errors = self.import_rows(self.checking, ("2025-01-03", "Coffee", "-4.00"), name="b.csv")
+        self.assertEqual(errors, [])  # already over: no second warning
+        self.assertEqual(EnvelopeMonth.objects.get(pk=month.pk).overspent_at, month.overspent_at)
+
+        tv.delete()
+        month = EnvelopeMonth.objects.get(envelope=self.everything, month=self.JANUARY)
+        self.assertEqual((month.actual, month.overspent_at), (Decimal("4.00"), None))
+
+    def test_refresh_matches_the_incremental_totals(self):
+        self.import_rows(self.checking, ("2025-01-10", "Card payment", "-500.00"), ("2025-01-11", "Coffee", "-4.00"))
+        self.import_rows(
+            self.card, ("2025-01-11", "Payment received", "500.00"), ("2025-01-12", "Books", "-30.00"), name="card.csv"
+        )
+        incremental = sorted(EnvelopeMonth.objects.values_list("envelope_id", "month", "actual"))
+        EnvelopeMonth.objects.update(actual=Decimal("999"))
+        refresh_envelopes(self.user.pk)
+        self.assertEqual(sorted(EnvelopeMonth.objects.values_list("envelope_id", "month", "actual")), incremental)
+
+    def test_failing_import_step_rolls_back_the_whole_import(self):
+        self.import_rows(self.checking, ("2025-01-02", "Coffee", "-4.00"), name="a.csv")
+        stmt = self.add_statement(self.checking, statement_csv(("2025-01-03", "Books", "-12.00")), "b.csv")
+        with mock.patch("budget.importers.match_for_transactions", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                import_statement(stmt)
+        stmt.refresh_from_db()
+        self.assertEqual((stmt.parsed_ok, stmt.row_count, stmt.statement_start_date), (False, 0, None))
+        self.assertFalse(Transaction.objects.filter(statement=stmt).exists())
+        self.assertEqual(self.actual(self.everything), Decimal("4.00"))
+
+        import_statement(stmt)  # a retry applies it once
+        self.assertEqual(self.actual(self.everything), Decimal("16.00"))
+
+    def test_account_currency_change_and_fx_reload_refresh_actuals(self):
+        FxRate.objects.create(currency="EUR", rate_date=date(2024, 12, 1), rate=Decimal("1.50"))
+        bump_fx_rates_version()
+        self.import_rows(self.checking, ("2025-01-02", "Coffee", "-4.00"))
+        self.assertEqual(self.actual(self.everything), Decimal("4.00"))
+
+        self.checking.currency = "EUR"
+        self.checking.save()
+        self.assertEqual(self.actual(self.everything), Decimal("6.00"))
+
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write("date,currency,rate\n2025-01-01,EUR,2.00\n")
+        self.addCleanup(os.remove, f.name)
+        call_command("load_fx_rates", f.name, stdout=io.StringIO())
+        self.assertEqual(self.actual(self.everything), Decimal("8.00"))
+
+
+class ReparseTests(BudgetDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first, _, _ = self.import_rows(
+            self.checking, ("2025-01-02", "Coffee", "-4.00"), ("2025-01-03", "Books", "-12.00"), name="a.csv"
+        )
+        self.second, _, _ = self.import_rows(self.checking, ("2025-02-02", "Fuel", "-40.00"), name="b.csv")
+        self.bank.mapping_version = 2
+        self.bank.save()
+
+    def rows(self, stmt):
+        return sorted(Transaction.objects.filter(statement=stmt).values_list("pk", "description", "tags_mask"))
+
+    def test_stale_detection(self):
+        self.assertEqual(set(stale_statements()), {self.first, self.second})
+        ofx_stmt = self.add_statement(self.checking, OFX_SGML, "jan.ofx")
+        import_statement(ofx_stmt)
+        self.assertNotIn(ofx_stmt, stale_statements())  # only CSV mappings change
+
+        result = reparse_in_batches([self.first.pk, self.second.pk], batch_size=1)
+        self.assertEqual((result.statements, result.deleted, result.created, result.failed), (2, 3, 3, []))
+        self.assertFalse(stale_statements().exists())
+
+    def test_pool_keeps_a_bounded_window_of_batches(self):
+        statements = [self.first, self.second] + [
+            self.import_rows(self.checking, (f"2025-0{month}-02", "Fuel", "-40.00"), name=f"{month}.csv")[0]
+            for month in range(3, 6)
+        ]
+        BankStatement.objects.update(mapping_version_used=1)
+        submitted, written, in_flight = [], [], []
+
+        class InlinePool:
+            # Runs each batch on submit, in this process (the test database is not shared)
+            def __init__(self, **kwargs):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def submit(self, fn, batch):
+                future = Future()
+                future.set_result(reparse.parse_batch(batch))
+                submitted.append(batch)
+                return future
+
+        def write_batch(parsed):
+            written.append(parsed)
+            in_flight.append(len(submitted) - len(written) + 1)
+            return write(parsed)
+
+        write = reparse.write_batch
+        with mock.patch.multiple(
+            "budget.reparse", ProcessPoolExecutor=InlinePool, write_batch=write_batch, connections=mock.DEFAULT
+        ):
+            result = reparse_in_batches([stmt.pk for stmt in statements], batch_size=1, workers=2)
+        self.assertEqual((result.statements, result.created), (5, 6))
+        self.assertLessEqual(max(in_flight), 4)  # 2 * workers, not all 5 batches at once
+
+    def test_tags_carry_over_to_identical_rows(self):
+        Transaction.objects.filter(statement=self.first, description="Books").update(tags_mask=0b101)
+        reparse_in_batches([self.first.pk])
+        self.assertEqual(sorted(row[1:] for row in self.rows(self.first)), [("Books", 0b101), ("Coffee", 0)])
+
+    def test_unreadable_file_keeps_its_old_rows(self):
+        old_first, old_second = self.rows(self.first), self.rows(self.second)
+        parse = reparse.parse_statement_csv
+
+        def fail_on_second(stmt, metrics):
+            if stmt.pk == self.second.pk:
+                raise ValueError("row 1: cannot read date")
+            return parse(stmt, metrics)
+
+        with mock.patch("budget.reparse.parse_statement_csv", fail_on_second), self.assertLogs("budget.reparse", "ERROR"):
+            result = reparse_in_batches([self.first.pk, self.second.pk])
+
+        self.assertEqual(result.failed, [self.second.pk])
+        self.assertNotEqual(self.rows(self.first), old_first)  # replaced by new rows
+        self.assertEqual(self.rows(self.second), old_second)
+        self.second.refresh_from_db()
+        self.assertEqual((self.second.parsed_ok, self.second.parse_error), (True, "row 1: cannot read date"))
+        self.assertEqual(list(stale_statements()), [self.second])
+
+    def test_failed_write_rolls_back_the_batch(self):
+        old = self.rows(self.first) + self.rows(self.second)
+        save = reparse.save_parsed_statement
+
+        def fail_on_second(stmt, *args):
+            if stmt.pk == self.second.pk:
+                raise RuntimeError("disk full")
+            return save(stmt, *args)
+
+        with mock.patch("budget.reparse.save_parsed_statement", fail_on_second), self.assertRaises(RuntimeError):
+            reparse_in_batches([self.first.pk, self.second.pk])
+        self.assertEqual(self.rows(self.first) + self.rows(self.second), old)
+        self.assertEqual(set(stale_statements()), {self.first, self.second})
+
+
+class TagTests(BudgetDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c = (create_tag(self.user.pk, name) for name in ("a", "b", "c"))
+        self.import_rows(
+            self.checking,
+            *[(f"2025-01-0{n}", description, "-1.00") for n, description in enumerate(["none", "a", "ab", "bc"], 1)],
+        )
+        masks = {"none": 0, "a": self.a.mask, "ab": self.a.mask | self.b.mask, "bc": self.b.mask | self.c.mask}
+        for description, mask in masks.items():
+            Transaction.objects.filter(description=description).update(tags_mask=mask)
+
+    def descriptions(self, **masks):
+        qs = filter_by_tags(Transaction.objects.filter(user=self.user), **masks)
+        return sorted(qs.values_list("description", flat=True))
+
+    def test_filter_by_tags(self):
+        a, b, c = self.a.mask, self.b.mask, self.c.mask
+        self.assertEqual(self.descriptions(all_of=a), ["a", "ab"])
+        self.assertEqual(self.descriptions(all_of=a | b), ["ab"])
+        self.assertEqual(self.descriptions(none_of=a), ["bc", "none"])
+        self.assertEqual(self.descriptions(all_of=b, none_of=c), ["ab"])
+        self.assertEqual(self.descriptions(any_of=a | c), ["a", "ab", "bc"])
+        self.assertEqual(self.descriptions(any_of=c, none_of=a), ["bc"])
+        self.assertEqual(self.descriptions(all_of=a, none_of=a), [])
+        self.assertEqual(self.descriptions(), ["a", "ab", "bc", "none"])
+
+    def test_update_tags(self):
+        envelope = Envelope.objects.create(
+            user=self.user, name="C", tag=self.c, monthly_limit=Decimal("50"), currency="USD"
+        )
+        before = get_data_version(self.user.pk)[0]
+        other = get_user_model().objects.create_user("other", "other@example.com", "pw-other-123")
+        rows = Transaction.objects.filter(description__in=["none", "ab"])
+
+        self.assertEqual(update_tags(other.pk, rows, add=self.c.mask), 0)  # not their rows
+        self.assertEqual(update_tags(self.user.pk, rows), 0)
+        self.assertEqual(get_data_version(self.user.pk)[0], before)
+
+        self.assertEqual(update_tags(self.user.pk, rows, add=self.c.mask, remove=self.a.mask), 2)
+        self.assertEqual(self.descriptions(all_of=self.c.mask), ["ab", "bc", "none"])
+        self.assertEqual(self.descriptions(any_of=self.a.mask), ["a"])
+        self.assertGreater(get_data_version(self.user.pk)[0], before)
+        self.assertEqual(EnvelopeMonth.objects.get(envelope=envelope).actual, Decimal("3.00"))
+
+    def test_deleted_tag_bit_is_cleared_before_reuse(self):
+        stmt = Transaction.objects.get(description="a").statement
+        ArchivedTransaction.objects.create(
+            id=10_000, user=self.user, account=self.checking, statement=stmt, transaction_date=date(2023, 1, 1),
+            description="old", amount=Decimal("-1.00"), tags_mask=self.a.mask | self.c.mask,
+        )
+        bit = self.a.bit
+        self.a.delete()
+        self.assertFalse(Transaction.objects.filter(tags_mask__gt=0, description__in=["a", "none"]).exists())
+        self.assertEqual(Transaction.objects.get(description="ab").tags_mask, self.b.mask)
+        self.assertEqual(ArchivedTransaction.objects.get().tags_mask, self.c.mask)
+
+        reused = create_tag(self.user.pk, "d")
+        self.assertEqual(reused.bit, bit)
+        self.assertEqual(self.descriptions(any_of=reused.mask), [])
+
+    def test_highest_bit_and_limit(self):
+        for n in range(3, Tag.MAX_PER_USER):
+            create_tag(self.user.pk, f"t{n}")
+        last = Tag.objects.get(user=self.user, bit=Tag.MAX_PER_USER - 1)
+        update_tags(self.user.pk, Transaction.objects.filter(description="none"), add=last.mask)
+        self.assertEqual(self.descriptions(all_of=last.mask), ["none"])
+        self.assertEqual(self.descriptions(none_of=last.mask), ["a", "ab", "bc"])
+        with self.assertRaises(TagError):
+            create_tag(self.user.pk, "one too many")
+
+
+class VersionedApiTests(BudgetDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.url = reverse("budget:api_transactions")
+        self.statement, _, _ = self.import_rows(
+            self.checking,
+            ("2025-01-03", "t1", "-1.00"),
+            ("2025-01-03", "t2", "-2.00"),
+            ("2025-01-03", "t3", "-3.00"),
+            ("2025-01-02", "t4", "-4.00"),
+            ("2025-01-02", "t5", "-5.00"),
+            ("2025-01-01", "t6", "-6.00"),
+            ("2024-12-31", "t7", "-7.00"),
+        )
+
+    def etag(self, url=None):
+        response = self.client.get(url or self.url)
+        self.assertEqual(response.status_code, 200)
+        return response["ETag"]
+
+    def test_unchanged_poll_is_a_304_after_one_lookup(self):
+        etag = self.etag()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        budget_queries = [q["sql"] for q in queries if "budget_" in q["sql"]]
+        self.assertEqual(len(budget_queries), 1, budget_queries)  # the DataVersion; the rest is session auth
+        self.assertIn("budget_dataversion", budget_queries[0])
+        self.assertNotEqual(self.etag(self.url + "?limit=2"), etag)
+
+    def test_errors_carry_no_validators(self):
+        response = self.client.get(self.url, {"start": "bogus"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header("ETag") or response.has_header("Last-Modified"))
+
+    def test_data_changes_change_the_etag(self):
+        def assert_changed(change):
+            etag = self.etag()
+            change()
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+
+        def rename_account():
+            self.checking.name = "Everyday"
+            self.checking.save()
+
+        assert_changed(lambda: self.import_rows(self.card, ("2025-01-04", "new", "-8.00"), name="card.csv"))
+        assert_changed(rename_account)
+        assert_changed(self.statement.delete)
+
+    def test_cursor_pages_are_stable(self):
+        everything = [row["description"] for row in self.client.get(self.url).json()["results"]]
+        self.assertEqual(everything, ["t3", "t2", "t1", "t5", "t4", "t6", "t7"])
+
+        first = self.client.get(self.url, {"limit": 3}).json()
+        self.assertEqual([row["description"] for row in first["results"]], ["t3", "t2", "t1"])
+        # A newer row arriving between requests does not shift the following pages
+        self.import_rows(self.card, ("2025-01-03", "late", "-9.00"), name="card.csv")
+        pages, cursor = [first], first["next_cursor"]
+        while cursor:
+            pages.append(self.client.get(self.url, {"limit": 3, "cursor": cursor}).json())
+            cursor = pages[-1]["next_cursor"]
+        self.assertEqual([[row["description"] for row in page["results"]] for page in pages], [
+            ["t3", "t2", "t1"], ["t5", "t4", "t6"], ["t7"],
+        ])
+        self.assertEqual(self.client.get(self.url, {"cursor": "garbage"}).status_code, 400)
+
+
+class ContentAddressedStorageTests(BudgetDataTestCase):
+    def stored_files(self):
+        root = os.path.join(self.media, "statements", "sha256")
+        return sorted(os.path.relpath(os.path.join(d, f), self.media) for d, _, files in os.walk(root) for f in files)
+
+    def test_identical_uploads_share_one_file(self):
+        data = statement_csv(("2025-01-02", "Coffee", "-3.50"))
+        other = get_user_model().objects.create_user("other", "other@example.com", "pw-other-123")
+        other_account = Account.objects.create(user=other, bank=self.bank, name="Theirs")
+
+        first = self.add_statement(self.checking, data, "january.csv")
+        second = self.add_statement(self.card, data, "copy.csv")
+        third = BankStatement.objects.create(
+            user=other, account=other_account, source_file=ContentFile(data, name="mine.csv"),
+            file_hash=hashlib.sha256(data).hexdigest(),
+        )
+        different = self.add_statement(self.checking, statement_csv(("2025-01-03", "Tea", "-2.00")))
+
+        self.assertEqual(second.source_file.name, first.source_file.name)
+        self.assertEqual(third.source_file.name, first.source_file.name)
+        self.assertNotEqual(different.source_file.name, first.source_file.name)
+        self.assertEqual(self.stored_files(), sorted([first.source_file.name, different.source_file.name]))
+        self.assertEqual(import_statement(second), (1, []))
+
+    def test_file_is_deleted_with_its_last_statement(self):
+        data = statement_csv(("2025-01-02", "Coffee", "-3.50"))
+        first = self.add_statement(self.checking, data, "a.csv")
+        second = self.add_statement(self.card, data, "b.csv")
+        name = first.source_file.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.stored_files(), [name])
+        self.assertEqual(import_statement(second), (1, []))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self.stored_files(), [])
+
+
+    def test_storing_and_releasing_take_the_hash_lock(self):
+        data = statement_csv(("2025-01-02", "Coffee", "-3.50"))
+        digest = hashlib.sha256(data).hexdigest()
+        storage = BankStatement._meta.get_field("source_file").storage
+        locked = []
+
+        def save(name, content, **kwargs):
+            locked.append(StatementFileLock.objects.filter(file_hash=digest).exists())
+            return original(name, content, **kwargs)
+
+        original = storage._save
+        with mock.patch.object(storage, "_save", side_effect=save):
+            stmt = self.add_statement(self.checking, data, "a.csv")
+        self.assertEqual(locked, [True])  # the file is written (or reused) under the lock
+
+        with mock.patch.object(StatementFileLock, "acquire", wraps=StatementFileLock.acquire) as acquire:
+            with self.captureOnCommitCallbacks(execute=True):
+                stmt.delete()
+        acquire.assert_called_once_with(digest)
+        self.assertEqual(self.stored_files(), [])
+
+class StreamingUploadMixin:
+    def setUp(self):
+        super().setUp()
+        self.spool = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(FILE_UPLOAD_TEMP_DIR=self.spool, STATEMENT_UPLOAD_MAX_BYTES=1000))
+        self.client.force_login(self.user)
+        self.session = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.data = statement_csv(("2025-01-02", "Coffee", "-3.50"))
+
+    def upload(self, chunks, sha256="", length=None, filename="jan.csv"):
+        """
+        (status, payload, body chunks the app read) for one POST to the streaming endpoint.
+        """
+        async def django_app(scope, receive, send):
+            raise AssertionError("passed through to Django")
+
+        app = StreamingStatementUpload(django_app)
+        self.addCleanup(app.pool.shutdown)
+        pending = [
+            {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1} for i, chunk in enumerate(chunks)
+        ]
+        read, sent = [], []
+
+        async def receive():
+            message = pending.pop(0)
+            read.append(message["body"])
+            return message
+
+        async def send(message):
+            sent.append(message)
+
+        headers = [
+            (b"content-type", b"application/octet-stream"),
+            (b"cookie", f"{settings.SESSION_COOKIE_NAME}={self.session}".encode()),
+        ]
+        if sha256:
+            headers.append((b"x-content-sha256", sha256.encode()))
+        if length is not None:
+            headers.append((b"content-length", str(length).encode()))
+        scope = {
+            "type": "http", "method": "POST", "path": "/budget/upload/stream/", "headers": headers,
+            "query_string": f"account={self.checking.pk}&filename={filename}".encode(),
+        }
+        async_to_sync(app)(scope, receive, send)
+        return sent[0]["status"], json.loads(sent[1]["body"]), read
+
+
+class StreamingUploadImportTests(StreamingUploadMixin, BudgetDataMixin, TransactionTestCase):
+    """
+    The import runs on the upload's thread pool, which only sees committed data.
+    """
+
+    def test_streamed_body_is_stored_and_imported(self):
+        data = statement_csv(("2025-01-02", "Coffee", "-3.50"), ("2025-01-03", "Salary", "100.00"))
+        status, payload, read = self.upload([data[:7], data[7:20], data[20:]])
+        self.assertEqual((status, len(read)), (201, 3))
+        stmt = BankStatement.objects.get()
+        self.assertEqual(payload, {"statement_id": stmt.pk, "created": 2, "errors": []})
+        self.assertEqual((stmt.file_hash, stmt.parsed_ok), (hashlib.sha256(data).hexdigest(), True))
+        with stmt.source_file.open("rb") as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(
+            sorted(Transaction.objects.filter(statement=stmt).values_list("description", flat=True)),
+            ["Coffee", "Salary"],
+        )
+        self.assertEqual(os.listdir(self.spool), [])
+
+    def test_unexpected_error_is_a_json_500(self):
+        with mock.patch("budget.asgi_upload.import_statement", side_effect=RuntimeError("boom")):
+            with self.assertLogs("budget.asgi_upload", "ERROR"):
+                status, payload, _ = self.upload([self.data])
+        self.assertEqual((status, payload), (500, {"error": "The upload could not be processed."}))
+        self.assertEqual(os.listdir(self.spool), [])
+
+
+class StreamingUploadTests(StreamingUploadMixin, BudgetDataTestCase):
+    """
+    The rejections happen before the import pool is involved, so they run against the test
+    transaction directly.
+    """
+
+    def test_duplicate_is_rejected(self):
+        self.add_statement(self.checking, self.data)
+        digest = hashlib.sha256(self.data).hexdigest()
+        status, payload, read = self.upload([self.data], sha256=digest)
+        self.assertEqual((status, read), (409, []))  # refused before reading the body
+        self.assertIn("already uploaded", payload["error"])
+        status, _, read = self.upload([self.data[:10], self.data[10:]])
+        self.assertEqual((status, len(read)), (409, 2))  # no header: found by hashing the body
+        self.assertEqual(BankStatement.objects.count(), 1)
+        self.assertEqual(os.listdir(self.spool), [])
+
+    def test_oversize_body_is_rejected(self):
+        status, payload, read = self.upload([self.data], length=5000)
+        self.assertEqual((status, payload, read), (413, {"error": "File too large."}, []))
+        # A body longer than it claims is cut off while streaming
+        status, _, read = self.upload([b"x" * 600, b"x" * 600, b"x" * 600], length=10)
+        self.assertEqual((status, len(read)), (413, 2))
+        self.assertEqual(os.listdir(self.spool), [])
+        self.assertFalse(BankStatement.objects.exists())
+
+    def test_hash_mismatch_is_rejected(self):
+        status, payload, _ = self.upload([self.data], sha256=hashlib.sha256(b"something else").hexdigest())
+        self.assertEqual((status, payload), (400, {"error": "X-Content-SHA256 does not match the uploaded body."}))
+        self.assertEqual(os.listdir(self.spool), [])
+        self.assertFalse(BankStatement.objects.exists())
+
+
+class SnapshotTests(BudgetDataTestCase):
+    def generation(self):
+        return json.loads((snapshot.snapshot_root() / str(self.user.pk) / "meta.json").read_text())["generation"]
+
+    def test_command_covers_users_with_only_archived_rows(self):
+        self.import_rows(self.checking, ("2023-01-10", "Coffee", "-4.00"), ("2023-02-10", "Tea", "-3.00"))
+        archive_user(self.user.pk, 2023)
+        out = io.StringIO()
+        call_command("build_analytics_snapshots", stdout=out)
+        self.assertIn(f"user {self.user.pk}: 2 rows", out.getvalue())
+
+    def test_import_appends_and_flags_newly_paired_rows(self):
+        self.import_rows(self.checking, ("2025-01-10", "Card payment", "-500.00"), ("2025-01-11", "Coffee", "-4.00"))
+        self.assertFalse((snapshot.snapshot_root() / str(self.user.pk)).exists())  # built on first read only
+        snap = snapshot.current_snapshot(self.user.pk)
+        self.assertEqual((len(snap), list(snap.columns["transfer"])), (2, [False, False]))
+        generation = self.generation()
+
+        self.import_rows(self.card, ("2025-01-11", "Payment received", "500.00"), name="card.csv")
+
+        snap = snapshot.current_snapshot(self.user.pk)
+        self.assertEqual(self.generation(), generation)  # appended in place, not rebuilt
+        self.assertEqual(snap.data_version, get_data_version(self.user.pk)[0])
+        self.assertEqual(list(snap.columns["cents"]), [-50000, -400, 50000])
+        self.assertEqual(list(snap.columns["transfer"]), [True, False, True])
+        self.assertEqual(snap.merchants[snap.columns["merchant"][1]], "coffee")
+
+    def test_other_changes_rebuild_on_next_read(self):
+        stmt, _, _ = self.import_rows(self.checking, ("2025-01-10", "Coffee", "-4.00"))
+        snapshot.current_snapshot(self.user.pk)
+        generation = self.generation()
+
+        bump_data_version(self.user.pk)  # e.g. an account edit between two imports
+        self.import_rows(self.checking, ("2025-01-12", "Tea", "-2.00"), name="b.csv")
+        self.assertEqual(self.generation(), generation)  # not appended onto a stale snapshot
+        snap = snapshot.current_snapshot(self.user.pk)
+        self.assertNotEqual(self.generation(), generation)
+        self.assertEqual(list(snap.columns["cents"]), [-400, -200])
+        user_dir = snapshot.snapshot_root() / str(self.user.pk)
+        self.assertEqual([p.name for p in user_dir.iterdir() if p.is_dir()], [self.generation()])
+
+        stmt.delete()
+        self.assertEqual(list(snapshot.current_snapshot(self.user.pk).columns["cents"]), [-200])
+
+
+class RequestProfilingTests(BudgetDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.profiles = os.path.join(self.media, "profiles")
+        self.enterContext(override_settings(PROFILE_SLOW_MS=0, PROFILE_SAMPLE_RATE=0, PROFILE_DIR=self.profiles))
+        endpoint_stats.reset()
+        self.addCleanup(endpoint_stats.reset)
+        self.client.force_login(self.user)
+
+    def test_flags_routes_not_paths(self):
+        other = Bank.objects.create(name="Other")
+        for bank in (self.bank, other, self.bank):
+            self.client.get(reverse("budget:bank_edit", args=[bank.pk]))
+        self.client.get("/no/such/page/")
+        self.client.get("/no/other/page/")
+
+        self.assertEqual(endpoint_stats.flagged, {"GET /budget/banks/<int:pk>/edit/"})
+        endpoints = {r["endpoint"]: r["count"] for r in endpoint_stats.slowest()}
+        self.assertEqual(endpoints, {"GET /budget/banks/<int:pk>/edit/": 3, "GET /(unresolved)": 2})
+        # The flagged route's later requests ran under the profiler
+        self.assertEqual(len([n for n in os.listdir(self.profiles) if n.endswith(".prof")]), 2)
+
+    def test_captures_are_capped(self):
+        with override_settings(PROFILE_MAX_CAPTURES=2):
+            for _ in range(4):
+                self.client.get(reverse("budget:bank_list"))
+        self.assertEqual(len([n for n in os.listdir(self.profiles) if n.endswith(".json")]), 2)
+
+    def test_server_timing_is_staff_only(self):
+        self.assertFalse(self.client.get(reverse("budget:bank_list")).has_header("Server-Timing"))
+        self.user.is_staff = True
+        self.user.save()
+        self.assertIn("db;dur=", self.client.get(reverse("budget:bank_list"))["Server-Timing"])
+
+    def test_busy_profiler_skips_profiling(self):
+        endpoint_stats.flagged.add("GET /budget/banks/")
+        with mock.patch("cProfile.Profile.enable", side_effect=ValueError("Another profiling tool is already active")):
+            response = self.client.get(reverse("budget:bank_list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([n for n in os.listdir(self.profiles) if n.endswith(".prof")], [])
+
+
+class PrecompressedStaticTests(SimpleTestCase):
+    def setUp(self):
+        root = self.enterContext(tempfile.TemporaryDirectory())
+        for name, content in (("app.css", b"body{}"), ("app.css.br", b"br"), ("app.css.gz", b"gz")):
+            with open(os.path.join(root, name), "wb") as f:
+                f.write(content)
+        self.enterContext(override_settings(SERVE_STATIC_ROOT=True, STATIC_ROOT=root, STATIC_URL="/static/"))
+        self.middleware = PrecompressedStaticMiddleware(lambda request: None)
+
+    def get(self, encoding, etag=None):
+        headers = {"Accept-Encoding": encoding}
+        if etag:
+            headers["If-None-Match"] = etag
+        return self.middleware(RequestFactory().get("/static/app.css", headers=headers))
+
+    def test_each_encoding_has_its_own_etag(self):
+        responses = {encoding: self.get(encoding) for encoding in ("br", "gzip", "identity")}
+        etags = {encoding: r["ETag"] for encoding, r in responses.items()}
+        self.assertEqual(len(set(etags.values())), 3)
+        self.assertTrue(etags["br"].endswith('-br"') and etags["gzip"].endswith('-gz"'))
+        self.assertEqual(b"".join(responses["br"].streaming_content), b"br")
+
+        self.assertEqual(self.get("br", etag=etags["br"]).status_code, 304)
+        # A cached gzip body must not be revalidated as the identity (or br) representation
+        self.assertEqual(self.get("identity", etag=etags["gzip"]).status_code, 200)
+        self.assertEqual(self.get("br", etag=etags["gzip"]).status_code, 200)
+        # Lists and weak validators (as proxies rewrite them) match too
+        self.assertEqual(self.get("br", etag=f'"other", W/{etags["br"]}').status_code, 304)
+        self.assertEqual(self.get("gzip", etag="*").status_code, 304)
+
+
+class CompressedStaticStorageTests(SimpleTestCase):
+    def test_collectstatic_writes_worthwhile_variants(self):
+        source = self.enterContext(tempfile.TemporaryDirectory())
+        root = self.enterContext(tempfile.TemporaryDirectory())
+        files = {
+            "app.css": b"body { margin: 0; padding: 0; }\n" * 40,
+            "tiny.css": b"body{}",  # under MIN_COMPRESS_SIZE
+            "noise.txt": os.urandom(4096),  # does not shrink
+            "logo.png": b"\x89PNG" + b"\0" * 4096,  # not a compressible type
+        }
+        for name, content in files.items():
+            with open(os.path.join(source, name), "wb") as f:
+                f.write(content)
+        self.enterContext(
+            override_settings(
+                STATIC_ROOT=root,
+                STATICFILES_DIRS=[source],
+                STATICFILES_FINDERS=["django.contrib.staticfiles.finders.FileSystemFinder"],
+                STORAGES={
+                    **settings.STORAGES,
+                    "staticfiles": {"BACKEND": "project.storage.CompressedManifestStaticFilesStorage"},
+                },
+            )
+        )
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+        with open(os.path.join(root, "staticfiles.json")) as f:
+            hashed = json.load(f)["paths"]
+        variants = sorted(name for name in os.listdir(root) if name.endswith((".br", ".gz")))
+        self.assertEqual(variants, [hashed["app.css"] + ".br", hashed["app.css"] + ".gz"])
+        with open(os.path.join(root, hashed["app.css"] + ".gz"), "rb") as f:
+            self.assertEqual(gzip.decompress(f.read()), files["app.css"])
+        with open(os.path.join(root, hashed["app.css"] + ".br"), "rb") as f:
+            self.assertEqual(brotli.decompress(f.read()), files["app.css"])
 
-# Create your tests here.
@@ -0,0 +1,118 @@
+"""
+Transfer matching between a user's own accounts.
+
+A checking -> credit card payment is -X in one account and +X in another; both sides are
+linked with a TransferLink and left out of income/expense reports. Candidates are hash-joined
+on (currency, |amount|), then each bucket's outflows and inflows are swept in date order,
+pairing every outflow with the closest unmatched inflow on another account within
+TRANSFER_MATCH_WINDOW_DAYS. Cost is the sort plus a window-bounded sweep, never
+outflows x inflows.
+"""
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import QuerySet
+
+from .coverage import transactions_between
+from .models import ArchivedTransaction, Transaction, TransferLink
+
+
+# (pk, account_id, currency, date ordinal, amount)
+Candidate = Tuple[int, int, str, int, object]
+
+
+def window_days() -> int:
+    return getattr(settings, "TRANSFER_MATCH_WINDOW_DAYS", 3)
+
+
+def exclude_transfers(qs: QuerySet) -> QuerySet:
+    """
+    Transactions (or archived transactions) that are not either side of a matched transfer.
+    """
+    if qs.model is ArchivedTransaction:
+        return qs.filter(is_transfer=False)
+    return qs.filter(transfer_out__isnull=True, transfer_in__isnull=True)
+
+
+def pair_transfers(
+    candidates: Iterable[Candidate], window: int, only_ids: Optional[Set[int]] = None
+) -> List[Tuple[Candidate, Candidate]]:
+    """
+    Returns (outflow, inflow) pairs. With only_ids, buckets containing none of those rows are
+    skipped: their rows have already been through the sweep.
+    """
+    buckets: Dict[Tuple[str, object], Tuple[List[Candidate], List[Candidate]]] = {}
+    for c in candidates:
+        amount = c[4]
+        if not amount:
+            continue
+        outs, ins = buckets.setdefault((c[2], abs(amount)), ([], []))
+        (outs if amount < 0 else ins).append(c)
+
+    pairs = []
+    for outs, ins in buckets.values():
+        if not outs or not ins:
+            continue
+        if only_ids is not None and not any(c[0] in only_ids for c in outs + ins):
+            continue
+        outs.sort(key=lambda c: (c[3], c[0]))
+        ins.sort(key=lambda c: (c[3], c[0]))
+
+        used = [False] * len(ins)
+        lo = 0
+        for out in outs:
+            # Inflows older than the window (or already paired at the front) never match again
+            while lo < len(ins) and (used[lo] or ins[lo][3] < out[3] - window):
+                lo += 1
+            best = None
+            j = lo
+            while j < len(ins) and ins[j][3] <= out[3] + window:
+                if not used[j] and ins[j][1] != out[1]:
+                    if best is None or abs(ins[j][3] - out[3]) < abs(ins[best][3] - out[3]):
+                        best = j
+                j += 1
+            if best is not None:
+                used[best] = True
+                pairs.append((out, ins[best]))
+    return pairs
+
+
+def match_transfers(user_id: int, start, end, only_ids: Optional[Set[int]] = None) -> int:
+    """
+    Links unmatched transfers of one user with a side dated within [start, end] (the other
+    side may be up to the window outside it). Returns the number of new links.
+    """
+    window = window_days()
+    rows = (
+        exclude_transfers(
+            transactions_between(start - timedelta(days=window), end + timedelta(days=window), user_id=user_id)
+        )
+        .exclude(amount=0)
+        .values_list("pk", "account_id", "account__currency", "transaction_date", "amount")
+    )
+    candidates = [
+        (pk, account_id, currency, txn_date.toordinal(), amount)
+        for pk, account_id, currency, txn_date, amount in rows.iterator(chunk_size=5000)
+    ]
+
+    links = [
+        TransferLink(user_id=user_id, outflow_id=out[0], inflow_id=inc[0], amount=inc[4], day_gap=abs(inc[3] - out[3]))
+        for out, inc in pair_transfers(candidates, window, only_ids)
+    ]
+    with db_transaction.atomic():
+        TransferLink.objects.bulk_create(links, batch_size=500)
+    return len(links)
+
+
+def match_for_transactions(user_id: int, transactions: Iterable[Transaction]) -> int:
+    """
+    Incremental entry point after an import: only the new rows' date range and amounts.
+    """
+    transactions = list(transactions)
+    if not transactions:
+        return 0
+    dates = [t.transaction_date for t in transactions]
+    only_ids = {t.pk for t in transactions if t.pk is not None} or None
+    return match_transfers(user_id, min(dates), max(dates), only_ids)
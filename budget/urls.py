@@ -1,13 +1,16 @@
 from django.urls import path
 from django.views.generic import TemplateView
 
+from .api import analytics_api, monthly_summary_api, transactions_api
 from .views_accounts import AccountCreateView
+from .views_envelopes import EnvelopeCreateView, EnvelopeListView, EnvelopeUpdateView
 
 from .views import (
         StatementImportWizard,
         BankListView,
         BankCreateView,
         BankUpdateView,
+        StatementCoverageView,
 )
 
 
@@ -28,4 +31,16 @@ urlpatterns = [
     path("banks/", BankListView.as_view(), name="bank_list"),
     path("banks/new/", BankCreateView.as_view(), name="bank_create"),
     path("banks/<int:pk>/edit/", BankUpdateView.as_view(), name="bank_edit"),
+
+    path("statements/coverage/", StatementCoverageView.as_view(), name="statement_coverage"),
+
+    # Budgets (envelopes)
+    path("envelopes/", EnvelopeListView.as_view(), name="envelope_list"),
+    path("envelopes/new/", EnvelopeCreateView.as_view(), name="envelope_create"),
+    path("envelopes/<int:pk>/edit/", EnvelopeUpdateView.as_view(), name="envelope_edit"),
+
+    # JSON read API (ETag / conditional GET on the user's DataVersion)
+    path("api/transactions/", transactions_api, name="api_transactions"),
+    path("api/summary/monthly/", monthly_summary_api, name="api_monthly_summary"),
+    path("api/analytics/", analytics_api, name="api_analytics"),
 ]
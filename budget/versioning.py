@@ -0,0 +1,30 @@
+from datetime import datetime
+from typing import Optional, Tuple
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DataVersion
+
+
+def get_data_version(user_id: int) -> Tuple[int, Optional[datetime]]:
+    """
+    (version, updated_at) for the user; (0, None) before their first change.
+    """
+    row = DataVersion.objects.filter(user_id=user_id).values_list("version", "updated_at").first()
+    return row or (0, None)
+
+
+def bump_data_version(user_id: int) -> None:
+    updated = DataVersion.objects.filter(user_id=user_id).update(
+        version=F("version") + 1, updated_at=timezone.now()
+    )
+    if not updated:
+        DataVersion.objects.get_or_create(user_id=user_id)
+
+
+def bump_all_data_versions() -> None:
+    """
+    For changes that affect every user's reports (e.g. new FX rates). One UPDATE.
+    """
+    DataVersion.objects.update(version=F("version") + 1, updated_at=timezone.now())
@@ -1,7 +1,6 @@
 import hashlib
 
 from django.contrib import messages
-from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect, render
@@ -9,11 +8,12 @@ from django.utils import timezone
 from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.views.generic import CreateView, ListView, UpdateView
+from django.views.generic import CreateView, ListView, TemplateView, UpdateView
 
 from formtools.wizard.views import SessionWizardView
 
-from .importers import import_statement_csv
+from .coverage import coverage_by_account
+from .importers import import_statement
 
 from .forms import (
         ImportSelectAccountForm, 
@@ -37,8 +37,8 @@ FORMS = [
 ]
 
 TEMPLATES = {
-    "account": "budget/import/account_step.html",
-    "upload": "budget/import/upload_step.html",
+    "account": "budget/account_step.html",
+    "upload": "budget/upload_step.html",
 }
 
 
@@ -49,7 +49,7 @@ class StatementImportWizard(SessionWizardView):
     form_list = FORMS
 
     # REQUIRED for file uploads in a wizard
-    file_storage = FileSystemStorage(location=settings.MEDIA_ROOT)
+    file_storage = FileSystemStorage()  # MEDIA_ROOT, read when first used
 
     def get_template_names(self):
         return [TEMPLATES[self.steps.current]]
@@ -82,8 +82,7 @@ class StatementImportWizard(SessionWizardView):
         upload = form_data["upload"]["source_file"]
 
         file_hash = self._hash_uploaded_file(upload)
-        ext = upload.name.rsplit(".", 1)[-1].lower()
-        source_type = "pdf" if ext == "pdf" else "csv"
+        source_type = BankStatement.source_type_for(upload.name)
 
         stmt = BankStatement.objects.create(
             user=self.request.user,
@@ -93,11 +92,11 @@ class StatementImportWizard(SessionWizardView):
             file_hash=file_hash,
         )
 
-        if source_type == "pdf":
+        if source_type == BankStatement.SOURCE_PDF:
             messages.success(self.request, "PDF saved for reference.")
             return redirect("budget:dashboard")
 
-        created_count, errors = import_statement_csv(stmt)
+        created_count, errors = import_statement(stmt)
 
         if errors:
             for e in errors:
@@ -114,7 +113,7 @@ class StatementImportWizard(SessionWizardView):
 
 class BankListView(LoginRequiredMixin, ListView):
     model = Bank
-    template_name = "budget/banks/bank_list.html"
+    template_name = "budget/bank_list.html"
     context_object_name = "banks"
     paginate_by = 50
 
@@ -125,7 +124,7 @@ class BankListView(LoginRequiredMixin, ListView):
 class BankCreateView(LoginRequiredMixin, CreateView):
     model = Bank
     form_class = BankForm
-    template_name = "budget/banks/bank_form.html"
+    template_name = "budget/bank_form.html"
 
     def get_success_url(self):
         return reverse("budget:bank_list")
@@ -134,7 +133,21 @@ class BankCreateView(LoginRequiredMixin, CreateView):
 class BankUpdateView(LoginRequiredMixin, UpdateView):
     model = Bank
     form_class = BankForm
-    template_name = "budget/banks/bank_form.html"
+    template_name = "budget/bank_form.html"
 
     def get_success_url(self):
         return reverse("budget:bank_list")
+
+
+class StatementCoverageView(LoginRequiredMixin, TemplateView):
+    """
+    Date ranges covered by each account's statements and the gaps between them, read from
+    the statements' recorded ranges only (no Transaction scan).
+    """
+
+    template_name = "budget/statement_coverage.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["coverage"] = coverage_by_account(self.request.user.pk)
+        return context
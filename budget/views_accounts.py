@@ -9,7 +9,7 @@ from .models import Account
 class AccountCreateView(LoginRequiredMixin, CreateView):
     model = Account
     form_class = AccountForm
-    template_name = "budget/accounts/account_form.html"
+    template_name = "budget/account_form.html"
 
     def form_valid(self, form):
         form.instance.user = self.request.user
@@ -0,0 +1,74 @@
+from datetime import date, datetime
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.urls import reverse
+from django.views.generic import CreateView, TemplateView, UpdateView
+
+from .envelopes import envelope_page, month_start
+from .forms import EnvelopeForm
+from .fx import base_currency_for
+from .models import Envelope
+
+
+class EnvelopeListView(LoginRequiredMixin, TemplateView):
+    """
+    The budget page: each envelope's actual and remaining for ?month=YYYY-MM (default: this
+    month), read from the maintained EnvelopeMonth rows in a fixed number of queries.
+    """
+
+    template_name = "budget/envelope_list.html"
+
+    def get_month(self) -> date:
+        try:
+            return datetime.strptime(self.request.GET.get("month", ""), "%Y-%m").date()
+        except ValueError:
+            return month_start(date.today())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        month = self.get_month()
+        previous = date(month.year - (month.month == 1), (month.month - 2) % 12 + 1, 1)
+        following = date(month.year + (month.month == 12), month.month % 12 + 1, 1)
+        context.update(
+            month=month,
+            previous_month=previous,
+            next_month=following,
+            rows=envelope_page(self.request.user.pk, month),
+        )
+        return context
+
+
+class EnvelopeCreateView(LoginRequiredMixin, CreateView):
+    model = Envelope
+    form_class = EnvelopeForm
+    template_name = "budget/envelope_form.html"
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
+    def form_valid(self, form):
+        form.instance.user = self.request.user
+        form.instance.currency = base_currency_for(self.request.user)
+        return super().form_valid(form)
+
+    def get_success_url(self):
+        return reverse("budget:envelope_list")
+
+
+class EnvelopeUpdateView(LoginRequiredMixin, UpdateView):
+    model = Envelope
+    form_class = EnvelopeForm
+    template_name = "budget/envelope_form.html"
+
+    def get_queryset(self):
+        return Envelope.objects.filter(user=self.request.user)
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
+    def get_success_url(self):
+        return reverse("budget:envelope_list")
@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after setup: needs the app registry. Streams statement uploads outside Django's
+# body spooling; every other request goes straight to Django.
+from budget.asgi_upload import StreamingStatementUpload  # noqa: E402
+
+application = StreamingStatementUpload(django_application)
+
+# DJANGO_PRELOAD=1 warms the app before a forking server forks workers (see project.preload)
+from project.preload import preload_if_enabled  # noqa: E402
+
+preload_if_enabled()
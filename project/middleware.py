@@ -0,0 +1,314 @@
+import cProfile
+import heapq
+import json
+import mimetypes
+import os
+import random
+import re
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import http_date, parse_etags
+
+from .storage import ENCODINGS
+
+
+class EndpointStats:
+    """
+    In-process aggregate of per-endpoint timings (one registry per worker process).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        # Endpoints that went over the slow threshold; their next requests are always profiled
+        self.flagged = set()
+
+    def record(self, endpoint: str, wall_ms: float, queries: int, db_ms: float) -> None:
+        with self._lock:
+            row = self._stats.get(endpoint)
+            if row is None:
+                row = self._stats[endpoint] = {
+                    "endpoint": endpoint,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "queries": 0,
+                    "db_ms": 0.0,
+                }
+            row["count"] += 1
+            row["total_ms"] += wall_ms
+            row["max_ms"] = max(row["max_ms"], wall_ms)
+            row["queries"] += queries
+            row["db_ms"] += db_ms
+
+    def slowest(self, limit: int = 50) -> list:
+        with self._lock:
+            rows = [dict(r) for r in self._stats.values()]
+        for r in rows:
+            r["avg_ms"] = r["total_ms"] / r["count"]
+            r["avg_queries"] = r["queries"] / r["count"]
+            r["avg_db_ms"] = r["db_ms"] / r["count"]
+        rows.sort(key=lambda r: r["avg_ms"], reverse=True)
+        return rows[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self.flagged.clear()
+
+
+endpoint_stats = EndpointStats()
+
+
+class _QueryRecorder:
+    """
+    connection.execute_wrapper hook: counts queries and accumulates DB time.
+    SQL text is kept (by reference) so a slow request can dump its top statements.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.db_seconds = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.count += 1
+            self.db_seconds += elapsed
+            self.statements.append((elapsed, sql))
+
+
+def _endpoint_name(request) -> str:
+    # Keyed by URL pattern: one entry per route, however many paths (ids, 404 probes) hit it
+    match = getattr(request, "resolver_match", None)
+    route = match.route if match else "(unresolved)"
+    return f"{request.method} /{route.lstrip('/')}"
+
+
+class RequestProfilingMiddleware:
+    """
+    Records wall time, query count and DB time for every request.
+    A sample of requests (PROFILE_SAMPLE_RATE), plus any route previously seen over
+    PROFILE_SLOW_MS, runs its view under cProfile (started once the URL is resolved).
+    Slow requests are written to PROFILE_DIR as `<stamp>_<endpoint>.prof` (when profiled)
+    and a `.json` with timings and the top SQL; only the newest PROFILE_MAX_CAPTURES are kept.
+    Staff (or everyone, under DEBUG) also get a Server-Timing header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = float(getattr(settings, "PROFILE_SAMPLE_RATE", 0.0))
+        self.slow_ms = float(getattr(settings, "PROFILE_SLOW_MS", 500))
+        self.top_sql = int(getattr(settings, "PROFILE_TOP_SQL", 10))
+        self.output_dir = Path(getattr(settings, "PROFILE_DIR", settings.BASE_DIR / "profiles"))
+        self.max_captures = int(getattr(settings, "PROFILE_MAX_CAPTURES", 200))
+
+    def __call__(self, request):
+        recorder = _QueryRecorder()
+        profiler = None
+
+        t0 = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler = getattr(request, "_profiler", None)
+                if profiler:
+                    profiler.disable()
+        wall_ms = (time.perf_counter() - t0) * 1000
+        db_ms = recorder.db_seconds * 1000
+
+        endpoint = _endpoint_name(request)
+        endpoint_stats.record(endpoint, wall_ms, recorder.count, db_ms)
+        user = getattr(request, "user", None)
+        if settings.DEBUG or (user is not None and user.is_staff):
+            # Backend timings are for us, not for anonymous clients
+            response["Server-Timing"] = f"app;dur={wall_ms:.1f}, db;dur={db_ms:.1f};desc=\"{recorder.count} queries\""
+
+        if wall_ms >= self.slow_ms:
+            if getattr(request, "resolver_match", None):
+                endpoint_stats.flagged.add(endpoint)
+            self._capture(endpoint, request, wall_ms, db_ms, recorder, profiler)
+        elif profiler:
+            endpoint_stats.flagged.discard(endpoint)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not (
+            (self.sample_rate and random.random() < self.sample_rate)
+            or _endpoint_name(request) in endpoint_stats.flagged
+        ):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler per process: another request's, a
+            # debugger's or coverage's. Skip profiling this one rather than failing it.
+            return None
+        request._profiler = profiler
+        return None
+
+    def _capture(self, endpoint, request, wall_ms, db_ms, recorder, profiler) -> None:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", endpoint).strip("_")[:80]
+        stem = f"{timezone.now():%Y%m%dT%H%M%S%f}_{slug}"
+
+        prof_name = ""
+        if profiler:
+            prof_name = f"{stem}.prof"
+            profiler.dump_stats(str(self.output_dir / prof_name))
+
+        top = heapq.nlargest(self.top_sql, recorder.statements, key=lambda s: s[0])
+        record = {
+            "endpoint": endpoint,
+            "path": request.path,
+            "captured_at": timezone.now().isoformat(),
+            "wall_ms": round(wall_ms, 2),
+            "db_ms": round(db_ms, 2),
+            "queries": recorder.count,
+            "profile": prof_name,
+            "top_sql": [{"ms": round(s * 1000, 2), "sql": sql} for s, sql in top],
+        }
+        (self.output_dir / f"{stem}.json").write_text(json.dumps(record, indent=2))
+        self._prune()
+
+    def _prune(self) -> None:
+        # Stems start with a timestamp, so name order is capture order
+        captures = sorted(self.output_dir.glob("*.json"))
+        for path in captures[:max(len(captures) - self.max_captures, 0)]:
+            for stale in (path, path.with_suffix(".prof")):
+                try:
+                    stale.unlink()
+                except FileNotFoundError:
+                    pass  # another worker pruned it first
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/"x" matches "x", and it may list several
+    etags = parse_etags(header)
+    return "*" in etags or any(candidate.removeprefix("W/") == etag for candidate in etags)
+
+
+class PrecompressedStaticMiddleware:
+    """
+    Serves STATIC_URL straight from STATIC_ROOT, picking the `.br`/`.gz` variant written by
+    collectstatic (project.storage) based on Accept-Encoding. Hashed (manifest) filenames get
+    a one-year immutable Cache-Control. Enabled with SERVE_STATIC_ROOT.
+    The file index is built once per process, so a request costs a dict lookup and an open().
+    """
+
+    IMMUTABLE = "public, max-age=31536000, immutable"
+    SHORT = "public, max-age=60"
+
+    def __init__(self, get_response):
+        if not getattr(settings, "SERVE_STATIC_ROOT", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = "/" + settings.STATIC_URL.lstrip("/")
+        self.root = Path(settings.STATIC_ROOT)
+        self._index = None
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        if request.method in ("GET", "HEAD") and request.path.startswith(self.prefix):
+            entry = self.index().get(request.path[len(self.prefix):])
+            if entry is not None:
+                return self.serve(request, entry)
+        return self.get_response(request)
+
+    def index(self) -> dict:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._build_index()
+        return self._index
+
+    def _build_index(self) -> dict:
+        hashed = set()
+        manifest = self.root / "staticfiles.json"
+        if manifest.exists():
+            hashed = set(json.loads(manifest.read_text()).get("paths", {}).values())
+
+        index = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            names = set(filenames)
+            for filename in filenames:
+                if filename.endswith(tuple(ENCODINGS)):
+                    continue
+                path = os.path.join(dirpath, filename)
+                rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+                stat = os.stat(path)
+                content_type, _ = mimetypes.guess_type(filename)
+                tag = f"{int(stat.st_mtime):x}-{stat.st_size:x}"
+                index[rel] = {
+                    "path": path,
+                    "content_type": content_type or "application/octet-stream",
+                    # Each encoding is a different representation, so it gets its own ETag
+                    "variants": [
+                        (encoding, path + suffix, f'"{tag}-{suffix[1:]}"')
+                        for suffix, encoding in ENCODINGS.items()
+                        if filename + suffix in names
+                    ],
+                    "etag": f'"{tag}"',
+                    "last_modified": http_date(stat.st_mtime),
+                    "cache_control": self.IMMUTABLE if rel in hashed else self.SHORT,
+                }
+        return index
+
+    def serve(self, request, entry):
+        path, encoding, etag = entry["path"], None, entry["etag"]
+        if entry["variants"]:
+            accepted = _accepted_encodings(request.headers.get("Accept-Encoding", ""))
+            for candidate, variant_path, variant_etag in entry["variants"]:
+                if candidate in accepted:
+                    path, encoding, etag = variant_path, candidate, variant_etag
+                    break
+
+        headers = {
+            "ETag": etag,
+            "Last-Modified": entry["last_modified"],
+            "Cache-Control": entry["cache_control"],
+            "Vary": "Accept-Encoding",
+        }
+        if _etag_matches(request.headers.get("If-None-Match", ""), etag):
+            response = HttpResponseNotModified()
+            for key, value in headers.items():
+                response[key] = value
+            return response
+
+        response = FileResponse(open(path, "rb"), content_type=entry["content_type"])
+        del response["Content-Disposition"]
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        for key, value in headers.items():
+            response[key] = value
+        return response
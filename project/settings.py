@@ -52,6 +52,12 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 # Middleware
 # --------------------------------------------------------------------
 MIDDLEWARE = [
+    # ✅ custom: precompressed STATIC_ROOT serving, ahead of everything else (see "Static & Media")
+    "project.middleware.PrecompressedStaticMiddleware",
+
+    # ✅ custom, times the rest of the stack (see "Request profiling" below)
+    "project.middleware.RequestProfilingMiddleware",
+
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -124,7 +130,83 @@ STATIC_URL = "static/"
 STATICFILES_DIRS = [BASE_DIR / "static"]  # put your dev assets here
 STATIC_ROOT = BASE_DIR / "staticfiles"    # collectstatic output (prod-like)
 
+# Production-like runs (DJANGO_DEBUG=0): collectstatic writes hashed names plus .br/.gz variants,
+# and PrecompressedStaticMiddleware serves them from STATIC_ROOT with far-future cache headers.
+SERVE_STATIC_ROOT = os.getenv("SERVE_STATIC_ROOT", "0" if DEBUG else "1") == "1"
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": (
+            "django.contrib.staticfiles.storage.StaticFilesStorage"
+            if DEBUG
+            else "project.storage.CompressedManifestStaticFilesStorage"
+        ),
+    },
+}
+
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / "media"           # uploaded CSVs go here if you store them
 
+# Compress statement CSVs at rest: "br", "gzip" or "" (off). The importer reads either way;
+# `manage.py compress_statement_files` converts files already stored.
+STATEMENT_STORAGE_COMPRESSION = os.getenv("STATEMENT_STORAGE_COMPRESSION", "")
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# --------------------------------------------------------------------
+# Currency conversion (budget.fx): rates come from a local CSV, see `manage.py load_fx_rates`
+# --------------------------------------------------------------------
+FX_PIVOT_CURRENCY = "USD"        # FxRate.rate = value of one unit in this currency
+DEFAULT_BASE_CURRENCY = "USD"    # reporting currency for users without UserPreferences
+
+# Transfers between a user's own accounts (budget.transfers): -X and +X this many days apart
+TRANSFER_MATCH_WINDOW_DAYS = int(os.getenv("TRANSFER_MATCH_WINDOW_DAYS", "3"))
+
+# Per-user NumPy column files behind /budget/api/analytics/ (budget.snapshot); rebuilt on demand
+ANALYTICS_SNAPSHOT_DIR = Path(os.getenv("ANALYTICS_SNAPSHOT_DIR", BASE_DIR / "snapshots"))
+
+# Month-end PDFs from `manage.py render_monthly_reports` (budget.monthly_reports)
+MONTHLY_REPORTS_DIR = Path(os.getenv("MONTHLY_REPORTS_DIR", MEDIA_ROOT / "monthly_reports"))
+
+# `manage.py archive_transactions` moves whole years older than this many months out of the
+# hot Transaction table (budget.archive)
+ARCHIVE_KEEP_MONTHS = int(os.getenv("ARCHIVE_KEEP_MONTHS", "13"))
+
+# --------------------------------------------------------------------
+# Streaming uploads (ASGI only: budget.asgi_upload, mounted in project/asgi.py)
+# --------------------------------------------------------------------
+STATEMENT_UPLOAD_MAX_BYTES = int(os.getenv("STATEMENT_UPLOAD_MAX_BYTES", 50 * 1024 * 1024))
+STATEMENT_IMPORT_WORKERS = int(os.getenv("STATEMENT_IMPORT_WORKERS", "4"))
+
+# --------------------------------------------------------------------
+# Startup: heavy imports (NumPy, WeasyPrint, ...) are deferred to first use. Under a forking
+# server set DJANGO_PRELOAD=1 (and e.g. gunicorn --preload) to warm them once in the master.
+# --------------------------------------------------------------------
+PRELOAD_APP = os.getenv("DJANGO_PRELOAD", "") == "1"
+PRELOAD_MODULES = ["budget.analytics", "budget.snapshot", "budget.reparse"]
+PRELOAD_TEMPLATES = [
+    "home.html",
+    "budget/dashboard.html",
+    "budget/reports.html",
+    "budget/pdfs.html",
+    "budget/upload_step.html",
+    "budget/account_step.html",
+    "budget/bank_list.html",
+    "budget/bank_form.html",
+    "budget/account_form.html",
+    "accounts/login.html",
+    "accounts/register.html",
+]
+
+# --------------------------------------------------------------------
+# Request profiling (project.middleware.RequestProfilingMiddleware)
+# --------------------------------------------------------------------
+# Every request records wall time / query count / DB time.
+# A fraction of requests (and endpoints previously over PROFILE_SLOW_MS) run under cProfile.
+# Slow requests dump .prof + top-N SQL into PROFILE_DIR (newest PROFILE_MAX_CAPTURES kept);
+# see /admin/profiling/. Staff responses (all of them under DEBUG) carry a Server-Timing header.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+PROFILE_TOP_SQL = int(os.getenv("PROFILE_TOP_SQL", "10"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", BASE_DIR / "profiles"))
+PROFILE_MAX_CAPTURES = int(os.getenv("PROFILE_MAX_CAPTURES", "200"))
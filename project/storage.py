@@ -0,0 +1,64 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+
+COMPRESSIBLE_EXTENSIONS = (
+    ".css", ".js", ".mjs", ".map", ".svg", ".html", ".txt", ".json", ".xml", ".ico", ".eot", ".ttf", ".otf",
+)
+MIN_COMPRESS_SIZE = 256
+
+# suffix -> Content-Encoding; order is server preference
+ENCODINGS = {".br": "br", ".gz": "gzip"}
+
+
+# The encoders are imported on first use: only collectstatic needs them, while every
+# process imports this module (PrecompressedStaticMiddleware reads ENCODINGS).
+
+def _gzip(data: bytes) -> bytes:
+    try:
+        import zopfli.gzip as zopfli_gzip  # smaller gzip output; only paid once at collectstatic
+    except ImportError:  # pragma: no cover
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return zopfli_gzip.compress(data)
+
+
+def _brotli(data: bytes) -> bytes:
+    import brotli
+
+    return brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest (hashed filename) storage that also writes `.br` and `.gz` siblings of every
+    hashed, compressible file during collectstatic, so nothing is compressed per request.
+    """
+
+    compressors = {".br": _brotli, ".gz": _gzip}
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            if name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                self._write_compressed(name)
+
+    def _write_compressed(self, name: str) -> None:
+        # Hashed names are content-addressed: an existing variant is already up to date
+        pending = [suffix for suffix in self.compressors if not self.exists(name + suffix)]
+        if not pending:
+            return
+
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+
+        for suffix in pending:
+            compressed = self.compressors[suffix](data)
+            # Not worth a variant (and an extra Content-Encoding) if it barely shrinks
+            if len(compressed) < len(data) * 0.95:
+                self.save(name + suffix, ContentFile(compressed))
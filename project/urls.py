@@ -4,6 +4,8 @@ from django.views.generic import TemplateView
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .views import profiling_report
+
 
 
 
@@ -12,6 +14,7 @@ urlpatterns = [
     # ---------------------------
     # Admin
     # ---------------------------
+    path("admin/profiling/", admin.site.admin_view(profiling_report), name="admin_profiling"),
     path("admin/", admin.site.urls),
 
     # ---------------------------
@@ -0,0 +1,33 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib import admin
+from django.shortcuts import render
+
+from .middleware import endpoint_stats
+
+
+def profiling_report(request):
+    """
+    Staff-only (wrapped in admin_view): slowest endpoints seen by this worker,
+    plus the most recent slow-request captures on disk.
+    """
+    profile_dir = Path(getattr(settings, "PROFILE_DIR", settings.BASE_DIR / "profiles"))
+    captures = []
+    if profile_dir.is_dir():
+        for path in sorted(profile_dir.glob("*.json"), reverse=True)[:50]:
+            try:
+                captures.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+
+    context = {
+        **admin.site.each_context(request),
+        "title": "Slow endpoints",
+        "endpoints": endpoint_stats.slowest(),
+        "captures": captures,
+        "profile_dir": profile_dir,
+        "slow_ms": getattr(settings, "PROFILE_SLOW_MS", 500),
+    }
+    return render(request, "admin/profiling.html", context)
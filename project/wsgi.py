@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
 application = get_wsgi_application()
+
+# Imported after setup: DJANGO_PRELOAD=1 warms the app before a forking server forks workers.
+from project.preload import preload_if_enabled  # noqa: E402
+
+preload_if_enabled()